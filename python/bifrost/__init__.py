@@ -46,10 +46,39 @@ __email__      = "benbarsdell@gmail.com"
 __status__     = "Development"
 
 # TODO: Decide how to organise the namespace
-import core, memory, affinity, ring, block, address, udp_socket
-import pipeline
+import core, memory, affinity, ring, address, udp_socket
 import device
 from ndarray import ndarray, asarray, empty_like, zeros_like
+
+# Submodules that are slow to import (or pull in optional dependencies),
+#   which are instead imported on first access (e.g., bifrost.pipeline)
+_lazy_submodules = set(['block', 'pipeline', 'ring2', 'units', 'sigproc',
+                        'sigproc2', 'header_standard', 'udp_capture',
+                        'copy_block', 'transpose_block', 'scrunch_block',
+                        'sigproc_block', 'fdmt_block', 'fdmt', 'fft',
+                        'transpose', 'unpack', 'quantize', 'addon',
+                        'block_stats', 'latency_trace', 'placement',
+                        'gulp_tuner', 'unpack_block', 'quantize_block',
+                        'benchmarks'])
+
+import sys as _sys
+import types as _types
+import importlib as _importlib
+
+class _LazyModule(_types.ModuleType):
+	def __getattr__(self, name):
+		if name not in _lazy_submodules:
+			raise AttributeError("'module' object has no attribute '%s'" % name)
+		submodule = _importlib.import_module('.' + name, self.__name__)
+		setattr(self, name, submodule)
+		return submodule
+
+_module = _LazyModule(__name__, __doc__)
+_module.__dict__.update(globals())
+# Note: The original module must be kept alive, otherwise Python 2 clears its
+#         globals (which the methods above use) when it is deleted.
+_module._original_module = _sys.modules[__name__]
+_sys.modules[__name__] = _module
 #import copy_block, transpose_block, scrunch_block, sigproc_block, fdmt_block
 #from transpose import transpose
 #from unpack import unpack
@@ -32,6 +32,11 @@ def get_core():
 	return _get(_bf.AffinityGetCore())
 def set_core(core):
 	_check(_bf.AffinitySetCore(core))
+def get_numa_node(core):
+	"""Returns the NUMA node of the given core, or None if the system does
+	not have multiple NUMA nodes"""
+	node = _get(_bf.AffinityGetNumaNode(core))
+	return node if node >= 0 else None
 def set_openmp_cores(cores):
 	# PYCLIBRARY ISSUE
 	# TODO: Would be really nice to be able to directly pass
@@ -0,0 +1,110 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Command-line interface to bifrost.benchmarks"""
+
+from bifrost.benchmarks.suite import (BENCHMARKS, DEFAULT_PARAMS,
+                                      match_benchmarks, run_benchmarks,
+                                      compare_results)
+import bifrost as bf
+import argparse
+import json
+import socket
+import sys
+import time
+
+def format_results(results):
+	lines = ["%-20s %10s %12s %12s %12s" % ('Benchmark', 'GB/s', 'Spans/s',
+	                                        'p50 lat (ms)', 'p99 lat (ms)')]
+	for name, result in results.items():
+		latency = result['latency']
+		lines.append("%-20s %10.3f %12.1f %12.3f %12.3f" % (
+			name, result['gbps'], result['spans_per_sec'],
+			latency.get('p50', float('nan'))*1e3,
+			latency.get('p99', float('nan'))*1e3))
+	return '\n'.join(lines)
+
+def main(argv):
+	parser = argparse.ArgumentParser(
+		description="Runs synthetic pipeline benchmarks and reports their "
+		            "throughput and latency")
+	parser.add_argument('benchmarks', nargs='*',
+	                    help="Benchmarks to run, as shell-style patterns "
+	                         "(default all)")
+	parser.add_argument('-l', '--list', action='store_true',
+	                    help="List the benchmarks and exit")
+	parser.add_argument('-o', '--output',
+	                    help="Write the results to this JSON file")
+	parser.add_argument('-b', '--baseline',
+	                    help="Compare with the results in this JSON file, "
+	                         "exiting with status 1 if any have regressed")
+	parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+	                    help="Fractional change from the baseline allowed "
+	                         "before a result counts as a regression "
+	                         "(default %(default)s)")
+	parser.add_argument('-r', '--repeat', type=int, default=1,
+	                    help="Runs of each benchmark, of which the best is "
+	                         "reported (default %(default)s)")
+	parser.add_argument('--label', help="Label to store with the results "
+	                                    "(e.g., a commit hash)")
+	for key, default in DEFAULT_PARAMS.items():
+		parser.add_argument('--' + key.replace('_', '-'), dest=key,
+		                    type=float if key.endswith('rate') else int,
+		                    default=default,
+		                    help="(default %(default)s)")
+	args = parser.parse_args(argv)
+	if args.list:
+		for name in BENCHMARKS:
+			print name
+		return 0
+	params = dict((key, getattr(args, key)) for key in DEFAULT_PARAMS)
+	names = match_benchmarks(args.benchmarks)
+	results = run_benchmarks(names, args.repeat, **params)
+	print format_results(results)
+	if args.output is not None:
+		report = {'label':      args.label,
+		          'version':    getattr(bf, '__version__', None),
+		          'host':       socket.gethostname(),
+		          'time':       time.time(),
+		          'benchmarks': results}
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=4, sort_keys=True)
+	if args.baseline is not None:
+		with open(args.baseline, 'r') as f:
+			baseline = json.load(f)['benchmarks']
+		regressions = compare_results(results, baseline, args.tolerance)
+		for name, metric, value, base_value in regressions:
+			print "REGRESSION: %s %s = %g (baseline %g)" % (
+				name, metric, value, base_value)
+		if len(regressions):
+			return 1
+		print "No regressions relative to %s" % args.baseline
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,157 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Synthetic source and sink blocks for benchmarking pipelines"""
+
+from bifrost.pipeline import SourceBlock, MultiTransformBlock
+from bifrost.DataType import DataType
+import numpy as np
+import time
+
+class RateLimiter(object):
+	"""Sleeps as needed to keep to rate frames per second (or not at all if
+	rate is None)"""
+	def __init__(self, rate=None):
+		self.rate   = rate
+		self.nframe = 0
+		self.start_time = None
+	def wait(self, nframe):
+		"""Waits until it is time for the next nframe frames"""
+		if self.rate is None:
+			return
+		if self.start_time is None:
+			self.start_time = time.time()
+		delay = self.start_time + self.nframe / float(self.rate) - time.time()
+		if delay > 0:
+			time.sleep(delay)
+		self.nframe += nframe
+
+def _frame_bytes(span):
+	"""Returns a uint8 view of a system-accessible span's data, with one row
+	per frame"""
+	data = span.data.view(np.ndarray)
+	return data.view(np.uint8).reshape((span.nframe, span.frame_nbyte))
+
+def random_frames(nframe, frame_shape, dtype):
+	"""Returns random frames of the given bifrost dtype as raw bytes, with
+	one row per frame. Floating-point data are normally distributed, while
+	integer data are uniformly random bytes (so that sub-byte dtypes such
+	as ci4 are supported too)."""
+	dtype = DataType(dtype)
+	kind  = str(dtype).rstrip('0123456789')
+	nelement = nframe * int(np.prod(frame_shape))
+	if kind in ['f', 'cf']:
+		values = np.random.normal(size=nelement)
+		if dtype.is_complex:
+			values = values + 1j*np.random.normal(size=nelement)
+		data = values.astype(dtype.as_numpy_dtype()).view(np.uint8)
+	else:
+		nbyte = nelement * dtype.itemsize_bits // 8
+		data = np.random.randint(0, 256, size=nbyte).astype(np.uint8)
+	return data.reshape((nframe, -1))
+
+class _SyntheticReader(object):
+	def __init__(self, nframe, template, rate):
+		self.nframe_left = nframe
+		self.template    = template
+		self.limiter     = RateLimiter(rate)
+	def __enter__(self):
+		return self
+	def __exit__(self, type, value, tb):
+		pass
+	def readinto(self, span):
+		"""Fills span with frames and returns the no. frames written"""
+		nframe = min(span.nframe, self.nframe_left)
+		self.limiter.wait(nframe)
+		# Note: The same template is reused for every gulp to keep the cost
+		#         of generating data out of the measurements.
+		odata = _frame_bytes(span)
+		ntemplate = self.template.shape[0]
+		for offset in xrange(0, nframe, ntemplate):
+			n = min(ntemplate, nframe - offset)
+			odata[offset:offset+n] = self.template[:n]
+		self.nframe_left -= nframe
+		return nframe
+
+class SyntheticSourceBlock(SourceBlock):
+	"""Generates nsequence sequences of nframe frames of random data, at up
+	to rate frames per second (or as fast as possible if rate is None)"""
+	def __init__(self, nframe, frame_shape, dtype, gulp_nframe,
+	             nsequence=1, rate=None, space='system', *args, **kwargs):
+		sourcenames = ['synthetic_%i' % i for i in xrange(nsequence)]
+		super(SyntheticSourceBlock, self).__init__(sourcenames, gulp_nframe,
+		                                           *args, **kwargs)
+		self.orings = [self.create_ring(space=space)]
+		self.nframe      = nframe
+		self.frame_shape = list(frame_shape)
+		self.dtype       = dtype
+		self.rate        = rate
+		self._template   = random_frames(gulp_nframe, frame_shape, dtype)
+	def create_reader(self, sourcename):
+		return _SyntheticReader(self.nframe, self._template, self.rate)
+	def on_sequence(self, reader, sourcename):
+		ndim = len(self.frame_shape)
+		frame_period = 1. / self.rate if self.rate is not None else 1.
+		ohdr = {
+			'_tensor': {
+				'dtype':  self.dtype,
+				'shape':  [-1] + self.frame_shape,
+				'labels': ['time'] + ['axis%i' % (i + 1) for i in xrange(ndim)],
+				'scales': [[0., frame_period]] + [None]*ndim,
+				'units':  ['s'] + [None]*ndim
+			},
+			'name': sourcename
+		}
+		return [ohdr]
+	def on_data(self, reader, ospans):
+		return [reader.readinto(ospans[0])]
+
+class SyntheticSinkBlock(MultiTransformBlock):
+	"""Consumes one or more rings, at up to rate frames per second (or as
+	fast as possible if rate is None)"""
+	def __init__(self, irings, rate=None, *args, **kwargs):
+		super(SyntheticSinkBlock, self).__init__(irings, *args, **kwargs)
+		self.orings = []
+		self.rate   = rate
+	def define_output_nframes(self, input_nframes):
+		return []
+	def on_sequence(self, iseqs):
+		self._limiter = RateLimiter(self.rate)
+		return [], None
+	def on_data(self, ispans, ospans):
+		self._limiter.wait(ispans[0].nframe)
+		return []
+
+def synthetic_source(nframe, frame_shape, dtype, gulp_nframe, *args, **kwargs):
+	return SyntheticSourceBlock(nframe, frame_shape, dtype, gulp_nframe,
+	                            *args, **kwargs)
+
+def synthetic_sink(irings, *args, **kwargs):
+	if not isinstance(irings, (list, tuple)):
+		irings = [irings]
+	return SyntheticSinkBlock(irings, *args, **kwargs)
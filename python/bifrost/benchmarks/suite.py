@@ -0,0 +1,262 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Standard benchmark pipelines, and running and comparing them
+
+Each benchmark builds a pipeline from synthetic sources and sinks (see
+bifrost.benchmarks.blocks) and runs it with latency tracing enabled. Its
+result records:
+  gbps:          Bytes through the measured blocks per second of wall time
+                   (in units of 1e9), where the measured blocks are the
+                   sinks for topology benchmarks, or the block under test
+                   for block benchmarks
+  spans_per_sec: Gulps processed by the measured blocks per second
+  process_gbps:  Bytes per second of processing time in the measured
+                   blocks, i.e., excluding time spent waiting on rings
+  latency:       End-to-end latency statistics (count, mean, p50, p99 and
+                   max, in seconds; see bifrost.latency_trace)
+  blocks:        The performance statistics of every block
+"""
+
+from bifrost.pipeline import Pipeline, block_scope
+from bifrost.copy_block      import copy
+from bifrost.transpose_block import transpose
+from bifrost.scrunch_block   import ScrunchBlock
+from bifrost.unpack_block    import unpack
+from bifrost.quantize_block  import quantize
+from bifrost.sigproc_block   import read_sigproc
+from bifrost.sigproc2        import _write_header
+from blocks import synthetic_source, synthetic_sink, random_frames
+
+from collections import OrderedDict
+import fnmatch
+import os
+import shutil
+import tempfile
+import time
+
+DEFAULT_PARAMS = OrderedDict([
+	('nframe',      16384), # Frames per source
+	('gulp_nframe', 256),
+	('nchan',       1024),
+	('npol',        2),
+	('depth',       4),     # No. blocks in chains
+	('width',       4),     # No. branches in fan-out/fan-in
+	('source_rate', None),  # Frames per second (None => unlimited)
+	('sink_rate',   None)])
+
+# Metrics for which a decrease is a regression, and latency statistics for
+#   which an increase is a regression
+THROUGHPUT_METRICS = ['gbps', 'spans_per_sec']
+LATENCY_METRICS    = ['p50', 'p99']
+
+_BLOCK_FIELDS = ['nsequence', 'ngulp', 'nframe_in', 'nframe_out',
+                 'nbyte_in', 'nbyte_out',
+                 'acquire_time', 'reserve_time', 'process_time']
+
+def _source(p, dtype='f32', frame_shape=None, name='source'):
+	if frame_shape is None:
+		frame_shape = [p['nchan'], p['npol']]
+	return synthetic_source(p['nframe'], frame_shape, dtype, p['gulp_nframe'],
+	                        rate=p['source_rate'], name=name)
+
+def _sink(irings, p, name='sink'):
+	return synthetic_sink(irings, rate=p['sink_rate'], name=name)
+
+def linear_chain(p):
+	data = _source(p)
+	for i in xrange(p['depth']):
+		data = copy(data, name='copy_%i' % i)
+	return [_sink(data, p)]
+
+def fused_chain(p):
+	data = _source(p)
+	with block_scope(fuse=True):
+		for i in xrange(p['depth']):
+			data = copy(data, name='copy_%i' % i)
+	return [_sink(data, p)]
+
+def fan_out(p):
+	src = _source(p)
+	return [_sink(copy(src, name='copy_%i' % i), p, name='sink_%i' % i)
+	        for i in xrange(p['width'])]
+
+def fan_in(p):
+	branches = [copy(_source(p, name='source_%i' % i), name='copy_%i' % i)
+	            for i in xrange(p['width'])]
+	return [_sink(branches, p)]
+
+def block_copy(p):
+	block = copy(_source(p), name='copy')
+	_sink(block, p)
+	return [block]
+
+def block_transpose(p):
+	block = transpose(_source(p), [0, 2, 1], name='transpose')
+	_sink(block, p)
+	return [block]
+
+def block_scrunch(p):
+	block = ScrunchBlock(_source(p), 4, name='scrunch')
+	_sink(block, p)
+	return [block]
+
+def block_unpack(p):
+	block = unpack(_source(p, 'ci4'), 'ci8', name='unpack')
+	_sink(block, p)
+	return [block]
+
+def block_quantize(p):
+	block = quantize(_source(p, 'cf32'), 'ci8', 8., name='quantize')
+	_sink(block, p)
+	return [block]
+
+def block_sigproc_read(p):
+	filename = os.path.join(p['tmpdir'], 'benchmark.fil')
+	nchan = p['nchan'] * p['npol']
+	with open(filename, 'wb') as f:
+		_write_header({'telescope_id': 0, 'machine_id': 0, 'data_type': 1,
+		               'source_name': 'benchmark', 'tstart': 57000.,
+		               'tsamp': 1e-3, 'nbits': 8, 'nifs': 1,
+		               'nchans': nchan, 'fch1': 1400., 'foff': -0.1}, f)
+		template = random_frames(p['gulp_nframe'], [1, nchan], 'u8')
+		for offset in xrange(0, p['nframe'], p['gulp_nframe']):
+			nframe = min(p['gulp_nframe'], p['nframe'] - offset)
+			template[:nframe].tofile(f)
+	block = read_sigproc([filename], p['gulp_nframe'], name='sigproc_read')
+	_sink(block, p)
+	return [block]
+
+# Functions that build each benchmark's pipeline from a dict of parameters
+#   and return the blocks to measure
+BENCHMARKS = OrderedDict([
+	('linear_chain',       linear_chain),
+	('fused_chain',        fused_chain),
+	('fan_out',            fan_out),
+	('fan_in',             fan_in),
+	('block.copy',         block_copy),
+	('block.transpose',    block_transpose),
+	('block.scrunch',      block_scrunch),
+	('block.unpack',       block_unpack),
+	('block.quantize',     block_quantize),
+	('block.sigproc_read', block_sigproc_read)])
+
+def match_benchmarks(patterns=None):
+	"""Returns the names of the benchmarks matching any of the given
+	shell-style patterns (or all of them if patterns is empty)"""
+	if not patterns:
+		return list(BENCHMARKS.keys())
+	names = [name for name in BENCHMARKS
+	         if any([fnmatch.fnmatch(name, pattern) for pattern in patterns])]
+	if not len(names):
+		raise KeyError("No benchmarks match %s" % ', '.join(patterns))
+	return names
+
+def run_benchmark(name, **params):
+	"""Runs a benchmark once and returns its result (see above); params
+	override DEFAULT_PARAMS
+
+	Raises RuntimeError if any data were overwritten before they could be
+	read, as the result would then not be a fair measure of throughput.
+	"""
+	p = DEFAULT_PARAMS.copy()
+	for key, value in params.items():
+		if key not in p:
+			raise KeyError("Unknown benchmark parameter: %s" % key)
+		p[key] = value
+	tmpdir = tempfile.mkdtemp()
+	try:
+		with Pipeline() as pipeline:
+			targets = BENCHMARKS[name](dict(p, tmpdir=tmpdir))
+			start_time = time.time()
+			pipeline.run(plan_buffers=True, publish_stats=False, trace=True)
+			wall_time = time.time() - start_time
+	finally:
+		shutil.rmtree(tmpdir)
+	rings = set([iring for block in pipeline.blocks for iring in block.irings])
+	nbyte_lost = sum([ring.stats['nbyte_overwritten'] for ring in rings])
+	if nbyte_lost:
+		raise RuntimeError("Benchmark %s lost %i bytes of data" %
+		                   (name, nbyte_lost))
+	stats = pipeline.stats()
+	nbyte = nspan = 0
+	process_time = 0.
+	for block in targets:
+		block_stats = stats[block.name]
+		nbyte += (block_stats['nbyte_in'] if len(block.irings) else
+		          block_stats['nbyte_out'])
+		nspan        += block_stats['ngulp']
+		process_time += block_stats['process_time']
+	latency = pipeline.latency_trace.summary()['end_to_end']
+	latency.pop('histogram', None)
+	return {'params':        p,
+	        'wall_time':     wall_time,
+	        'nbyte':         nbyte,
+	        'nspan':         nspan,
+	        'gbps':          nbyte / wall_time / 1e9,
+	        'spans_per_sec': nspan / wall_time,
+	        'process_gbps':  (nbyte / process_time / 1e9
+	                          if process_time > 0 else None),
+	        'latency':       latency,
+	        'blocks':        dict((block_name,
+	                               dict((field, block_stats[field])
+	                                    for field in _BLOCK_FIELDS))
+	                              for block_name, block_stats in stats.items())}
+
+def run_benchmarks(names=None, repeat=1, **params):
+	"""Runs each of the named benchmarks (default all) repeat times and
+	returns a dict of the best result (highest gbps) of each"""
+	results = OrderedDict()
+	for name in (names or BENCHMARKS.keys()):
+		runs = [run_benchmark(name, **params) for _ in xrange(repeat)]
+		results[name] = max(runs, key=lambda result: result['gbps'])
+	return results
+
+def compare_results(results, baseline, tolerance=0.1):
+	"""Compares two dicts of benchmark results (as returned by
+	run_benchmarks) and returns a list of (benchmark, metric, value,
+	baseline_value) for each throughput metric that is more than tolerance
+	(a fraction) below the baseline, and each latency statistic that is
+	more than tolerance above it. Benchmarks missing from either are
+	ignored."""
+	regressions = []
+	for name, result in results.items():
+		if name not in baseline:
+			continue
+		base = baseline[name]
+		for metric in THROUGHPUT_METRICS:
+			if result[metric] < base[metric] * (1 - tolerance):
+				regressions.append((name, metric, result[metric], base[metric]))
+		for stat in LATENCY_METRICS:
+			value      = result['latency'].get(stat)
+			base_value = base['latency'].get(stat)
+			if value is None or base_value is None:
+				continue
+			if value > base_value * (1 + tolerance):
+				regressions.append((name, 'latency.' + stat, value, base_value))
+	return regressions
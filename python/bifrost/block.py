@@ -34,10 +34,6 @@ import json
 import threading
 import time
 from contextlib import nested
-import matplotlib
-## Use a graphical backend which supports threading
-matplotlib.use('Agg')
-from matplotlib import pyplot as plt
 import numpy as np
 import bifrost
 from bifrost import affinity
@@ -756,9 +752,7 @@ class FoldBlock(TransformBlock):
             np.power(frequency/1000, -2)
         return 4.15e-3*self.dispersion_measure*frequency_factor
     def load_settings(self, input_header):
-        self.data_settings = json.loads(
-            "".join(
-                [chr(item) for item in input_header]))
+        self.data_settings = json.loads(input_header.tostring())
         self.output_header = json.dumps({'nbit':32, 'dtype': str(np.float32)})
     def main(self, input_rings, output_rings):
         """Generate a histogram from the input ring data
@@ -835,10 +829,15 @@ class WaterfallBlock(object):
         @param[in] waterfall_matrix x axis is frequency and 
             y axis is time. Values should be power.
             """
+        # Note: matplotlib is imported here because it is slow to import
+        import matplotlib
+        ## Use a graphical backend which supports threading
+        matplotlib.use('Agg')
+        from matplotlib import pyplot as plt
         plt.ioff()
         print "Interactive mode off"
         print waterfall_matrix.shape
-        fig = pylab.figure()
+        fig = plt.figure()
         ax = fig.gca()
         header = self.header
         ax.set_xticks(
@@ -865,9 +864,7 @@ class WaterfallBlock(object):
         # Generate a waterfall matrix:
         for sequence in self.ring.read(guarantee=True):
             ## Get the sequence's header as a dictionary
-            self.header = json.loads(
-                "".join(
-                    [chr(item) for item in sequence.header]))
+            self.header = json.loads(sequence.header.tostring())
             tstart = self.header['tstart']
             tsamp = self.header['tsamp']
             nchans = self.header['frame_shape'][0]
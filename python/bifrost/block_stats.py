@@ -0,0 +1,229 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Per-block performance statistics for running pipelines
+
+Each block accumulates counters (gulps, frames and bytes in and out, and the
+time spent acquiring input, reserving output and processing) in a row of
+float64 values. While a pipeline runs, the rows of all of its blocks live in
+a file in STATS_DIR (on /dev/shm by default), from which other processes
+(e.g., tools/like_top.py) can read them without disturbing the pipeline.
+
+Each row is only ever written by its own block's thread, so no locks are
+needed. Instead, the writer increments the row's update_count before and
+after each update, and readers retry if they see an odd or changed count.
+"""
+
+import numpy as np
+import errno
+import json
+import os
+import struct
+import time
+
+STATS_DIR = os.environ.get('BIFROST_STATS_DIR', '/dev/shm/bifrost')
+
+FIELDS = ['update_count',       # Odd while the row is being updated
+          'nsequence',
+          'ngulp',
+          'nframe_in',
+          'nframe_out',
+          'nbyte_in',
+          'nbyte_out',
+          'acquire_time',       # Total seconds
+          'reserve_time',
+          'process_time',
+          'sequence_ngulp',     # Counters for the current sequence
+          'sequence_nframe_in',
+          'sequence_nframe_out',
+          'sequence_start_time',
+          'last_acquire_time',  # Seconds taken by the most recent gulp
+          'last_reserve_time',
+          'last_process_time',
+          'update_time']        # Unix time of the most recent update
+NFIELD = len(FIELDS)
+_field_index = dict((name, i) for i, name in enumerate(FIELDS))
+_UPDATE_COUNT = _field_index['update_count']
+_NSEQUENCE    = _field_index['nsequence']
+_GULP_TOTALS  = slice(_field_index['ngulp'],
+                      _field_index['process_time'] + 1)
+_SEQUENCE     = slice(_field_index['sequence_ngulp'],
+                      _field_index['sequence_start_time'] + 1)
+_SEQUENCE_GULP_TOTALS = slice(_field_index['sequence_ngulp'],
+                              _field_index['sequence_nframe_out'] + 1)
+_LAST_GULP    = slice(_field_index['last_acquire_time'],
+                      _field_index['update_time'] + 1)
+_COUNT_FIELDS = set(['update_count', 'nsequence', 'ngulp',
+                     'nframe_in', 'nframe_out', 'nbyte_in', 'nbyte_out',
+                     'sequence_ngulp', 'sequence_nframe_in',
+                     'sequence_nframe_out'])
+
+def _row_to_dict(row, fields=FIELDS):
+	return dict((name, int(value) if name in _COUNT_FIELDS else float(value))
+	            for name, value in zip(fields, row))
+
+def _read_row(row, timeout=1.):
+	"""Returns a consistent copy of a row that may be being updated"""
+	deadline = time.time() + timeout
+	while True:
+		count = row[_UPDATE_COUNT]
+		if int(count) % 2 == 0:
+			values = row.copy()
+			if row[_UPDATE_COUNT] == count:
+				return values
+		if time.time() > deadline:
+			raise RuntimeError("Timed out reading block stats")
+		# Note: The writer may have been preempted mid-update
+		time.sleep(1e-4)
+
+class BlockStats(object):
+	"""Accumulates the statistics of a single block"""
+	def __init__(self, row=None):
+		self._row = np.zeros(NFIELD) if row is None else row
+	def begin_sequence(self):
+		row = self._row
+		row[_UPDATE_COUNT] += 1
+		row[_NSEQUENCE]    += 1
+		row[_SEQUENCE] = (0, 0, 0, time.time())
+		row[_UPDATE_COUNT] += 1
+	def record_gulp(self, nframe_in, nframe_out, nbyte_in, nbyte_out,
+	                acquire_time, reserve_time, process_time):
+		row = self._row
+		row[_UPDATE_COUNT] += 1
+		row[_GULP_TOTALS] += (1, nframe_in, nframe_out, nbyte_in, nbyte_out,
+		                      acquire_time, reserve_time, process_time)
+		row[_SEQUENCE_GULP_TOTALS] += (1, nframe_in, nframe_out)
+		row[_LAST_GULP] = (acquire_time, reserve_time, process_time,
+		                   time.time())
+		row[_UPDATE_COUNT] += 1
+	def read(self):
+		"""Returns a dict of the current statistics"""
+		return _row_to_dict(_read_row(self._row))
+	def _move_to(self, row):
+		"""Moves the statistics into row (e.g., in a shared stats file)"""
+		row[...] = _read_row(self._row)
+		self._row = row
+
+def _pid_is_running(pid):
+	try:
+		os.kill(pid, 0)
+	except OSError as e:
+		# EPERM means the process exists but belongs to someone else
+		return e.errno == errno.EPERM
+	return True
+
+class PipelineStats(object):
+	"""Publishes the statistics of a list of blocks to a file in STATS_DIR
+
+	The file begins with the length (uint64) of a JSON description of the
+	pipeline and its blocks, followed by the JSON (padded to 8 bytes) and
+	then a float64 array of shape (nblock, NFIELD).
+	"""
+	def __init__(self, name, blocks, stats_dir=None):
+		stats_dir = stats_dir or STATS_DIR
+		if not os.path.exists(stats_dir):
+			os.makedirs(stats_dir)
+		self.filename = os.path.join(stats_dir, '%i.%s.stats' %
+		                             (os.getpid(), name))
+		desc = json.dumps({'pid':      os.getpid(),
+		                   'pipeline': name,
+		                   'fields':   FIELDS,
+		                   'blocks':   [{'name': block.name,
+		                                 'type': block.type}
+		                                for block in blocks]})
+		desc += ' ' * (-len(desc) % 8)
+		# Note: The file is written under a temporary name and then renamed
+		#         so that readers never see it partially initialised.
+		tmp_filename = self.filename + '.tmp'
+		with open(tmp_filename, 'wb') as f:
+			f.write(struct.pack('<Q', len(desc)))
+			f.write(desc)
+			f.write(np.zeros((len(blocks), NFIELD)).tostring())
+		self._values = np.memmap(tmp_filename, dtype=np.float64, mode='r+',
+		                         offset=8 + len(desc),
+		                         shape=(len(blocks), NFIELD))
+		self._blocks = blocks
+		for block, row in zip(blocks, self._values):
+			block.perf_stats._move_to(row)
+		os.rename(tmp_filename, self.filename)
+	def close(self):
+		"""Moves the statistics back into memory and removes the file"""
+		if self._values is None:
+			return
+		for block in self._blocks:
+			block.perf_stats._move_to(np.zeros(NFIELD))
+		self._values = None
+		try:
+			os.remove(self.filename)
+		except OSError:
+			pass
+	def __enter__(self):
+		return self
+	def __exit__(self, type, value, tb):
+		self.close()
+
+class PipelineStatsReader(object):
+	"""Reads the statistics published by a (possibly different) process"""
+	def __init__(self, filename):
+		self.filename = filename
+		with open(filename, 'rb') as f:
+			desc_nbyte, = struct.unpack('<Q', f.read(8))
+			desc = json.loads(f.read(desc_nbyte))
+		self.pid      = desc['pid']
+		self.pipeline = desc['pipeline']
+		self.blocks   = desc['blocks']
+		self._fields  = desc['fields']
+		self._values  = np.memmap(filename, dtype=np.float64, mode='r',
+		                          offset=8 + desc_nbyte,
+		                          shape=(len(self.blocks), len(self._fields)))
+	def is_running(self):
+		return os.path.exists(self.filename) and _pid_is_running(self.pid)
+	def read(self):
+		"""Returns a list of (block description, stats dict) pairs"""
+		return [(block, _row_to_dict(_read_row(row), self._fields))
+		        for block, row in zip(self.blocks, self._values)]
+
+def list_pipelines(stats_dir=None):
+	"""Returns readers for the pipelines that are currently publishing stats
+
+	Files left behind by processes that are no longer running are ignored.
+	"""
+	stats_dir = stats_dir or STATS_DIR
+	if not os.path.isdir(stats_dir):
+		return []
+	readers = []
+	for filename in sorted(os.listdir(stats_dir)):
+		if not filename.endswith('.stats'):
+			continue
+		try:
+			reader = PipelineStatsReader(os.path.join(stats_dir, filename))
+		except (IOError, OSError, ValueError):
+			continue # Removed or not yet complete
+		if reader.is_running():
+			readers.append(reader)
+	return readers
@@ -30,7 +30,7 @@
 
 from pipeline import TransformBlock
 from bifrost.fdmt import Fdmt
-from units import convert_units
+from units import convert_units, convert_scale
 
 from copy import deepcopy
 import math
@@ -58,8 +58,7 @@ class FdmtBlock(TransformBlock):
 		f0_, df_ = itensor['scales'][-2]
 		t0_, dt_ = itensor['scales'][-1]
 		# Units must match self.kdm
-		f0 = convert_units(f0_, itensor['units'][-2], 'MHz')
-		df = convert_units(df_, itensor['units'][-2], 'MHz')
+		f0, df = convert_scale([f0_, df_], itensor['units'][-2], 'MHz')
 		dt = convert_units(dt_, itensor['units'][-1], 's')
 		rel_delay = self.kdm / dt * self.max_dm * (f0**-2 - (f0+nchan*df)**-2)
 		self.max_delay = int(math.ceil(abs(rel_delay)))
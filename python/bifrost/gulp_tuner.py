@@ -0,0 +1,148 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Adaptive tuning of block gulp sizes
+
+When a pipeline is run with autotune=True, each transform block tries a
+range of gulp sizes during a warm-up period at the start of its first
+sequence(s). Each candidate is a scale factor applied to the block's
+default gulp: the stride between gulps is multiplied by the scale, while
+any overlap between consecutive gulps is kept the same. Candidates that do
+not give a whole number of frames, or that the block rejects in its
+define_output_nframes (e.g., a scrunch factor that does not divide the
+gulp), are skipped.
+
+Each candidate is run for a number of gulps (after one to warm up), and
+its throughput is measured as the no. new input frames processed per
+second of processing time. Time spent waiting for input or output space
+is excluded, as it depends on the neighbouring blocks rather than on the
+gulp size. The candidate with the highest throughput is then used for the
+rest of the run, and can be saved to a file to be reused by later runs
+(see Pipeline.save_gulp_config and Pipeline.load_gulp_config).
+"""
+
+import json
+
+DEFAULT_SCALES = [0.25, 0.5, 1, 2, 4]
+DEFAULT_NGULP  = 8
+
+def scale_slice(islice, scale):
+	"""Returns the canonical input slice islice (see pipeline._span_slice)
+	with its stride multiplied by scale, keeping its overlap, or None if
+	the new stride would not be a whole number of frames"""
+	stride  = islice.step
+	overlap = (islice.stop - islice.start) - stride
+	new_stride = stride * scale
+	if new_stride < 1 or new_stride != int(new_stride):
+		return None
+	new_stride = int(new_stride)
+	return slice(islice.start, islice.start + new_stride + overlap, new_stride)
+
+class GulpTuner(object):
+	"""Chooses a block's gulp scale by trying each candidate for ngulp
+	gulps and keeping the one with the highest throughput"""
+	def __init__(self, scales=None, ngulp=DEFAULT_NGULP):
+		self.scales = list(scales or DEFAULT_SCALES)
+		self.ngulp  = ngulp
+		self.throughputs = {} # Frames per second, by scale
+		self.best_scale  = None
+		self._candidates = None
+		self._index  = 0
+		self._count  = 0
+		self._nframe = 0
+		self._time   = 0.
+	@property
+	def done(self):
+		return self.best_scale is not None
+	def set_candidates(self, scales):
+		"""Sets the scales that are valid for the block; only the first
+		call has any effect"""
+		if self._candidates is not None:
+			return
+		self._candidates = sorted(scales)
+		if not len(self._candidates):
+			self.best_scale = 1
+	@property
+	def scale(self):
+		"""The scale to use for the next gulp"""
+		if self.done:
+			return self.best_scale
+		return self._candidates[self._index]
+	@property
+	def max_scale(self):
+		"""The largest scale that may still be used"""
+		if self.done:
+			return self.best_scale
+		return self._candidates[-1]
+	def record_gulp(self, nframe, process_time):
+		"""Records the no. new input frames processed in a gulp at the
+		current scale, and how long it took. Returns True if the scale
+		has changed as a result."""
+		if self.done:
+			return False
+		self._count += 1
+		if self._count == 1:
+			# Note: The first gulp of each candidate is a warm-up
+			return False
+		self._nframe += nframe
+		self._time   += process_time
+		if self._count <= self.ngulp:
+			return False
+		self.throughputs[self.scale] = (self._nframe / self._time
+		                                if self._time > 0 else float('inf'))
+		self._index += 1
+		self._count  = 0
+		self._nframe = 0
+		self._time   = 0.
+		if self._index == len(self._candidates):
+			self.finish()
+		return True
+	def finish(self):
+		"""Chooses the best scale measured so far (e.g., if the data ran out
+		before every candidate had been tried)"""
+		if self.done:
+			return
+		if len(self.throughputs):
+			self.best_scale = max(sorted(self.throughputs.keys()),
+			                      key=lambda scale: self.throughputs[scale])
+		else:
+			self.best_scale = 1
+
+def load_gulp_config(filename):
+	"""Returns a dict mapping block names to their tuned gulp scales from a
+	file written by save_gulp_config"""
+	with open(filename, 'r') as f:
+		config = json.load(f)
+	return dict((str(name), entry['gulp_scale'])
+	            for name, entry in config.items())
+
+def save_gulp_config(filename, tuned):
+	"""Writes the dict tuned, mapping block names to dicts with (at least) a
+	gulp_scale entry, to filename as JSON"""
+	with open(filename, 'w') as f:
+		json.dump(tuned, f, indent=4, sort_keys=True)
@@ -0,0 +1,218 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""End-to-end latency tracing for pipelines
+
+When tracing is enabled (Pipeline.run(trace=True)), each block records the
+wall-clock times at which it began waiting for input, acquired its input
+spans, reserved its output spans and committed them, along with the ring,
+sequence time_tag and byte range of every span. Recording only appends a
+tuple; all matching is done afterwards.
+
+Each input span is matched to the upstream commits that wrote its data.
+A block's hop latency is the time from the last of its input data being
+committed upstream to its own outputs being committed. Its end-to-end
+latency is the time from the source committing the (newest) data that the
+gulp depends on to the block committing its outputs; for sink blocks this
+is the latency of the whole pipeline.
+"""
+
+import numpy as np
+import json
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+# Histogram bins: 5 per decade from 1 us to 100 s
+HISTOGRAM_BINS = np.logspace(-6, 2, 8*5 + 1)
+
+def latency_stats(latencies, bins=HISTOGRAM_BINS):
+	"""Returns a dict of summary statistics and a histogram of latencies"""
+	latencies = np.asarray(latencies, dtype=np.float64)
+	if not len(latencies):
+		return {'count': 0}
+	counts, edges = np.histogram(np.clip(latencies, bins[0], bins[-1]), bins)
+	return {'count': len(latencies),
+	        'mean':  float(latencies.mean()),
+	        'p50':   float(np.percentile(latencies, 50)),
+	        'p99':   float(np.percentile(latencies, 99)),
+	        'max':   float(latencies.max()),
+	        'histogram': (counts.tolist(), edges.tolist())}
+
+class _Gulp(object):
+	__slots__ = ['block', 't_begin', 't_acquired', 't_reserved', 't_end',
+	             'inputs', 'outputs', 'ready', 'origin', 'sources']
+	def __init__(self, record):
+		(self.block, t_end, acquire_time, reserve_time, process_time,
+		 self.inputs, self.outputs) = record
+		self.t_end      = t_end
+		self.t_reserved = t_end - process_time
+		self.t_acquired = self.t_reserved - reserve_time
+		self.t_begin    = self.t_acquired - acquire_time
+
+class LatencyTrace(object):
+	"""Collects per-gulp timestamps from the blocks of a running pipeline"""
+	def __init__(self, blocks, max_ngulp=1000000):
+		self._block_names = [block.name for block in blocks]
+		iring_names = set([iring.name for block in blocks
+		                   for iring in block.irings])
+		# Blocks whose outputs are not read by any other block
+		self._leaf_names = [block.name for block in blocks
+		                    if not any([oring.name in iring_names
+		                                for oring in block.orings])]
+		# Note: deque.append is atomic, so blocks need not take a lock
+		self._records = deque(maxlen=max_ngulp)
+	def record_gulp(self, block_name, t_end,
+	                acquire_time, reserve_time, process_time,
+	                ispans, itime_tags, ospans, otime_tags, onframes):
+		"""Records a gulp that acquired ispans and committed onframes of
+		each of ospans at time t_end (all times are from time.time())"""
+		inputs  = [(span.ring.name, time_tag,
+		            span._offset_bytes, span._size_bytes)
+		           for span, time_tag in zip(ispans, itime_tags)]
+		outputs = [(span.ring.name, time_tag,
+		            span._offset_bytes, nframe * span.frame_nbyte)
+		           for span, time_tag, nframe
+		           in zip(ospans, otime_tags, onframes)]
+		self._records.append((block_name, t_end,
+		                      acquire_time, reserve_time, process_time,
+		                      inputs, outputs))
+	def _analyse(self):
+		"""Returns the recorded gulps, each matched to the upstream gulps
+		that committed its inputs"""
+		gulps = [_Gulp(record) for record in list(self._records)]
+		# Index the committed byte ranges by (ring, time_tag)
+		commits = defaultdict(list)
+		for gulp in gulps:
+			for ring, time_tag, offset, nbyte in gulp.outputs:
+				if nbyte:
+					commits[(ring, time_tag)].append((offset, offset + nbyte,
+					                                  gulp))
+		for ranges in commits.values():
+			ranges.sort(key=lambda r: r[0])
+		begins = dict((key, [r[0] for r in ranges])
+		              for key, ranges in commits.items())
+		for gulp in gulps:
+			gulp.ready   = None
+			gulp.sources = []
+			for ring, time_tag, offset, nbyte in gulp.inputs:
+				key = (ring, time_tag)
+				if key not in commits:
+					continue # Written before tracing began or not traced
+				ranges = commits[key]
+				i = bisect_left(begins[key], offset + nbyte) - 1
+				latest = None
+				while i >= 0 and ranges[i][1] > offset:
+					source = ranges[i][2]
+					if latest is None or source.t_end > latest.t_end:
+						latest = source
+					i -= 1
+				if latest is not None:
+					gulp.sources.append(latest)
+					if gulp.ready is None or latest.t_end > gulp.ready:
+						gulp.ready = latest.t_end
+		# Propagate the origin times from the sources
+		# Note: A gulp's sources always acquired their inputs before it did
+		for gulp in sorted(gulps, key=lambda g: g.t_acquired):
+			if not len(gulp.inputs):
+				gulp.origin = gulp.t_end
+			else:
+				origins = [source.origin for source in gulp.sources
+				           if source.origin is not None]
+				gulp.origin = max(origins) if len(origins) else None
+		return gulps
+	def latencies(self):
+		"""Returns {block_name: {'hop': [...], 'end_to_end': [...]}} of
+		latencies in seconds"""
+		result = dict((name, {'hop': [], 'end_to_end': []})
+		              for name in self._block_names)
+		for gulp in self._analyse():
+			block = result.setdefault(gulp.block,
+			                          {'hop': [], 'end_to_end': []})
+			if gulp.ready is not None:
+				block['hop'].append(gulp.t_end - gulp.ready)
+			if gulp.origin is not None and len(gulp.inputs):
+				block['end_to_end'].append(gulp.t_end - gulp.origin)
+		return result
+	def summary(self):
+		"""Returns latency statistics (count, mean, p50, p99, max and a
+		histogram) for each block and for the pipeline end to end, as
+		{'blocks': {block_name: {'hop': stats, 'end_to_end': stats}},
+		 'end_to_end': stats}"""
+		latencies = self.latencies()
+		end_to_end = []
+		for name in self._leaf_names:
+			end_to_end += latencies.get(name, {}).get('end_to_end', [])
+		return {'blocks': dict((name, dict((kind, latency_stats(values))
+		                                   for kind, values in block.items()))
+		                       for name, block in latencies.items()),
+		        'end_to_end': latency_stats(end_to_end)}
+	def chrome_trace(self):
+		"""Returns the trace in Chrome's trace event format (see
+		chrome://tracing), with one thread per block and flow arrows from
+		each commit to the acquires of its data"""
+		gulps = self._analyse()
+		if not len(gulps):
+			return {'traceEvents': []}
+		t0 = min([gulp.t_begin for gulp in gulps])
+		def us(t):
+			return (t - t0) * 1e6
+		tids = dict((name, i) for i, name in enumerate(self._block_names))
+		for gulp in gulps:
+			if gulp.block not in tids:
+				tids[gulp.block] = len(tids)
+		events = [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tid,
+		           'args': {'name': name}}
+		          for name, tid in tids.items()]
+		flow_ids = {}
+		for gulp in gulps:
+			tid = tids[gulp.block]
+			args = {'inputs':  [list(i) for i in gulp.inputs],
+			        'outputs': [list(o) for o in gulp.outputs]}
+			for name, begin, end in [('acquire', gulp.t_begin,    gulp.t_acquired),
+			                         ('reserve', gulp.t_acquired, gulp.t_reserved),
+			                         ('process', gulp.t_reserved, gulp.t_end)]:
+				events.append({'name': name, 'cat': 'gulp', 'ph': 'X',
+				               'pid': 0, 'tid': tid, 'ts': us(begin),
+				               'dur': us(end) - us(begin), 'args': args})
+			for source in gulp.sources:
+				if id(source) not in flow_ids:
+					flow_ids[id(source)] = len(flow_ids)
+					events.append({'name': 'data', 'cat': 'flow', 'ph': 's',
+					               'pid': 0, 'tid': tids[source.block],
+					               'ts': us(source.t_end),
+					               'id': flow_ids[id(source)]})
+				events.append({'name': 'data', 'cat': 'flow', 'ph': 't',
+				               'bp': 'e', 'pid': 0, 'tid': tid,
+				               'ts': us(gulp.t_acquired),
+				               'id': flow_ids[id(source)]})
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+	def save_chrome_trace(self, filename):
+		"""Writes the trace to a JSON file that can be loaded in
+		chrome://tracing or https://ui.perfetto.dev"""
+		with open(filename, 'w') as f:
+			json.dump(self.chrome_trace(), f)
@@ -28,10 +28,97 @@
 
 # This file provides a direct interface to libbifrost.so
 
+import ctypes
+
 # PYCLIBRARY ISSUE: Passing the wrong handle type to a function gives this meaningless error:
 #  ArgumentError: argument 1: <type 'exceptions.TypeError'>: expected LP_s instance instead of LP_s
 #  E.g., _bf.RingSequenceGetName(<BFspan>) [should be <BFsequence>]
 
+class _StaticFunction(object):
+	"""A library function bound using the generated ctypes bindings
+
+	Calls behave like those of pyclibrary functions: arguments may be given
+	by name, omitted pointer arguments are created and passed as outputs,
+	and the result is (return value, argument values).
+	"""
+	def __init__(self, name, func, restype, args):
+		self.name = name
+		self.func = func
+		func.restype  = restype
+		func.argtypes = [argtype for argname, argtype in args]
+		self.nargs    = len(args)
+		self.arg_inds = dict((argname, i) for i, (argname, argtype)
+		                     in enumerate(args))
+		# Pointer arguments, which may be omitted to receive outputs
+		self.out_args = [(i, argtype._type_)
+		                 for i, (argname, argtype) in enumerate(args)
+		                 if issubclass(argtype, ctypes._Pointer)]
+	def __call__(self, *args, **kwargs):
+		arg_list = list(args)
+		if len(arg_list) < self.nargs:
+			arg_list += [_missing] * (self.nargs - len(arg_list))
+		for argname, val in kwargs.iteritems():
+			try:
+				arg_list[self.arg_inds[argname]] = val
+			except KeyError:
+				raise TypeError("Function %s has no argument named '%s'" %
+				                (self.name, argname))
+		call_args = arg_list[:]
+		for i, out_type in self.out_args:
+			if arg_list[i] is _missing:
+				arg_list[i]  = out = out_type()
+				call_args[i] = ctypes.byref(out)
+		ret = self.func(*call_args)
+		has_value = _has_value
+		return ret, [arg.value if has_value[type(arg)] else arg
+		             for arg in arg_list]
+_missing = object()
+
+class _HasValue(dict):
+	"""Maps types to whether their instances carry a (ctypes) value"""
+	def __missing__(self, typ):
+		self[typ] = has_value = hasattr(typ, 'value')
+		return has_value
+_has_value = _HasValue()
+
+class _StaticLibrary(object):
+	"""libbifrost bound using the generated ctypes bindings
+
+	Provides the same names as a pyclibrary CLibrary: values, functions
+	(with or without the 'bf' prefix), types and structs.
+	"""
+	def __init__(self, lib, bindings, prefix='bf'):
+		self._lib      = lib
+		self._bindings = bindings
+		self._prefix   = prefix
+	def __getattr__(self, name):
+		bindings = self._bindings
+		for fullname in [name, self._prefix + name]:
+			if fullname in bindings.values:
+				obj = bindings.values[fullname]
+			elif fullname in bindings.functions:
+				restype, args = bindings.functions[fullname]
+				obj = _StaticFunction(fullname, getattr(self._lib, fullname),
+				                      restype, args)
+			elif fullname in bindings.types:
+				obj = bindings.types[fullname]
+			else:
+				continue
+			# Cache the object so that later lookups bypass __getattr__
+			setattr(self, name, obj)
+			return obj
+		raise AttributeError(name)
+
+def _load_static_bifrost_lib():
+	"""Loads libbifrost using the bindings generated at build time, or
+	returns None if they have not been generated"""
+	try:
+		import libbifrost_generated
+	except ImportError:
+		return None
+	lib = ctypes.CDLL("libbifrost.so")
+	return _StaticLibrary(lib, libbifrost_generated)
+
 def _load_bifrost_lib():
 	import os
 	import glob
@@ -99,12 +186,20 @@ def _load_bifrost_lib():
 	lib = CLibrary(library_name, _parser, prefix=api_prefix)
 	return lib
 
-_bf = _load_bifrost_lib() # Internal access to library
+# Note: Parsing the headers at runtime (with pyclibrary) is the fallback
+#         for when the bindings have not been generated by the build.
+_bf = _load_static_bifrost_lib() or _load_bifrost_lib() # Internal access to library
 bf = _bf                  # External access to library
 
 # Internal helper functions below
 
 def _array(typ, size_or_vals):
+	if isinstance(_bf, _StaticLibrary):
+		try:
+			vals = list(size_or_vals)
+			return (getattr(_bf, typ) * len(vals))(*vals)
+		except TypeError:
+			return (getattr(_bf, typ) * size_or_vals)()
 	from pyclibrary import build_array
 	try:
 		_ = iter(size_or_vals)
@@ -114,6 +209,10 @@ def _array(typ, size_or_vals):
 		size = size_or_vals
 		return build_array(_bf, typ, size=size)
 
+class WouldBlock(RuntimeError):
+	"""Raised when an operation's timeout elapses before it can proceed"""
+	pass
+
 def _check(f):
 	status, args = f
 	if status != _bf.BF_STATUS_SUCCESS:
@@ -121,6 +220,8 @@ def _check(f):
 			raise RuntimeError("WTF, status is None")
 		if status == _bf.BF_STATUS_END_OF_DATA:
 			raise StopIteration()
+		elif status == _bf.BF_STATUS_WOULD_BLOCK:
+			raise WouldBlock("Operation timed out")
 		else:
 			status_str, _ = _bf.GetStatusString(status)
 			raise RuntimeError(status_str)
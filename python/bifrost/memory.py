@@ -41,8 +41,49 @@ def space_accessible(space, from_spaces):
 	else:
 		return False
 
-def raw_malloc(size, space):
-	ptr = _get(_bf.Malloc(size=size, space=_string2space(space)), retarg=0)
+def _malloc_flags(hugepages=None, prefault=False, mlock=False):
+	flags = _bf.BF_MALLOC_DEFAULT
+	if hugepages in [True, 'transparent']:
+		flags |= _bf.BF_MALLOC_HUGEPAGES
+	elif hugepages == 'explicit':
+		flags |= _bf.BF_MALLOC_HUGEPAGES_EXPLICIT
+	elif hugepages not in [None, False]:
+		raise ValueError("Invalid hugepages option '%s'; "
+		                 "valid options are 'transparent' and 'explicit'" %
+		                 str(hugepages))
+	if prefault:
+		flags |= _bf.BF_MALLOC_PREFAULT
+	if mlock:
+		flags |= _bf.BF_MALLOC_LOCK
+	return flags
+def _malloc_options(flags):
+	"""Returns the arguments to _malloc_flags that give flags, as a dict"""
+	hugepages = None
+	if flags & _bf.BF_MALLOC_HUGEPAGES_EXPLICIT:
+		hugepages = 'explicit'
+	elif flags & _bf.BF_MALLOC_HUGEPAGES:
+		hugepages = 'transparent'
+	return {'hugepages': hugepages,
+	        'prefault':  bool(flags & _bf.BF_MALLOC_PREFAULT),
+	        'mlock':     bool(flags & _bf.BF_MALLOC_LOCK)}
+
+def raw_malloc(size, space, hugepages=None, prefault=False, mlock=False,
+               numa_node=None):
+	"""Allocates size bytes of memory in the given space
+
+	The remaining options apply only to the 'system' space:
+	  hugepages: None, 'transparent' (advise the kernel to use huge pages)
+	             or 'explicit' (use reserved huge pages, which must have
+	             been set up via /proc/sys/vm/nr_hugepages).
+	  prefault:  Touch every page up front instead of on first use.
+	  mlock:     Lock the pages into RAM (subject to RLIMIT_MEMLOCK).
+	  numa_node: Bind the memory to the given NUMA node.
+	"""
+	flags = _malloc_flags(hugepages, prefault, mlock)
+	if numa_node is None:
+		numa_node = -1
+	ptr = _get(_bf.MallocEx(size=size, space=_string2space(space),
+	                        flags=flags, numa_node=numa_node), retarg=0)
 	return ptr
 def raw_free(ptr, space='auto'):
 	_check(_bf.Free(ptr, _string2space(space)))
@@ -27,13 +27,21 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import bifrost as bf
-from bifrost.ring2 import Ring
+from bifrost.ring2 import Ring, ReadSequence, SequenceBase, SpanBase, parse_tensor_header
 from temp_storage import TempStorage
+from block_stats import BlockStats, PipelineStats
+from latency_trace import LatencyTrace
+from placement import read_cpu_topology, plan_placement, format_placement
+from gulp_tuner import GulpTuner, scale_slice, load_gulp_config, save_gulp_config
 
 from collections import defaultdict
 from contextlib2 import ExitStack
+import multiprocessing
+import os
+import Queue
 import threading
 import time
+import traceback
 
 def izip(*iterables):
 	while True:
@@ -62,6 +70,7 @@ class BlockScope(object):
 	             buffer_nframe=None,
 	             buffer_factor=None,
 	             core=None,
+	             openmp_cores=None,
 	             gpu=None,
 	             share_temp_storage=False,
 	             fuse=False):
@@ -73,6 +82,7 @@ class BlockScope(object):
 		self._buffer_nframe = buffer_nframe
 		self._buffer_factor = buffer_factor
 		self._core          = core
+		self._openmp_cores  = openmp_cores
 		self._gpu           = gpu
 		self._share_temp_storage = share_temp_storage
 		self._temp_storage_ = {}
@@ -113,7 +123,7 @@ class BlockScope(object):
 		while parent is not None:
 			scope_hierarchy.append(parent)
 			parent = parent._parent_scope
-		return reversed(scope_hierarchy)
+		return list(reversed(scope_hierarchy))
 	def cache_scope_hierarchy(self):
 		self.scope_hierarchy = self._get_scope_hierarchy()
 		self.fused_ancestor = None
@@ -158,17 +168,462 @@ class Pipeline(BlockScope):
 	def __init__(self, **kwargs):
 		super(Pipeline, self).__init__(**kwargs)
 		self.blocks = []
+		self.latency_trace = None
+		# Gulp scales to apply to blocks, by name (see bifrost.gulp_tuner)
+		self.gulp_scales = {}
+		# Results of the last autotuned run, by block name
+		self.tuned_gulps = {}
+		self._autotune = False
 	def as_default(self):
 		return PipelineContext(self)
-	def run(self):
-		print "Launching %i blocks" % len(self.blocks)
-		threads = [threading.Thread(target=block.run, name=block.name)
-		           for block in self.blocks]
+	def plan_buffers(self, fuse=True):
+		"""Sizes every ring for the first sequence that will flow through it
+
+		This walks the blocks in order, propagating the headers returned by
+		each block's on_sequence (called here with stand-in sequences that
+		have only a header), and resizes each ring to the largest size any
+		of its writer or readers would request at runtime. This avoids the
+		stalls caused by reallocating rings once data are flowing.
+
+		Note that this calls each block's on_sequence an extra time, and
+		opens the first source of each SourceBlock (via create_reader) an
+		extra time, so it must only be used when these have no side
+		effects (e.g., not with sources that consume live data).
+
+		If fuse is True, the rings between the blocks of fused chains (see
+		_FusedChain), which are bypassed at runtime, are not allocated.
+
+		Blocks whose on_sequence cannot be evaluated this way (and any
+		blocks downstream of them) are left to size their rings lazily.
+		Later sequences with larger gulps or frames may also still cause
+		reallocations.
+
+		Returns a list with one dict per planned ring, giving the largest
+		contiguous and total no. bytes requested of it (per ringlet) and its
+		resulting capacity, no. ringlets and memory footprint.
+		"""
+		fused_rings = set([block.orings[0]
+		                   for chain in self._find_fused_chains(warn=False)
+		                   for block in chain[:-1]]) if fuse else set()
+		headers = {}
+		planned_rings = []
+		requests = defaultdict(list)
+		nringlets = {}
+		for block in self.blocks:
+			block.cache_scope_hierarchy()
+			iseqs = [_PlannedSequence(iring, headers[iring], requests[iring])
+			         if iring in headers else None
+			         for iring in block.irings]
+			if any([iseq is None for iseq in iseqs]):
+				continue
+			try:
+				oheaders, onbytes = block._plan_sequences(iseqs)
+			except Exception as e:
+				print "WARNING: Could not plan buffers for block %s: %s" % (block.name, e)
+				continue
+			for oring, ohdr, (contiguous_bytes, total_bytes, nringlet) in zip(
+					block.orings, oheaders, onbytes):
+				headers[oring] = ohdr
+				requests[oring].append((contiguous_bytes, total_bytes))
+				nringlets[oring] = nringlet
+				if oring not in fused_rings:
+					planned_rings.append(oring)
+		plan = []
+		for ring in planned_rings:
+			contiguous_bytes = max([nbytes[0] for nbytes in requests[ring]])
+			total_bytes      = max([nbytes[1] for nbytes in requests[ring]])
+			ring.resize(contiguous_bytes, total_bytes, nringlets[ring])
+			stats = ring.stats
+			plan.append({'ring':             ring.name,
+			             'contiguous_bytes': contiguous_bytes,
+			             'total_bytes':      total_bytes,
+			             'capacity':         stats['capacity'],
+			             'nringlet':         stats['nringlet'],
+			             'nbyte':            stats['capacity']*stats['nringlet']})
+		return plan
+	def _find_fused_chains(self, warn=True):
+		"""Returns the lists of blocks to be run as fused chains
+
+		The blocks in a fused BlockScope are run as one chain (in a single
+		thread) if they are TransformBlocks (the last may be a SinkBlock)
+		in which each block's output ring is read only by the next block.
+		If warn is True, a warning is printed for any other fused scopes.
+		"""
+		readers = defaultdict(list)
+		for block in self.blocks:
+			block.cache_scope_hierarchy()
+			for iring in block.irings:
+				readers[iring].append(block)
+		scopes = []
+		members = defaultdict(list)
+		for block in self.blocks:
+			scope = block.fused_ancestor
+			if scope is None:
+				continue
+			if scope not in members:
+				scopes.append(scope)
+			members[scope].append(block)
+		chains = []
+		for scope in scopes:
+			blocks = members[scope]
+			if len(blocks) < 2:
+				continue
+			if (all([isinstance(block, TransformBlock) for block in blocks[:-1]]) and
+			    isinstance(blocks[-1], (TransformBlock, SinkBlock)) and
+			    all([len(block.orings) == 1 and readers[block.orings[0]] == [next_block]
+			         for block, next_block in zip(blocks[:-1], blocks[1:])])):
+				chains.append(blocks)
+			elif warn:
+				print "WARNING: Blocks in fused scope %s do not form a chain; running them separately" % scope._name
+		return chains
+	def plan_placement(self, topology=None, openmp_nthread=None,
+	                   verbose=True):
+		"""Assigns a core to every block that does not already have one
+
+		Blocks connected by rings are kept on the same socket, busy blocks
+		are given a physical core each (without a busy hyperthread sibling)
+		and blocks with uses_openmp set also get a set of OpenMP cores on
+		their socket (see bifrost.placement). A block is considered busy if
+		it spent at least half of its time processing in the previous run,
+		or if it has not run yet. The blocks of a fused chain share a core.
+
+		topology defaults to that of this machine (see
+		bifrost.placement.read_cpu_topology). If verbose is True, the plan
+		is printed.
+
+		Returns the plan (see bifrost.placement.plan_placement).
+		"""
+		if topology is None:
+			topology = read_cpu_topology()
+		# Each fused chain is placed as a single unit, named by its head
+		unit_of = dict((block, block) for block in self.blocks)
+		for chain in self._find_fused_chains():
+			for block in chain:
+				unit_of[block] = chain[0]
+		units = []
+		for block in self.blocks:
+			if unit_of[block] not in units:
+				units.append(unit_of[block])
+		members = dict((unit, [block for block in self.blocks
+		                       if unit_of[block] is unit])
+		               for unit in units)
+		edges = []
+		for block in self.blocks:
+			for iring in block.irings:
+				writers = [b for b in self.blocks if iring in b.orings]
+				edges += [(unit_of[writer].name, unit_of[block].name)
+				          for writer in writers
+				          if unit_of[writer] is not unit_of[block]]
+		fixed = {}
+		for unit in units:
+			core = unit.core
+			if core is not None:
+				fixed[unit.name] = core if isinstance(core, int) else core[0]
+		def is_busy(block):
+			stats = block.perf_stats.read()
+			total_time = (stats['acquire_time'] + stats['reserve_time'] +
+			              stats['process_time'])
+			return total_time == 0 or stats['process_time'] >= 0.5*total_time
+		hot = [unit.name for unit in units
+		       if any([is_busy(block) for block in members[unit]])]
+		openmp = [unit.name for unit in units
+		          if unit.openmp_cores is None and
+		          any([block.uses_openmp for block in members[unit]])]
+		plan = plan_placement([unit.name for unit in units], edges, topology,
+		                      fixed, hot, openmp, openmp_nthread)
+		for unit in units:
+			entry = plan[unit.name]
+			if entry['fixed']:
+				continue
+			for block in members[unit]:
+				block._core = entry['core']
+				if entry['openmp_cores'] is not None:
+					block._openmp_cores = entry['openmp_cores']
+				# Place the block's output buffers near its core
+				if topology.nnuma_node > 1:
+					for oring in block.orings:
+						if oring.space == 'system':
+							oring.set_numa_node(entry['numa_node'])
+		if verbose:
+			print "Block placement:"
+			print format_placement(plan)
+		return plan
+	def run(self, plan_buffers=False, publish_stats=True, trace=False,
+	        fuse=True, mode='thread', place=False, autotune=False,
+	        gulp_config=None):
+		"""Runs the blocks until all have finished
+
+		If mode is 'thread', each block runs in its own thread. If mode is
+		'process', the blocks are instead split between processes so that
+		they do not contend for the GIL: blocks with the same core run
+		together in one process, as do the blocks of a fused BlockScope,
+		and every other block gets a process of its own. Rings between
+		processes are replaced with shared rings for the duration of the
+		run, and so must be in system memory. If a block raises an
+		exception, all of the processes are terminated and the exception is
+		re-raised here as a RuntimeError. Note that child processes are
+		forked, so CUDA must not be used by this process before the
+		pipeline runs.
+
+		If plan_buffers is True, the rings are first sized for the first
+		sequence that will flow through them (see plan_buffers).
+
+		If publish_stats is True, the blocks' performance statistics are
+		published to a file in bifrost.block_stats.STATS_DIR while the
+		pipeline runs (see tools/like_top.py).
+
+		If trace is True, the time at which each span is acquired and
+		committed is recorded in self.latency_trace (a LatencyTrace), from
+		which latency statistics and a Chrome trace can be obtained.
+
+		If fuse is True, the blocks in each fused BlockScope are run in a
+		single thread, passing data directly from one block to the next
+		instead of through their intermediate rings (see _FusedChain).
+
+		If place is True, blocks without a core are first assigned one
+		automatically (see plan_placement).
+
+		If autotune is True, each transform block tries a range of gulp
+		sizes at the start of the run and keeps the one with the highest
+		throughput (see bifrost.gulp_tuner); the results are stored in
+		self.tuned_gulps, and also saved to the file gulp_config if given.
+		Otherwise, if gulp_config names an existing file, the gulp sizes
+		tuned by a previous run are loaded from it and used.
+		"""
+		if mode not in ['thread', 'process']:
+			raise ValueError("Invalid pipeline mode '%s'; expected 'thread' or 'process'" % mode)
+		if place:
+			self.plan_placement()
+		self._bind_ring_memory()
+		self._autotune = autotune
+		if autotune:
+			self.tuned_gulps = {}
+		elif gulp_config is not None and os.path.exists(gulp_config):
+			self.load_gulp_config(gulp_config)
+		with ExitStack() as run_stack:
+			if mode == 'process':
+				groups = self._process_groups()
+				# Note: Restoring the original rings afterwards destroys the
+				#         shared rings, unlinking their shared memory.
+				run_stack.callback(self._unshare_rings,
+				                   self._share_rings(groups))
+			self._expect_readers()
+			if plan_buffers:
+				if mode == 'process' and any([ring.space != 'system'
+				                              for ring in self._rings()]):
+					# Note: Allocating device memory here would initialise CUDA,
+					#         which would then be unusable in the forked processes.
+					print "WARNING: Not planning buffers, as process mode cannot allocate device memory up front"
+				else:
+					plan = self.plan_buffers(fuse)
+					print "Allocated %i ring buffers totalling %.1f MiB" % (
+						len(plan), sum([entry['nbyte'] for entry in plan]) / 1024.**2)
+			self.latency_trace = LatencyTrace(self.blocks) if trace else None
+			if publish_stats:
+				try:
+					run_stack.enter_context(
+						PipelineStats(self._name, self.blocks))
+				except (IOError, OSError) as e:
+					print "WARNING: Could not publish pipeline stats: %s" % e
+			if mode == 'thread':
+				self._run_threads(self.blocks, fuse)
+			else:
+				self._run_processes(groups, fuse)
+		if autotune and gulp_config is not None:
+			self.save_gulp_config(gulp_config)
+	def load_gulp_config(self, filename):
+		"""Loads the gulp sizes of blocks from a file written by
+		save_gulp_config, to be used when the pipeline next runs"""
+		self.gulp_scales.update(load_gulp_config(filename))
+	def save_gulp_config(self, filename):
+		"""Saves the gulp sizes tuned in the last run (see run) to a file"""
+		save_gulp_config(filename, self.tuned_gulps)
+	def _bind_ring_memory(self):
+		"""Binds the buffers of the system-space rings created by blocks
+		with a core to the NUMA node of that core"""
+		for block in self.blocks:
+			core = block.core
+			if core is None:
+				continue
+			core = core if isinstance(core, int) else core[0]
+			try:
+				numa_node = bf.affinity.get_numa_node(core)
+			except RuntimeError:
+				# This machine has no such core, which Block.run will report
+				continue
+			for ring in block._core_rings:
+				if ring.space == 'system':
+					ring.set_numa_node(numa_node)
+	def _expect_readers(self):
+		"""Tells each ring how many guaranteed readers will consume it, so
+		that its writer cannot overwrite data before they have all opened the
+		first sequence (see Ring.expect_readers)"""
+		orings = set([oring for block in self.blocks for oring in block.orings])
+		nreader = defaultdict(lambda: 0)
+		for block in self.blocks:
+			if isinstance(block, MultiTransformBlock) and block.guarantee:
+				for iring in block.irings:
+					if iring in orings:
+						nreader[iring] += 1
+		for ring, n in nreader.items():
+			ring.expect_readers(n)
+	def _rings(self):
+		rings = []
+		for block in self.blocks:
+			for ring in block.irings + block.orings:
+				if ring not in rings:
+					rings.append(ring)
+		return rings
+	def _run_threads(self, blocks, fuse, on_error=None):
+		"""Runs blocks (and fused chains of them) in threads until all have
+		finished, passing the name and traceback of any block that raises an
+		exception to on_error"""
+		chains = self._find_fused_chains() if fuse else []
+		chains = [chain for chain in chains
+		          if all([block in blocks for block in chain])]
+		fused_blocks = set([block for chain in chains for block in chain])
+		runners = ([block for block in blocks if block not in fused_blocks] +
+		           [_FusedChain(chain) for chain in chains])
+		print "Launching %i blocks (%i fused into %i chains)" % (
+			len(blocks), len(fused_blocks), len(chains))
+		def run_block(runner):
+			try:
+				runner.run()
+			except Exception:
+				on_error(runner.name, traceback.format_exc())
+		threads = [threading.Thread(target=runner.run if on_error is None
+		                            else lambda runner=runner: run_block(runner),
+		                            name=runner.name)
+		           for runner in runners]
 		for thread in threads:
 			thread.start()
 		print "Waiting for blocks to finish"
 		for thread in threads:
 			thread.join()
+	def _process_groups(self):
+		"""Returns the lists of blocks to run in each process"""
+		groups = []
+		group_keys = {}
+		for block in self.blocks:
+			block.cache_scope_hierarchy()
+			core = block.core
+			if core is not None:
+				key = ('core', core if isinstance(core, int) else tuple(core))
+			elif block.fused_ancestor is not None:
+				key = ('fused', id(block.fused_ancestor))
+			else:
+				key = ('block', id(block))
+			if key not in group_keys:
+				group_keys[key] = len(groups)
+				groups.append([])
+			groups[group_keys[key]].append(block)
+		return groups
+	def _share_rings(self, groups):
+		"""Replaces the rings that connect blocks in different groups with
+		shared rings, and returns a list of (ring, shared_ring) pairs"""
+		shared_rings = []
+		group_of = {}
+		for i, group in enumerate(groups):
+			for block in group:
+				group_of[block] = i
+		for writer in self.blocks:
+			for ring in list(writer.orings):
+				if ring.shared:
+					continue
+				readers = [block for block in self.blocks
+				           if ring in block.irings]
+				if all([group_of[reader] == group_of[writer]
+				        for reader in readers]):
+					continue
+				if ring.space != 'system':
+					raise ValueError("Ring %s (space '%s') connects blocks in "
+					                 "different processes, but only system-"
+					                 "space rings can be shared; assign the "
+					                 "blocks the same core to run them in one "
+					                 "process" % (ring.name, ring.space))
+				if ring.spsc:
+					print "WARNING: Ring %s connects blocks in different processes, so it cannot be single-producer/single-consumer" % ring.name
+				wait_policy, spin_count = ring.wait_policy
+				shared_ring = Ring(space=ring.space, owner=writer, shared=True,
+				                   name='%s_%i' % (ring.name, os.getpid()),
+				                   mirrored=ring.mirrored,
+				                   wait_policy=wait_policy,
+				                   spin_count=spin_count,
+				                   **ring.alloc_options)
+				self._replace_ring(ring, shared_ring)
+				shared_rings.append((ring, shared_ring))
+		return shared_rings
+	def _unshare_rings(self, shared_rings):
+		"""Restores the rings replaced by _share_rings"""
+		for ring, shared_ring in shared_rings:
+			self._replace_ring(shared_ring, ring)
+	def _replace_ring(self, ring, new_ring):
+		for block in self.blocks:
+			block.orings = [new_ring if r is ring else r
+			                for r in block.orings]
+			block.irings = [new_ring if r is ring else r
+			                for r in block.irings]
+			if getattr(block, 'iring', None) is ring:
+				block.iring = new_ring
+	def _run_process_group(self, blocks, fuse, results):
+		"""Runs in a child process; reports errors and the trace records to
+		the parent via the results queue"""
+		try:
+			def on_error(name, tb):
+				results.put(('error', name, tb))
+			self._run_threads(blocks, fuse, on_error)
+			records = []
+			if self.latency_trace is not None:
+				records = list(self.latency_trace._records)
+			results.put(('done', records, self.tuned_gulps))
+		except Exception:
+			results.put(('error', multiprocessing.current_process().name,
+			             traceback.format_exc()))
+	def _run_processes(self, groups, fuse):
+		results = multiprocessing.Queue()
+		processes = [multiprocessing.Process(
+			target=self._run_process_group, args=(group, fuse, results),
+			name='+'.join([block.name for block in group]))
+			for group in groups]
+		print "Launching %i processes" % len(processes)
+		try:
+			for process in processes:
+				process.start()
+			ndone = 0
+			while ndone < len(processes):
+				try:
+					result = results.get(timeout=1.)
+				except Queue.Empty:
+					for process in processes:
+						if process.exitcode not in [None, 0]:
+							raise RuntimeError("Process %s (pid %i) exited "
+							                   "with code %i" %
+							                   (process.name, process.pid,
+							                    process.exitcode))
+					continue
+				if result[0] == 'error':
+					_, name, tb = result
+					raise RuntimeError("Block %s failed:\n%s" % (name, tb))
+				ndone += 1
+				if self.latency_trace is not None:
+					self.latency_trace._records.extend(result[1])
+				self.tuned_gulps.update(result[2])
+			for process in processes:
+				process.join()
+		finally:
+			# Shut down any processes that are still running (e.g., blocks
+			#   waiting for data from a block that failed)
+			for process in processes:
+				if process.is_alive():
+					process.terminate()
+			for process in processes:
+				if process.pid is not None:
+					process.join()
+	def stats(self):
+		"""Returns a dict mapping each block's name to a dict of its
+		performance statistics (see bifrost.block_stats.FIELDS)"""
+		return dict((block.name, block.perf_stats.read())
+		            for block in self.blocks)
 	def __enter__(self):
 		thread_local.pipeline_stack.append(self)
 		return self
@@ -179,6 +634,61 @@ class Pipeline(BlockScope):
 thread_local.pipeline_stack.append(Pipeline())
 thread_local.blockscope_stack.append(get_default_pipeline())
 
+class _PlannedSequence(ReadSequence):
+	"""Stands in for a ReadSequence when planning buffers before a pipeline
+	runs (see Pipeline.plan_buffers); only the header is available, and
+	instead of resizing the ring, resize appends the (contiguous, total) no.
+	bytes it would request to requests"""
+	def __init__(self, ring, header, requests=None):
+		SequenceBase.__init__(self, ring)
+		self._header = header
+		self._requests = requests if requests is not None else []
+	@property
+	def name(self):
+		return self._header['name']
+	@property
+	def time_tag(self):
+		return self._header['time_tag']
+	def resize(self, gulp_nframe, buf_nframe=None, buffer_factor=None):
+		self._requests.append(self._buffer_nbytes(gulp_nframe, buf_nframe,
+		                                          buffer_factor))
+	def close(self):
+		pass
+
+class _FusedSequence(_PlannedSequence):
+	"""Stands in for a sequence of an intermediate ring in a fused chain
+	(see _FusedChain), whose name and time_tag are those of the sequence
+	read by the head of the chain"""
+	def __init__(self, ring, header, head_sequence):
+		_PlannedSequence.__init__(self, ring, header)
+		self._head_sequence = head_sequence
+		self._nbyte_written = 0
+	@property
+	def name(self):
+		return self._head_sequence.name
+	@property
+	def time_tag(self):
+		return self._head_sequence.time_tag
+
+class _ScratchSpanInfo(object):
+	"""Mimics the BFspan_info of a span, for spans in scratch buffers"""
+	def __init__(self, data, size, stride, offset, nringlet):
+		self.data     = data
+		self.size     = size
+		self.stride   = stride
+		self.offset   = offset
+		self.nringlet = nringlet
+
+class _FusedSpan(SpanBase):
+	"""Stands in for a span of an intermediate ring in a fused chain; its
+	data are in a scratch buffer instead"""
+	def __init__(self, sequence, info, writeable):
+		SpanBase.__init__(self, sequence.ring, sequence, writeable)
+		self._info = info
+		self.commit_nframe = self.nframe
+	def commit(self, nframe):
+		self.commit_nframe = nframe
+
 def get_ring(block_or_ring):
 	try:
 		return block_or_ring.orings[0]
@@ -187,6 +697,9 @@ def get_ring(block_or_ring):
 
 class Block(BlockScope):
 	instance_counts = defaultdict(lambda: 0)
+	# Set this in subclasses whose on_data calls OpenMP kernels, so that
+	#   Pipeline.plan_placement gives them a set of OpenMP cores
+	uses_openmp = False
 	def __init__(self, irings,
 	             name=None, # TODO: Move this into BlockScope and join to parent scope name with '/'
 	             type_=None,
@@ -198,6 +711,7 @@ class Block(BlockScope):
 		
 		self.pipeline = get_default_pipeline()
 		self.pipeline.blocks.append(self)
+		self.perf_stats = BlockStats()
 		
 		# Allow Block instances to be passed in place of rings
 		irings = [get_ring(iring) for iring in irings]
@@ -208,15 +722,33 @@ class Block(BlockScope):
 				raise ValueError("Block %s input %i's space must be accessible from one of: %s" %
 				                 (self.name, i, str(valid_spaces)))
 		self.orings = [] # Update this in subclass constructors
+		# Rings whose memory is placed near the block's core (see create_ring)
+		self._core_rings = []
 	def create_ring(self, *args, **kwargs):
-		return Ring(*args, owner=self, **kwargs)
+		ring = Ring(*args, owner=self, **kwargs)
+		if 'numa_node' not in kwargs:
+			# Note: The ring's memory is placed near the core that will be
+			#         writing to it once the pipeline runs, as the core may
+			#         not be known (or valid) yet (see Pipeline.run).
+			self._core_rings.append(ring)
+		return ring
 	def run(self):
-		#bf.affinity.set_openmp_cores(cpus) # TODO
-		core = self.core
-		if core is not None:
-			bf.affinity.set_core(core if isinstance(core, int) else core[0])
-		if self.gpu is not None:
-			bf.device.set_device(self.gpu)
+		try:
+			openmp_cores = self.openmp_cores
+			if openmp_cores is not None:
+				bf.affinity.set_openmp_cores(openmp_cores)
+			core = self.core
+			if core is not None:
+				bf.affinity.set_core(core if isinstance(core, int) else core[0])
+			if self.gpu is not None:
+				bf.device.set_device(self.gpu)
+		except Exception:
+			# This block will never open its input rings, so their writers
+			#   must not wait for it (see Pipeline._expect_readers)
+			if isinstance(self, MultiTransformBlock) and self.guarantee:
+				for iring in self.irings:
+					iring.cancel_expected_reader()
+			raise
 		self.cache_scope_hierarchy()
 		with ExitStack() as oring_stack:
 			active_orings = self.begin_writing(oring_stack, self.orings)
@@ -227,16 +759,36 @@ class Block(BlockScope):
 	def begin_writing(self, exit_stack, orings):
 		return [exit_stack.enter_context(oring.begin_writing())
 		        for oring in orings]
-	def begin_sequences(self, exit_stack, orings, oheaders, igulp_nframes):
+	def _define_output_buffers(self, oheaders, igulp_nframes):
+		"""Sets gulp_nframe in each output header and returns the no. frames
+		to buffer for each output"""
 		ogulp_nframes = self._define_output_nframes(igulp_nframes)
 		for ohdr, ogulp_nframe in zip(oheaders, ogulp_nframes):
 			ohdr['gulp_nframe'] = ogulp_nframe
 		# Note: This always specifies buffer_factor=1 on the assumption that
 		#         additional buffering is defined by the reader(s) rather
 		#         than the writer.
-		obuf_nframes = [1*ogulp_nframe for ogulp_nframe in ogulp_nframes]
+		return [1*ogulp_nframe for ogulp_nframe in ogulp_nframes]
+	def begin_sequences(self, exit_stack, orings, oheaders, igulp_nframes):
+		obuf_nframes = self._define_output_buffers(oheaders, igulp_nframes)
 		return [exit_stack.enter_context(oring.begin_sequence(ohdr,obuf_nframe))
 		        for (oring,ohdr,obuf_nframe) in zip(orings,oheaders,obuf_nframes)]
+	def _plan_output_buffers(self, oheaders, igulp_nframes):
+		"""Returns the (contiguous, total) no. bytes and no. ringlets that
+		begin_sequences would request of each output ring"""
+		obuf_nframes = self._define_output_buffers(oheaders, igulp_nframes)
+		onbytes = []
+		for ohdr, obuf_nframe in zip(oheaders, obuf_nframes):
+			tensor = parse_tensor_header(ohdr)
+			onbytes.append((ohdr['gulp_nframe']*tensor['frame_nbyte'],
+			                obuf_nframe*tensor['frame_nbyte'],
+			                tensor['nringlet']))
+		return onbytes
+	def _plan_sequences(self, iseqs):
+		"""Returns the output headers for the first sequence, given stand-ins
+		for the input sequences, and the (contiguous, total) no. bytes and no.
+		ringlets that would be requested of each output ring"""
+		raise NotImplementedError
 	def reserve_spans(self, exit_stack, oseqs, ispans):
 		igulp_nframes = [span.nframe for span in ispans]
 		ogulp_nframes = self._define_output_nframes(igulp_nframes)
@@ -262,6 +814,8 @@ class SourceBlock(Block):
 		self.orings = [self.create_ring(space=default_space)]
 		self._seq_count = 0
 	def main(self, orings):
+		perf_stats = self.perf_stats
+		tracer     = self.pipeline.latency_trace
 		for sourcename in self.sourcenames:
 			with self.create_reader(sourcename) as ireader:
 				oheaders = self.on_sequence(ireader, sourcename)
@@ -271,16 +825,42 @@ class SourceBlock(Block):
 				self._seq_count += 1
 				with ExitStack() as oseq_stack:
 					oseqs = self.begin_sequences(oseq_stack, orings, oheaders, igulp_nframes=[])
+					perf_stats.begin_sequence()
+					if tracer is not None:
+						otime_tags = [oseq.time_tag for oseq in oseqs]
+					prev_time = time.time()
 					while True:
 						with ExitStack() as ospan_stack:
 							ospans = self.reserve_spans(ospan_stack, oseqs, ispans=[])
+							cur_time = time.time()
+							reserve_time = cur_time - prev_time
+							prev_time = cur_time
 							ostrides = self.on_data(ireader, ospans)
 							bf.device.stream_synchronize()
 							for ospan, ostride in zip(ospans, ostrides):
 								ospan.commit(ostride)
-							# TODO: Is this an OK way to detect end-of-data?
-							if any([ostride==0 for ostride in ostrides]):
-								break
+						cur_time = time.time()
+						process_time = cur_time - prev_time
+						prev_time = cur_time
+						nframe_out, nbyte_out = _span_totals(ospans, ostrides)
+						perf_stats.record_gulp(0, nframe_out, 0, nbyte_out,
+						                       0., reserve_time, process_time)
+						if tracer is not None:
+							tracer.record_gulp(self.name, cur_time,
+							                   0., reserve_time, process_time,
+							                   [], [], ospans, otime_tags,
+							                   ostrides)
+						# TODO: Is this an OK way to detect end-of-data?
+						if any([ostride==0 for ostride in ostrides]):
+							break
+	def _plan_sequences(self, iseqs):
+		sourcename = self.sourcenames[0]
+		with self.create_reader(sourcename) as ireader:
+			oheaders = self.on_sequence(ireader, sourcename)
+		for ohdr in oheaders:
+			if 'time_tag' not in ohdr:
+				ohdr['time_tag'] = self._seq_count
+		return oheaders, self._plan_output_buffers(oheaders, igulp_nframes=[])
 	def define_output_nframes(self, _):
 		"""Return output nframe for each output, given input_nframes.
 		"""
@@ -301,6 +881,23 @@ class SourceBlock(Block):
 		raise NotImplementedError
 
 
+def _span_totals(spans, nframes=None):
+	"""Returns the total no. frames and bytes in spans (or in the first
+	nframes frames of each span)"""
+	if nframes is None:
+		nframes = [span.nframe for span in spans]
+	nbyte = sum([nframe * span.frame_nbyte * span._nringlet
+	             for span, nframe in zip(spans, nframes)])
+	return sum(nframes), nbyte
+
+def _complete_ostrides(ostrides, ospans):
+	"""Replaces None (meaning complete consumption) in the value returned
+	by on_data with the no. frames in each output span"""
+	if ostrides is None:
+		ostrides = [ospan.nframe for ospan in ospans]
+	return [ostride if ostride is not None else ospan.nframe
+	        for (ostride,ospan) in zip(ostrides,ospans)]
+
 def _span_slice(soft_slice):
 	start = soft_slice.start or 0
 	return slice(start,
@@ -317,6 +914,10 @@ class MultiTransformBlock(Block):
 		               for iring in self.irings]
 		self._seq_count = 0
 	def main(self, orings):
+		perf_stats = self.perf_stats
+		tracer     = self.pipeline.latency_trace
+		tuner      = GulpTuner() if self.pipeline._autotune else None
+		tuning     = False
 		for iseqs in izip(*[iring.read(guarantee=self.guarantee)
 		                    for iring in self.irings]):
 			oheaders, islices = self._on_sequence(iseqs)
@@ -325,39 +926,27 @@ class MultiTransformBlock(Block):
 					ohdr['time_tag'] = self._seq_count
 			self._seq_count += 1
 			
-			# Allow passing None to mean slice(gulp_nframe)
-			if islices is None:
-				islices = [None]*len(self.irings)
-			default_igulp_nframes = [self.gulp_nframe or iseq.header['gulp_nframe']
-			                        for iseq in iseqs]
-			islices = [islice or slice(igulp_nframe)
-			           for (islice,igulp_nframe) in
-			           zip(islices,default_igulp_nframes)]
-			
-			islices = [_span_slice(slice_) for slice_ in islices]
-			for iseq, islice in zip(iseqs, islices):
-				if self.buffer_factor is None:
-					src_block = iseq.ring.owner
-					if src_block is not None and self.is_fused_with(src_block):
-						buffer_factor = 1
-					else:
-						buffer_factor = None
-				else:
-					buffer_factor = self.buffer_factor
-				iseq.resize(gulp_nframe=(islice.stop - islice.start),
-				            buf_nframe=self.buffer_nframe,
-				            buffer_factor=buffer_factor)
-			
+			tuning = tuner is not None and not tuner.done
+			islices = self._resize_input_buffers(iseqs, islices,
+			                                     tuner if tuning else None)
 			igulp_nframes = [islice.stop - islice.start for islice in islices]
+			if tuning:
+				# Note: The headers advertise the default gulp, not the
+				#         candidate currently being tried.
+				igulp_nframes = [islice.stop - islice.start
+				                 for islice in self._unscaled_islices]
 			
 			with ExitStack() as oseq_stack:
 				oseqs = self.begin_sequences(oseq_stack, orings, oheaders, igulp_nframes)
+				if tuning:
+					self._resize_output_buffers(oseqs, tuner.max_scale)
+				perf_stats.begin_sequence()
+				if tracer is not None:
+					itime_tags = [iseq.time_tag for iseq in iseqs]
+					otime_tags = [oseq.time_tag for oseq in oseqs]
 				prev_time = time.time()
-				for ispans in izip(*[iseq.read(islice.stop - islice.start,
-				                              islice.step,
-				                              islice.start)
-				                    for (iseq,islice)
-				                    in zip(iseqs,islices)]):
+				for ispans in self._read_gulps(iseqs, islices,
+				                               tuner if tuning else None):
 					cur_time = time.time()
 					acquire_time = cur_time - prev_time
 					prev_time = cur_time
@@ -372,19 +961,135 @@ class MultiTransformBlock(Block):
 						ostrides = self._on_data(ispans, ospans)
 						# TODO: // Default to not spinning the CPU: cudaSetDeviceFlags(cudaDeviceScheduleBlockingSync);
 						bf.device.stream_synchronize()
-						# Allow returning None to indicate complete consumption
-						if ostrides is None:
-							ostrides = [ospan.nframe for ospan in ospans]
-						ostrides = [ostride if ostride is not None else ospan.nframe
-						            for (ostride,ospan) in zip(ostrides,ospans)]
+						ostrides = _complete_ostrides(ostrides, ospans)
 						for ospan, ostride in zip(ospans, ostrides):
 							ospan.commit(ostride)
 					cur_time = time.time()
 					process_time = cur_time - prev_time
 					prev_time = cur_time
-					# TODO: Do something with *_time variables (e.g., WAMP PUB)
-					#total_time = acquire_time + reserve_time + process_time
-					#print acquire_time / total_time, reserve_time / total_time, process_time / total_time
+					nframe_in,  nbyte_in  = _span_totals(ispans)
+					nframe_out, nbyte_out = _span_totals(ospans, ostrides)
+					perf_stats.record_gulp(nframe_in, nframe_out,
+					                       nbyte_in, nbyte_out,
+					                       acquire_time, reserve_time,
+					                       process_time)
+					if tracer is not None:
+						tracer.record_gulp(self.name, cur_time,
+						                   acquire_time, reserve_time,
+						                   process_time,
+						                   ispans, itime_tags,
+						                   ospans, otime_tags, ostrides)
+					if tuning and not tuner.done:
+						stride = scale_slice(self._unscaled_islices[0],
+						                     tuner.scale).step
+						tuner.record_gulp(min(stride, ispans[0].nframe),
+						                  process_time)
+						if tuner.done:
+							self._finish_tuning(tuner)
+		if tuning and not tuner.done:
+			tuner.finish()
+			self._finish_tuning(tuner)
+	def _read_gulps(self, iseqs, islices, tuner=None):
+		"""Iterates over the input spans of each gulp, switching to the gulp
+		scale of tuner (if given) whenever it changes"""
+		readers = [iseq.read(islice.stop - islice.start,
+		                     islice.step,
+		                     islice.start)
+		           for (iseq,islice) in zip(iseqs,islices)]
+		scale = tuner.scale if tuner is not None else None
+		ispans = [reader.next() for reader in readers]
+		while True:
+			yield ispans
+			if tuner is not None and tuner.scale != scale:
+				scale = tuner.scale
+				islices = [scale_slice(islice, scale)
+				           for islice in self._unscaled_islices]
+				ispans = [reader.send((islice.stop - islice.start, islice.step))
+				          for (reader,islice) in zip(readers,islices)]
+			else:
+				ispans = [reader.next() for reader in readers]
+	def _gulp_scale_valid(self, islices, scale):
+		"""Returns whether the canonical input slices can be scaled by scale
+		(see bifrost.gulp_tuner.scale_slice)"""
+		scaled = [scale_slice(islice, scale) for islice in islices]
+		if any([islice is None for islice in scaled]):
+			return False
+		try:
+			self._define_output_nframes([islice.stop - islice.start
+			                             for islice in scaled])
+		except (ValueError, AssertionError):
+			return False
+		return True
+	def _resize_output_buffers(self, oseqs, scale):
+		"""Resizes the output rings to fit the gulps produced from input
+		gulps of the given scale"""
+		igulp_nframes = [islice.stop - islice.start for islice in
+		                 [scale_slice(islice, scale)
+		                  for islice in self._unscaled_islices]]
+		ogulp_nframes = self._define_output_nframes(igulp_nframes)
+		for oseq, ogulp_nframe in zip(oseqs, ogulp_nframes):
+			tensor = oseq.tensor
+			oseq.ring.resize(ogulp_nframe*tensor['frame_nbyte'],
+			                 2*ogulp_nframe*tensor['frame_nbyte'],
+			                 tensor['nringlet'])
+	def _finish_tuning(self, tuner):
+		scale  = tuner.best_scale
+		nframe = scale_slice(self._unscaled_islices[0], scale).step
+		self.pipeline.gulp_scales[self.name] = scale
+		self.pipeline.tuned_gulps[self.name] = {
+			'gulp_scale':  scale,
+			'gulp_nframe': nframe,
+			'throughputs': dict((str(s), fps)
+			                    for s, fps in tuner.throughputs.items())}
+		print "Tuned gulp of block %s: %gx default (%i frames)" % (
+			self.name, scale, nframe)
+	def _resize_input_buffers(self, iseqs, islices, tuner=None):
+		"""Resizes the input rings to suit the requested input slices and
+		returns the slices in canonical form, scaled by the block's gulp
+		scale (or, if tuner is given, by its current candidate scale, with
+		the rings sized for its largest candidate)"""
+		# Allow passing None to mean slice(gulp_nframe)
+		if islices is None:
+			islices = [None]*len(self.irings)
+		default_igulp_nframes = [self.gulp_nframe or iseq.header['gulp_nframe']
+		                        for iseq in iseqs]
+		islices = [islice or slice(igulp_nframe)
+		           for (islice,igulp_nframe) in
+		           zip(islices,default_igulp_nframes)]
+		
+		islices = [_span_slice(slice_) for slice_ in islices]
+		self._unscaled_islices = islices
+		if tuner is not None:
+			tuner.set_candidates([scale for scale in tuner.scales
+			                      if self._gulp_scale_valid(islices, scale)])
+			scale, buf_scale = tuner.scale, tuner.max_scale
+		else:
+			scale = self.pipeline.gulp_scales.get(self.name, 1)
+			if not self._gulp_scale_valid(islices, scale):
+				print "WARNING: Ignoring invalid gulp scale %g for block %s" % (
+					scale, self.name)
+				scale = 1
+			buf_scale = scale
+		buf_islices = [scale_slice(islice, buf_scale) for islice in islices]
+		islices     = [scale_slice(islice, scale)     for islice in islices]
+		for iseq, islice in zip(iseqs, buf_islices):
+			if self.buffer_factor is None:
+				src_block = iseq.ring.owner
+				if src_block is not None and self.is_fused_with(src_block):
+					buffer_factor = 1
+				else:
+					buffer_factor = None
+			else:
+				buffer_factor = self.buffer_factor
+			iseq.resize(gulp_nframe=(islice.stop - islice.start),
+			            buf_nframe=self.buffer_nframe,
+			            buffer_factor=buffer_factor)
+		return islices
+	def _plan_sequences(self, iseqs):
+		oheaders, islices = self._on_sequence(iseqs)
+		islices = self._resize_input_buffers(iseqs, islices)
+		igulp_nframes = [islice.stop - islice.start for islice in islices]
+		return oheaders, self._plan_output_buffers(oheaders, igulp_nframes)
 	def _on_sequence(self, iseqs):
 		return self.on_sequence(iseqs)
 	def _on_data(self, ispans, ospans):
@@ -464,3 +1169,174 @@ class SinkBlock(MultiTransformBlock):
 	def on_data(self, ispan):
 		"""Return nothing"""
 		raise NotImplementedError
+
+class _FusedChain(MultiTransformBlock):
+	"""Runs a chain of blocks from a fused BlockScope in a single thread
+
+	The head of the chain reads its input ring and the tail writes its
+	output ring as usual, but in between, each gulp is passed directly from
+	one block's on_data to the next in scratch buffers, without going
+	through the intermediate rings. This saves a ring round trip, a thread
+	handoff and (for device memory) a stream synchronisation per block.
+
+	A block that specifies an input slice (e.g., to read overlapping gulps)
+	needs its input ring, so if one does so for the first sequence, the
+	chain is cut short before it and that block and those after it are run
+	separately in threads of their own.
+	"""
+	def __init__(self, blocks):
+		# Note: Block.__init__ is bypassed so that the chain is not added to
+		#         the pipeline as another block. Settings such as gulp_nframe
+		#         and core are inherited from the head of the chain.
+		BlockScope.__init__(self, name='+'.join([block.name for block in blocks]))
+		if self._parent_scope is not None:
+			self._parent_scope._children.remove(self)
+		self._parent_scope = blocks[0]
+		self.blocks     = blocks
+		self.type       = self.__class__.__name__
+		self.name       = self._name
+		self.pipeline   = blocks[0].pipeline
+		self.irings     = blocks[0].irings
+		self.orings     = blocks[-1].orings
+		self.guarantee  = blocks[0].guarantee
+		self.perf_stats = BlockStats()
+		self._seq_count = 0
+		# Note: These are separate from the scope's shared TempStorage,
+		#         which the blocks may use themselves during on_data.
+		self._scratch = [TempStorage(block.orings[0].space)
+		                 for block in blocks[:-1]]
+		self._sequences = []
+		self._writing_stack = None
+		self._writers = None
+		self._split_threads = []
+		self._split_errors = []
+	def run(self):
+		try:
+			Block.run(self)
+		finally:
+			# Note: The blocks split off from the chain finish once the
+			#         chain has ended writing, when Block.run returns.
+			for thread in self._split_threads:
+				thread.join()
+		for name, tb in self._split_errors:
+			raise RuntimeError("Block %s failed:\n%s" % (name, tb))
+	def begin_writing(self, exit_stack, orings):
+		# Note: Writing begins with the first sequence, once it is known which
+		#         rings the chain writes (see _split).
+		self._writing_stack = exit_stack
+		return []
+	def _begin_writing(self):
+		if self._writers is None:
+			self._writers = Block.begin_writing(self, self._writing_stack,
+			                                    self.orings)
+		return self._writers
+	def begin_sequences(self, exit_stack, orings, oheaders, igulp_nframes):
+		return MultiTransformBlock.begin_sequences(self, exit_stack,
+		                                           self._begin_writing(),
+		                                           oheaders, igulp_nframes)
+	def main(self, orings):
+		try:
+			MultiTransformBlock.main(self, orings)
+		finally:
+			# Ensure the output rings' readers see the end of writing
+			self._begin_writing()
+	def _split(self, i):
+		"""Cuts the chain short before its i'th block, running that block
+		and those after it separately"""
+		if self._writers is not None:
+			raise ValueError("Block %s specifies an input slice, but only "
+			                 "did so after the first sequence, so cannot be "
+			                 "split from fused chain %s" %
+			                 (self.blocks[i].name, self.name))
+		print "WARNING: Block %s specifies an input slice, so cannot be fused with %s; running it and the blocks after it separately" % (
+			self.blocks[i].name, self.blocks[i-1].name)
+		split_blocks = self.blocks[i:]
+		self.blocks   = self.blocks[:i]
+		self.orings   = self.blocks[-1].orings
+		self._scratch = self._scratch[:i-1]
+		for block in split_blocks:
+			thread = threading.Thread(target=self._run_split_block,
+			                          args=(block,), name=block.name)
+			thread.start()
+			self._split_threads.append(thread)
+	def _run_split_block(self, block):
+		try:
+			block.run()
+		except Exception:
+			self._split_errors.append((block.name, traceback.format_exc()))
+	def _on_sequence(self, iseqs):
+		head = self.blocks[0]
+		oheaders, islices = head._on_sequence(iseqs)
+		if islices[0] is not None:
+			islice = _span_slice(islices[0])
+			nframe = islice.stop - islice.start
+		else:
+			nframe = self.gulp_nframe or iseqs[0].header['gulp_nframe']
+		self._sequences = []
+		for i in xrange(1, len(self.blocks)):
+			prev_block, block = self.blocks[i-1], self.blocks[i]
+			nframe = prev_block._define_output_nframes([nframe])[0]
+			oheaders[0]['gulp_nframe'] = nframe
+			iseq = _FusedSequence(block.irings[0], oheaders[0], iseqs[0])
+			block_oheaders, block_islices = block._on_sequence([iseq])
+			if block_islices[0] is not None:
+				self._split(i)
+				break
+			self._sequences.append(iseq)
+			oheaders = block_oheaders
+		for block in self.blocks:
+			block.perf_stats.begin_sequence()
+		return oheaders, islices
+	def _define_output_nframes(self, input_nframes):
+		nframes = input_nframes
+		for block in self.blocks:
+			nframes = block._define_output_nframes(nframes)
+		return nframes
+	def _reserve_scratch(self, exit_stack, i, nframe):
+		"""Returns a span for the output of the i'th block in the chain"""
+		seq = self._sequences[i]
+		nbyte    = nframe * seq._get_span_layout()[0]
+		nringlet = seq.tensor['nringlet']
+		scratch  = exit_stack.enter_context(
+			self._scratch[i].allocate(max(nbyte * nringlet, 1)))
+		info = _ScratchSpanInfo(scratch.ptr, nbyte, nbyte,
+		                        seq._nbyte_written, nringlet)
+		return _FusedSpan(seq, info, writeable=True)
+	def _on_data(self, ispans, ospans):
+		nblock = len(self.blocks)
+		with ExitStack() as scratch_stack:
+			for i, block in enumerate(self.blocks):
+				start_time = time.time()
+				if i == nblock - 1:
+					block_ospans = ospans
+				else:
+					nframe = block._define_output_nframes(
+						[span.nframe for span in ispans])[0]
+					block_ospans = [self._reserve_scratch(scratch_stack,
+					                                      i, nframe)]
+				ostrides = _complete_ostrides(block._on_data(ispans,
+				                                             block_ospans),
+				                              block_ospans)
+				if i < nblock - 1:
+					space = block_ospans[0].ring.space
+					if (bf.core.cuda_enabled() and
+					    bf.memory.space_accessible(space, ['system'])):
+						# The next block may read the data from the host
+						bf.device.stream_synchronize()
+				nframe_in,  nbyte_in  = _span_totals(ispans)
+				nframe_out, nbyte_out = _span_totals(block_ospans, ostrides)
+				block.perf_stats.record_gulp(nframe_in, nframe_out,
+				                             nbyte_in, nbyte_out,
+				                             0., 0., time.time() - start_time)
+				if i < nblock - 1:
+					# Pass the committed frames on to the next block
+					ospan = block_ospans[0]
+					seq   = ospan.sequence
+					nbyte = ostrides[0] * ospan.frame_nbyte
+					info  = _ScratchSpanInfo(ospan._data_ptr, nbyte,
+					                         ospan._stride_bytes,
+					                         seq._nbyte_written,
+					                         ospan._nringlet)
+					seq._nbyte_written += nbyte
+					ispans = [_FusedSpan(seq, info, writeable=False)]
+		return ostrides
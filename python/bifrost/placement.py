@@ -0,0 +1,276 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Automatic placement of pipeline blocks onto CPU cores
+
+The CPU topology (sockets, physical cores and their hyperthreads, and NUMA
+nodes) is read from /sys. plan_placement then assigns each block a core:
+
+  * Blocks connected by rings are kept on the same socket where possible,
+    so that data stay in the socket's cache and local memory.
+  * Hot (busy) blocks each get a physical core to themselves; cold blocks
+    are paired up on the hyperthreads of a shared physical core.
+  * Blocks that use OpenMP kernels also get a set of spare physical cores
+    on their socket for their OpenMP threads.
+
+See also Pipeline.plan_placement.
+"""
+
+import os
+from collections import OrderedDict
+
+def parse_cpu_list(text):
+	"""Parses a list of CPUs in the kernel's format (e.g., '0-3,8,10-11')"""
+	cpus = []
+	for part in text.strip().split(','):
+		if not part:
+			continue
+		if '-' in part:
+			first, last = part.split('-')
+			cpus.extend(range(int(first), int(last) + 1))
+		else:
+			cpus.append(int(part))
+	return cpus
+
+def _read(path):
+	with open(path, 'r') as f:
+		return f.read().strip()
+
+def _allowed_cpus(proc_status='/proc/self/status'):
+	"""Returns the CPUs this process may run on, or None if unknown"""
+	try:
+		with open(proc_status, 'r') as f:
+			for line in f:
+				if line.startswith('Cpus_allowed_list:'):
+					return parse_cpu_list(line.split(':', 1)[1])
+	except IOError:
+		pass
+	return None
+
+class CpuTopology(object):
+	"""The CPUs available for placing blocks
+
+	cpus is a list of (cpu, socket, core_id, numa_node) tuples, where
+	core_id identifies the physical core within its socket.
+	"""
+	def __init__(self, cpus):
+		self.cpus = sorted(cpus)
+		self._sockets    = dict((cpu, socket)  for cpu, socket, _, _ in self.cpus)
+		self._core_ids   = dict((cpu, core_id) for cpu, _, core_id, _ in self.cpus)
+		self._numa_nodes = dict((cpu, node)    for cpu, _, _, node in self.cpus)
+		self._cores = OrderedDict()
+		for cpu, socket, core_id, _ in self.cpus:
+			self._cores.setdefault((socket, core_id), []).append(cpu)
+	def sockets(self):
+		return sorted(set(self._sockets.values()))
+	def cores(self, socket):
+		"""Returns the physical cores of socket, each as a list of the CPU
+		numbers of its hyperthreads"""
+		return [threads for (core_socket, _), threads in self._cores.items()
+		        if core_socket == socket]
+	def socket(self, cpu):
+		return self._sockets[cpu]
+	def numa_node(self, cpu):
+		return self._numa_nodes[cpu]
+	def siblings(self, cpu):
+		"""Returns the CPUs (hyperthreads) of cpu's physical core"""
+		return self._cores[(self._sockets[cpu], self._core_ids[cpu])]
+	@property
+	def nnuma_node(self):
+		return len(set([node for node in self._numa_nodes.values()
+		                if node is not None]))
+
+def read_cpu_topology(sysfs='/sys', allowed_cpus=None):
+	"""Reads the topology of the online CPUs from sysfs
+
+	Only the CPUs in allowed_cpus (by default, those in this process's
+	affinity mask) are included.
+	"""
+	cpu_dir = os.path.join(sysfs, 'devices/system/cpu')
+	cpus = parse_cpu_list(_read(os.path.join(cpu_dir, 'online')))
+	if allowed_cpus is None:
+		allowed_cpus = _allowed_cpus()
+	if allowed_cpus is not None:
+		allowed_cpus = set(allowed_cpus)
+		cpus = [cpu for cpu in cpus if cpu in allowed_cpus]
+	numa_nodes = {}
+	node_dir = os.path.join(sysfs, 'devices/system/node')
+	if os.path.isdir(node_dir):
+		for name in os.listdir(node_dir):
+			if name.startswith('node') and name[4:].isdigit():
+				cpulist = os.path.join(node_dir, name, 'cpulist')
+				for cpu in parse_cpu_list(_read(cpulist)):
+					numa_nodes[cpu] = int(name[4:])
+	entries = []
+	for cpu in cpus:
+		topo_dir = os.path.join(cpu_dir, 'cpu%i' % cpu, 'topology')
+		try:
+			socket  = int(_read(os.path.join(topo_dir, 'physical_package_id')))
+			core_id = int(_read(os.path.join(topo_dir, 'core_id')))
+		except (IOError, ValueError):
+			socket, core_id = 0, cpu
+		entries.append((cpu, socket, core_id, numa_nodes.get(cpu)))
+	return CpuTopology(entries)
+
+def _connected_groups(names, edges):
+	"""Returns the names grouped into connected components, in order"""
+	parent = dict((name, name) for name in names)
+	def find(name):
+		while parent[name] != name:
+			parent[name] = parent[parent[name]]
+			name = parent[name]
+		return name
+	for a, b in edges:
+		parent[find(a)] = find(b)
+	groups = OrderedDict()
+	for name in names:
+		groups.setdefault(find(name), []).append(name)
+	return groups.values()
+
+def plan_placement(names, edges, topology, fixed=None, hot=None,
+                   openmp=(), openmp_nthread=None):
+	"""Assigns a CPU core to each of a set of units (e.g., blocks)
+
+	names:          Unit names, in pipeline order
+	edges:          (producer, consumer) name pairs, one per ring connection
+	topology:       A CpuTopology
+	fixed:          {name: cpu} for units that are already pinned
+	hot:            Names of units that should each get a whole physical
+	                  core (default: all of them)
+	openmp:         Names of units that need a set of OpenMP cores
+	openmp_nthread: No. OpenMP threads per unit (default: share out the
+	                  spare physical cores of the socket)
+
+	Returns an OrderedDict mapping each name to a dict with keys 'core',
+	'socket', 'numa_node', 'hot', 'fixed' and 'openmp_cores' (None for
+	units not in openmp).
+	"""
+	fixed = fixed or {}
+	hot = set(names if hot is None else hot)
+	sockets = topology.sockets()
+	if not len(sockets):
+		raise ValueError("No CPUs available for placement")
+	free = dict((socket, [list(threads) for threads in topology.cores(socket)])
+	            for socket in sockets)
+	load = dict((cpu, 0) for cpu, _, _, _ in topology.cpus)
+	for name, cpu in fixed.items():
+		if cpu in load:
+			load[cpu] += 1
+			socket = topology.socket(cpu)
+			free[socket] = [threads for threads in free[socket]
+			                if cpu not in threads]
+	smt = max([len(threads) for socket in sockets
+	           for threads in topology.cores(socket)]) > 1
+	def cost(name):
+		# Cold units pair up on the hyperthreads of a core
+		return 1. if name in hot or not smt else 0.5
+	# Choose a socket for each unit, keeping connected units together
+	remaining = dict((socket, float(len(free[socket]))) for socket in sockets)
+	unit_socket = {}
+	for group in _connected_groups(names, edges):
+		units = [name for name in group if name not in fixed]
+		demand = sum([cost(name) for name in units])
+		preferred = set([topology.socket(fixed[name]) for name in group
+		                 if name in fixed and fixed[name] in load])
+		socket = sorted(sockets, key=lambda s: (not (s in preferred and
+		                                             remaining[s] >= demand),
+		                                        -remaining[s], s))[0]
+		for name in units:
+			if remaining[socket] < cost(name):
+				# Spill over to the socket with the most room (if any)
+				best = sorted(sockets, key=lambda s: (-remaining[s], s))[0]
+				if remaining[best] >= cost(name):
+					socket = best
+			unit_socket[name] = socket
+			remaining[socket] -= cost(name)
+	# Choose a core for each unit within its socket
+	shared = dict((socket, []) for socket in sockets)
+	def least_loaded(socket):
+		cpus = [cpu for threads in topology.cores(socket) for cpu in threads]
+		return sorted(cpus, key=lambda cpu: (sum([load[c] for c in
+		                                          topology.siblings(cpu)]),
+		                                     load[cpu], cpu))[0]
+	plan = OrderedDict()
+	for name in names:
+		if name in fixed:
+			cpu = fixed[name]
+		else:
+			socket = unit_socket[name]
+			if name in hot:
+				if len(free[socket]):
+					cpu = free[socket].pop(0)[0]
+				else:
+					cpu = least_loaded(socket)
+			else:
+				if len(shared[socket]):
+					cpu = shared[socket].pop(0)
+				elif len(free[socket]):
+					threads = free[socket].pop(0)
+					cpu = threads[0]
+					shared[socket].extend(threads[1:])
+				else:
+					cpu = least_loaded(socket)
+			load[cpu] += 1
+		plan[name] = {'core':         cpu,
+		              'socket':       topology.socket(cpu) if cpu in load else None,
+		              'numa_node':    topology.numa_node(cpu) if cpu in load else None,
+		              'hot':          name in hot,
+		              'fixed':        name in fixed,
+		              'openmp_cores': None}
+	# Share out the remaining physical cores between the OpenMP units
+	for socket in sockets:
+		units = [name for name in names
+		         if name in openmp and plan[name]['socket'] == socket]
+		if not len(units):
+			continue
+		spare = [threads[0] for threads in free[socket]]
+		if openmp_nthread is not None:
+			nextra = openmp_nthread - 1
+		else:
+			nextra = len(spare) // len(units)
+		for name in units:
+			extra, spare = spare[:nextra], spare[nextra:]
+			plan[name]['openmp_cores'] = [plan[name]['core']] + extra
+	return plan
+
+def format_placement(plan):
+	"""Returns a table describing a plan returned by plan_placement"""
+	lines = ['%-32s %5s %6s %4s %-4s %s' % ('BLOCK', 'CORE', 'SOCKET',
+	                                         'NUMA', 'HOT', 'OPENMP CORES')]
+	for name, entry in plan.items():
+		openmp_cores = entry['openmp_cores']
+		lines.append('%-32s %5s %6s %4s %-4s %s' % (
+			name[:32] + ('*' if entry['fixed'] else ''),
+			entry['core'],
+			'-' if entry['socket']    is None else entry['socket'],
+			'-' if entry['numa_node'] is None else entry['numa_node'],
+			'yes' if entry['hot'] else 'no',
+			'-' if openmp_cores is None else
+			','.join([str(cpu) for cpu in openmp_cores])))
+	lines.append('(* = core set by the user)')
+	return '\n'.join(lines)
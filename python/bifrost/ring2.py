@@ -30,17 +30,16 @@
 #         Also consider merging some of the logic into the backend
 
 from libbifrost import _bf, _check, _get, _string2space, _space2string
+from libbifrost import WouldBlock
 from DataType import DataType
 from ndarray import ndarray
+from memory import _malloc_flags, _malloc_options
+from sequence_header import encode_header, decode_header, decode_tensor
 
 import ctypes
 import numpy as np
-
-try:
-	import simplejson as json
-except ImportError:
-	print "WARNING: Install simplejson for better performance"
-	import json
+import os
+import json
 
 # TODO: Should probably move this elsewhere (e.g., utils)
 def split_shape(shape):
@@ -55,19 +54,203 @@ def split_shape(shape):
 		ringlet_shape.append(dim)
 	raise ValueError("No time dimension (-1) found in shape")
 
+def parse_tensor_header(header):
+	"""Returns the layout of the frames described by a sequence header
+	(dtype, ringlet/frame shapes, nringlet and frame_nbyte)"""
+	shape = header['_tensor']['shape']
+	ringlet_shape, frame_shape = split_shape(shape)
+	nringlet       = reduce(lambda x,y:x*y, ringlet_shape, 1)
+	frame_nelement = reduce(lambda x,y:x*y, frame_shape,   1)
+	dtype = header['_tensor']['dtype']
+	nbit = DataType(dtype).itemsize_bits
+	assert(nbit % 8 == 0)
+	frame_nbyte = frame_nelement * nbit // 8
+	tensor = {}
+	tensor['dtype']         = dtype
+	tensor['ringlet_shape'] = ringlet_shape
+	tensor['nringlet']      = nringlet
+	tensor['frame_shape']   = frame_shape
+	tensor['frame_nbyte']   = frame_nbyte
+	tensor['dtype_nbyte']   = nbit // 8
+	return tensor
+
+def frame_time_scale(header):
+	"""Returns the time (in seconds) of the first frame of a sequence and the
+	time between its frames, or None if its header does not give them"""
+	tensor = header['_tensor']
+	if tensor.get('scales') is None:
+		return None
+	frame_axis = list(tensor['shape']).index(-1)
+	scale = tensor['scales'][frame_axis]
+	if scale is None:
+		return None
+	time0, frame_period = scale
+	units = tensor.get('units')
+	if units is not None and units[frame_axis] not in (None, 's'):
+		from units import convert_units
+		try:
+			time0        = convert_units(time0,        units[frame_axis], 's')
+			frame_period = convert_units(frame_period, units[frame_axis], 's')
+		except Exception:
+			# The frame axis is not a time axis
+			return None
+	if frame_period <= 0:
+		return None
+	return time0, frame_period
+
+def _string2wait_policy(s):
+	lut = {'block': _bf.BF_RING_WAIT_BLOCK,
+	       'spin':  _bf.BF_RING_WAIT_SPIN,
+	       'poll':  _bf.BF_RING_WAIT_POLL}
+	if s not in lut:
+		raise KeyError("Invalid wait policy '"+str(s)+"'.\nValid policies: "+str(lut.keys()))
+	return lut[s]
+def _wait_policy2string(i):
+	return {_bf.BF_RING_WAIT_BLOCK: 'block',
+	        _bf.BF_RING_WAIT_SPIN:  'spin',
+	        _bf.BF_RING_WAIT_POLL:  'poll'}[i]
+
+def _string2overrun_policy(s):
+	lut = {'block': _bf.BF_RING_OVERRUN_BLOCK,
+	       'drop':  _bf.BF_RING_OVERRUN_DROP,
+	       'lag':   _bf.BF_RING_OVERRUN_LAG}
+	if s not in lut:
+		raise KeyError("Invalid overrun policy '"+str(s)+"'.\nValid policies: "+str(lut.keys()))
+	return lut[s]
+
 class Ring(object):
+	"""A ring buffer
+
+	If shared is True, the ring is created in shared memory and other
+	processes can attach to it by name using Ring.attach(name).
+
+	If mirrored is True (the default), system-space rings map their memory
+	twice back-to-back so that spans crossing the end of the buffer need
+	no ghost-region copies.
+
+	wait_policy controls how readers and writers wait for each other:
+	  'block' sleeps until notified (the default), 'spin' busy-waits for
+	  spin_count pause iterations before sleeping, and 'poll' busy-waits
+	  indefinitely. Spinning reduces handoff latency for small gulps at the
+	  cost of keeping a core busy.
+
+	If spsc is True, the ring is put in single-producer/single-consumer
+	mode, in which spans are passed between its (single) writer and
+	(single) reader without taking the ring's lock where possible. Only one
+	sequence may then be open for reading at a time.
+
+	hugepages, prefault, mlock and numa_node control the placement of a
+	system-space ring's buffer, as for bifrost.memory.raw_malloc.
+	"""
 	instance_count = 0
-	def __init__(self, space='system', name=None, owner=None):
+	def __init__(self, space='system', name=None, owner=None, shared=False,
+	             mirrored=True, wait_policy='block', spin_count=10000,
+	             spsc=False, hugepages=None, prefault=False, mlock=False,
+	             numa_node=None):
 		self.space = space
-		self.obj = _get(_bf.RingCreate(space=_string2space(self.space)), retarg=0)
 		if name is None:
 			name = 'ring_%i' % Ring.instance_count
+			if shared:
+				# Shared ring names must be unique across processes
+				name += '_%i' % os.getpid()
 			Ring.instance_count += 1
+		if shared:
+			self.obj = _get(_bf.RingCreateShared(name=name,
+			                                     space=_string2space(self.space)),
+			                retarg=0)
+		else:
+			self.obj = _get(_bf.RingCreate(space=_string2space(self.space)), retarg=0)
+		if not mirrored:
+			_check(_bf.RingSetMirroring(self.obj, False))
+		if wait_policy != 'block':
+			self.set_wait_policy(wait_policy, spin_count)
+		if spsc:
+			_check(_bf.RingSetSPSC(self.obj, True))
+		alloc_flags = _malloc_flags(hugepages, prefault, mlock)
+		if alloc_flags != _bf.BF_MALLOC_DEFAULT or numa_node is not None:
+			_check(_bf.RingSetAllocOptions(self.obj, alloc_flags,
+			                               -1 if numa_node is None else numa_node))
 		self.name = name
 		self.owner = owner
+		self.shared = shared
+	@classmethod
+	def attach(cls, name, owner=None):
+		"""Attaches to a shared ring created by another process"""
+		ring = cls.__new__(cls)
+		ring.obj = _get(_bf.RingAttachShared(name=name), retarg=0)
+		ring.space = _space2string(_get(_bf.RingGetSpace(ring.obj)))
+		ring.name = name
+		ring.owner = owner
+		ring.shared = True
+		return ring
 	def __del__(self):
 		if hasattr(self, "obj") and bool(self.obj):
 			_bf.RingDestroy(self.obj)
+	@property
+	def stats(self):
+		"""Snapshot of the ring's occupancy and contention statistics"""
+		st = _get(_bf.RingGetStats(self.obj))
+		nlag = min(st.nguarantee, len(st.guarantee_lag))
+		waits = {}
+		for name in ['read', 'write', 'write_close', 'realloc']:
+			waits[name] = {'count': getattr(st, name+'_wait_count'),
+			               'time':  getattr(st, name+'_wait_time')}
+		return {'tail':              st.tail,
+		        'head':              st.head,
+		        'reserve_head':      st.reserve_head,
+		        'capacity':          st.capacity,
+		        'nringlet':          st.nringlet,
+		        'nbyte_committed':   st.nbyte_committed,
+		        'nbyte_overwritten': st.nbyte_overwritten,
+		        'nguarantee':        st.nguarantee,
+		        'guarantee_lags':    [st.guarantee_lag[i] for i in xrange(nlag)],
+		        'waits':             waits,
+		        'nbyte_copied_to_ghost':   st.nbyte_copied_to_ghost,
+		        'nbyte_copied_from_ghost': st.nbyte_copied_from_ghost}
+	@property
+	def mirrored(self):
+		return bool(_get(_bf.RingGetMirrored(self.obj)))
+	@property
+	def spsc(self):
+		return bool(_get(_bf.RingGetSPSC(self.obj)))
+	def set_wait_policy(self, wait_policy, spin_count=10000):
+		_check(_bf.RingSetWaitPolicy(self.obj,
+		                             _string2wait_policy(wait_policy),
+		                             spin_count))
+	@property
+	def wait_policy(self):
+		ret = _bf.RingGetWaitPolicy(self.obj)
+		policy     = _get(ret, retarg=1)
+		spin_count = _get(ret, retarg=2)
+		return _wait_policy2string(policy), spin_count
+	@property
+	def alloc_options(self):
+		"""The options that control the placement of the ring's buffer
+		(hugepages, prefault, mlock and numa_node), as a dict"""
+		ret = _bf.RingGetAllocOptions(self.obj)
+		options = _malloc_options(_get(ret, retarg=1))
+		numa_node = _get(ret, retarg=2)
+		options['numa_node'] = numa_node if numa_node >= 0 else None
+		return options
+	def set_numa_node(self, numa_node):
+		"""Binds the ring's buffer to a NUMA node (or to none if numa_node
+		is None), from the next time the buffer is reallocated"""
+		flags = _get(_bf.RingGetAllocOptions(self.obj), retarg=1)
+		_check(_bf.RingSetAllocOptions(self.obj, flags,
+		                               -1 if numa_node is None else numa_node))
+	def expect_readers(self, nreader):
+		"""Protects the first sequence written to the ring for nreader
+		guaranteed readers that may open it only after writing has begun
+
+		Until each of them opens the sequence, the writer blocks rather than
+		overwrite data that it has not seen. Must be called before writing
+		begins.
+		"""
+		_check(_bf.RingExpectReaders(self.obj, nreader))
+	def cancel_expected_reader(self):
+		"""Stops protecting the first sequence for one of the readers given
+		to expect_readers, which will not open it after all"""
+		_check(_bf.RingCancelExpectedReader(self.obj))
 	def resize(self, contiguous_bytes, total_bytes=None, nringlet=1):
 		_check( _bf.RingResize(self.obj,
 		                       contiguous_bytes,
@@ -85,9 +268,54 @@ class Ring(object):
 		return ReadSequence(self, which='latest', guarantee=guarantee)
 	def open_earliest_sequence(self, guarantee=True):
 		return ReadSequence(self, which='earliest', guarantee=guarantee)
+	def open_sequence_at_time(self, time, guarantee=True):
+		"""Opens the sequence containing time (in seconds), as given by the
+		time scales of the sequences' frame axes
+
+		The sequence's read() method starts at the frame containing time by
+		default, and if guarantee is True, earlier frames are not guaranteed.
+		"""
+		return ReadSequence(self, which='at_time', time=time,
+		                    guarantee=guarantee)
+	def open_sequence_at(self, time_tag, guarantee=True):
+		return ReadSequence(self, which='at', time_tag=time_tag,
+		                    guarantee=guarantee)
+	def snapshot(self, filename, begin_time_tag, end_time_tag,
+	             time_tags_per_frame, direct_io=False):
+		"""Writes the frames between two time tags to a file in the background
+
+		The frames are pinned in the ring before this returns, so they cannot
+		be overwritten before they have been written out. Frames that have
+		not been written to the ring yet are waited for. Frames must all lie
+		in the sequence containing begin_time_tag.
+
+		time_tags_per_frame is the no. time_tag units spanned by each frame.
+		If direct_io is True, the file is written with O_DIRECT.
+
+		Returns a RingSnapshot, whose wait() method should be called to wait
+		for the write to finish.
+		"""
+		return RingSnapshot(self, filename, begin_time_tag, end_time_tag,
+		                    time_tags_per_frame, direct_io)
 	# TODO: Alternative name?
-	def read(self, whence='earliest', guarantee=True):
-		with ReadSequence(self, which=whence, guarantee=guarantee) as cur_seq:
+	def read(self, whence='earliest', guarantee=True, overrun=None,
+	         max_lag_nframe=None):
+		"""Iterates over the sequences in the ring
+
+		overrun sets what happens when the writer catches up with this
+		reader, overriding guarantee:
+		  'block': The writer waits for the reader.
+		  'drop':  The reader never holds up the writer, and instead skips
+		           over any data it has lost.
+		  'lag':   The writer waits for the reader only while it is within
+		           max_lag_nframe frames of the writer, after which the
+		           reader drops its oldest data.
+		The no. bytes each reader has skipped is given by the nbyte_skipped
+		property of its sequences.
+		"""
+		with ReadSequence(self, which=whence, guarantee=guarantee,
+		                  overrun=overrun,
+		                  max_lag_nframe=max_lag_nframe) as cur_seq:
 			while True:
 				yield cur_seq
 				cur_seq.increment()
@@ -100,17 +328,28 @@ class RingWriter(object):
 		return self
 	def __exit__(self, type, value, tb):
 		self.ring.end_writing()
-	def begin_sequence(self, header, buf_nframe):
+	def begin_sequence(self, header, buf_nframe, header_format='binary'):
+		"""Begins a new sequence described by header (a dict)
+
+		The header is stored in the ring in header_format, either 'binary'
+		(whose tensor layout readers can get without decoding the rest of
+		the header) or 'json'. Readers accept either.
+		"""
 		return WriteSequence(ring=self.ring,
 		                     header=header,
-		                     buf_nframe=buf_nframe)
+		                     buf_nframe=buf_nframe,
+		                     header_format=header_format)
 
 class SequenceBase(object):
         """Python object for a ring's sequence (data unit)"""
+	# Max no. cached span views (one per ring buffer position in practice)
+	MAX_SPAN_VIEWS = 256
 	def __init__(self, ring):
 		self._ring = ring
 		self._header = None
 		self._tensor = None
+		self._span_layout = None
+		self._span_views = {}
 	@property
 	def _base_obj(self):
 		return ctypes.cast(self.obj, _bf.BFsequence)
@@ -136,49 +375,84 @@ class SequenceBase(object):
 	def tensor(self):
 		if self._tensor is not None:
 			return self._tensor
-		header = self.header
-		shape = header['_tensor']['shape']
-		ringlet_shape, frame_shape = split_shape(shape)
-		nringlet       = reduce(lambda x,y:x*y, ringlet_shape, 1)
-		frame_nelement = reduce(lambda x,y:x*y, frame_shape,   1)
-		dtype = header['_tensor']['dtype']
-		nbit = DataType(dtype).itemsize_bits
-		assert(nbit % 8 == 0)
-		frame_nbyte = frame_nelement * nbit // 8
-		self._tensor = {}
-		self._tensor['dtype']         = dtype
-		self._tensor['ringlet_shape'] = ringlet_shape
-		self._tensor['nringlet']      = nringlet
-		self._tensor['frame_shape']   = frame_shape
-		self._tensor['frame_nbyte']   = frame_nbyte
-		self._tensor['dtype_nbyte']   = nbit // 8
+		if self._header is None:
+			# Read the tensor without decoding the rest of the header
+			hdr_buffer = self._header_buffer
+			tensor = None if hdr_buffer is None else decode_tensor(hdr_buffer)
+			if tensor is not None:
+				dtype, shape = tensor
+				self._tensor = parse_tensor_header({'_tensor': {'dtype': dtype,
+				                                                'shape': shape}})
+				return self._tensor
+		self._tensor = parse_tensor_header(self.header)
 		return self._tensor
+	def _get_span_layout(self):
+		"""Returns (frame_nbyte, ringlet_shape, frame_shape, ringlet_strides,
+		frame_strides), with ringlet_strides in units of the ringlet stride"""
+		if self._span_layout is not None:
+			return self._span_layout
+		tensor = self.tensor
+		frame_strides = [tensor['dtype_nbyte']]
+		for dim in reversed(tensor['frame_shape']):
+			frame_strides.append(dim * frame_strides[-1])
+		ringlet_strides = []
+		if len(tensor['ringlet_shape']) > 0:
+			ringlet_strides.append(1) # Last ringlet dimension
+		for dim in reversed(tensor['ringlet_shape'][1:]):
+			ringlet_strides.append(dim * ringlet_strides[-1])
+		self._span_layout = (tensor['frame_nbyte'],
+		                     tuple(tensor['ringlet_shape']),
+		                     tuple(tensor['frame_shape']),
+		                     tuple(reversed(ringlet_strides)),
+		                     tuple(reversed(frame_strides)))
+		return self._span_layout
+	def _get_span_view(self, info):
+		"""Returns an ndarray view of a span's data
+
+		Views are reused for spans at the same position in the ring buffer.
+		"""
+		key = (info.data, info.size, info.stride)
+		view = self._span_views.get(key, None)
+		if view is not None:
+			return view
+		frame_nbyte, ringlet_shape, frame_shape, \
+			ringlet_strides, frame_strides = self._get_span_layout()
+		shape   = ringlet_shape + (info.size // frame_nbyte,) + frame_shape
+		strides = (tuple(s*info.stride for s in ringlet_strides) +
+		           frame_strides)
+		view = ndarray(space=self.ring.space,
+		               shape=shape,
+		               strides=strides,
+		               buffer=info.data,
+		               dtype=self.tensor['dtype'])
+		if len(self._span_views) >= SequenceBase.MAX_SPAN_VIEWS:
+			# Irregular span positions; start afresh rather than grow
+			self._span_views.clear()
+		self._span_views[key] = view
+		return view
 	@property
-	def header(self):
-		if self._header is not None:
-			return self._header
+	def _header_buffer(self):
+		"""The encoded header, in place in the ring (or None if empty)"""
 		size = self.header_size
 		if size == 0:
 			# WAR for hdr_buffer_ptr.contents crashing when size == 0
-			hdr_array = np.empty(0, dtype=np.uint8)
-			hdr_array.flags['WRITEABLE'] = False
-			return json.loads(hdr_array.tostring())
+			return None
 		BufferType = ctypes.c_byte*size
 		hdr_buffer_ptr = ctypes.cast(self._header_ptr, ctypes.POINTER(BufferType))
-		hdr_buffer = hdr_buffer_ptr.contents
-		#hdr_array = memoryview(hdr_buffer)
-		# WAR for ctypes producing an invalid type code that numpy fails on
-		#hdr_array = buffer(memoryview(hdr_buffer))
-		hdr_array = np.frombuffer(hdr_buffer, dtype=np.uint8)
-		hdr_array.flags['WRITEABLE'] = False
-		self._header = json.loads(hdr_array.tostring())
+		return hdr_buffer_ptr.contents
+	@property
+	def header(self):
+		if self._header is not None:
+			return self._header
+		hdr_buffer = self._header_buffer
+		self._header = decode_header('' if hdr_buffer is None else hdr_buffer)
 		return self._header
 
 class WriteSequence(SequenceBase):
-	def __init__(self, ring, header, buf_nframe):
+	def __init__(self, ring, header, buf_nframe, header_format='binary'):
 		SequenceBase.__init__(self, ring)
 		self._header = header
-		header_str = json.dumps(header)
+		header_str = encode_header(header, header_format)
 		header_size = len(header_str)
 		gulp_nframe = header['gulp_nframe']
 		tensor = self.tensor
@@ -195,6 +469,12 @@ class WriteSequence(SequenceBase):
 		                                      header=header_str,
 		                                      nringlet=tensor['nringlet'],
 		                                      offset_from_head=offset_from_head), retarg=0)
+		# Add the sequence to the ring's time index
+		time_scale = frame_time_scale(header)
+		if time_scale is not None:
+			time0, frame_period = time_scale
+			_check(_bf.RingSequenceSetTimeScale(self.obj, time0, frame_period,
+			                                    tensor['frame_nbyte']))
 	def __enter__(self):
 		return self
 	def __exit__(self, type, value, tb):
@@ -202,13 +482,99 @@ class WriteSequence(SequenceBase):
 	def end(self):
 		offset_from_head = 0
 		_check(_bf.RingSequenceEnd(self.obj, offset_from_head))
-	def reserve(self, nframe):
-		return WriteSpan(self.ring, self, nframe)
+	def reserve(self, nframe, timeout=None):
+		"""Reserves space for nframe frames
+
+		If timeout (secs) is not None, raises WouldBlock if space does not
+		become available in time. A timeout of 0 never blocks.
+		"""
+		return WriteSpan(self.ring, self, nframe, timeout)
+	def reserve_many(self, nframe, nspan, timeout=None):
+		"""Reserves nspan consecutive spans of nframe frames each
+
+		The spans may be filled concurrently, but must be committed in order.
+		A span may only be committed short once all of the spans after it
+		have been cancelled (committed with 0 frames), most-recent first.
+		See write_parallel, which does this.
+		"""
+		ospans = []
+		try:
+			for i in xrange(nspan):
+				ospans.append(self.reserve(nframe, timeout))
+		except:
+			for ospan in reversed(ospans):
+				ospan.commit(0)
+				ospan.close()
+			raise
+		return ospans
+	def write_parallel(self, nframe, nspan, fill, pool):
+		"""Reserves nspan consecutive spans of nframe frames, fills them
+		concurrently and commits them in order
+
+		fill(ospan) is called for each span on pool (e.g., a
+		multiprocessing.pool.ThreadPool) and must return the no. frames to
+		commit, between 0 and nframe. Each span is committed as soon as it and
+		all of the spans before it have been filled. If a span is committed
+		short, the spans after it are cancelled. If fill returns anything
+		else, the remaining spans are cancelled and ValueError is raised.
+
+		Returns the total no. frames committed.
+		"""
+		ospans = self.reserve_many(nframe, nspan)
+		results = pool.imap(fill, ospans)
+		nframe_committed = 0
+		try:
+			while len(ospans):
+				commit_nframe = next(results)
+				if (not isinstance(commit_nframe, (int, long, np.integer)) or
+				    isinstance(commit_nframe, bool) or
+				    not 0 <= commit_nframe <= nframe):
+					# Note: The remaining spans are cancelled on the way out
+					raise ValueError("fill returned %r, but must return a no. "
+					                 "frames between 0 and %i" %
+					                 (commit_nframe, nframe))
+				commit_nframe = int(commit_nframe)
+				if commit_nframe < nframe:
+					# Note: The ring only allows a span to be committed short
+					#         once all spans reserved after it are cancelled.
+					self._cancel_spans(ospans[1:], results)
+					del ospans[1:]
+				ospan = ospans.pop(0)
+				ospan.commit(commit_nframe)
+				ospan.close()
+				nframe_committed += commit_nframe
+				if commit_nframe < nframe:
+					break
+		finally:
+			self._cancel_spans(ospans, results)
+		return nframe_committed
+	@staticmethod
+	def _cancel_spans(ospans, results):
+		"""Waits for any fills still in progress and then cancels their spans,
+		which must be done most-recent first"""
+		while True:
+			try:
+				next(results)
+			except StopIteration:
+				break
+			except Exception:
+				pass
+		for ospan in reversed(ospans):
+			ospan.commit(0)
+			ospan.close()
 
 class ReadSequence(SequenceBase):
-	def __init__(self, ring, which='specific', name="", other_obj=None, guarantee=True):
+	def __init__(self, ring, which='specific', name="", other_obj=None, guarantee=True,
+	             time_tag=None, overrun=None, max_lag_nframe=None, time=None):
 		SequenceBase.__init__(self, ring)
 		self._ring = ring
+		self._begin_frame = 0
+		if overrun is not None:
+			_string2overrun_policy(overrun)
+			if overrun == 'lag' and max_lag_nframe is None:
+				raise ValueError("max_lag_nframe must be given for overrun='lag'")
+		self._overrun        = overrun
+		self._max_lag_nframe = max_lag_nframe
 		if which == 'specific':
 			self.obj = _get(_bf.RingSequenceOpen(ring=ring.obj,
 			                                     name=name, guarantee=guarantee), retarg=0)
@@ -218,9 +584,32 @@ class ReadSequence(SequenceBase):
 		elif which == 'earliest':
 			self.obj = _get(_bf.RingSequenceOpenEarliest(ring=ring.obj,
 			                                             guarantee=guarantee), retarg=0)
+		elif which == 'at':
+			self.obj = _get(_bf.RingSequenceOpenAt(ring=ring.obj,
+			                                       time_tag=time_tag,
+			                                       guarantee=guarantee), retarg=0)
+		elif which == 'at_time':
+			ret = _bf.RingSequenceOpenAtTime(ring=ring.obj, time=time,
+			                                 guarantee=guarantee)
+			self.obj = _get(ret, retarg=0)
+			self._begin_frame = _get(ret, retarg=4) // self.tensor['frame_nbyte']
 		else:
-			raise ValueError("Invalid 'which' parameter; must be one of: 'specific', 'latest', 'earliest'")
-		
+			raise ValueError("Invalid 'which' parameter; must be one of: 'specific', 'latest', 'earliest', 'at', 'at_time'")
+		if overrun is not None:
+			self._set_overrun_policy()
+	def _set_overrun_policy(self):
+		# Note: This depends on the frame size, so must be redone for each
+		#         new sequence
+		frame_nbyte = self.tensor['frame_nbyte']
+		max_lag_nframe = self._max_lag_nframe or 0
+		_check(_bf.RingSequenceSetOverrunPolicy(self.obj,
+		                                        _string2overrun_policy(self._overrun),
+		                                        max_lag_nframe*frame_nbyte,
+		                                        frame_nbyte))
+	@property
+	def nbyte_skipped(self):
+		"""The total no. bytes this reader has lost to the writer"""
+		return _get(_bf.RingSequenceGetNSkipped(self.obj))
 	def __enter__(self):
 		return self
 	def __exit__(self, type, value, tb):
@@ -233,24 +622,129 @@ class ReadSequence(SequenceBase):
 		#   a new sequence.
 		self._header = None
 		self._tensor = None
-	def acquire(self, frame_offset, nframe):
-		return ReadSpan(self, frame_offset, nframe)
-	def read(self, nframe, stride=None, begin=0):
+		self._span_layout = None
+		self._span_views = {}
+		self._begin_frame = 0
+		if self._overrun is not None:
+			self._set_overrun_policy()
+	def acquire(self, frame_offset, nframe, timeout=None):
+		"""Acquires nframe frames starting at frame_offset
+
+		If timeout (secs) is not None, raises WouldBlock if the data do not
+		arrive in time. A timeout of 0 never blocks.
+		"""
+		return ReadSpan(self, frame_offset, nframe, timeout)
+	def frame_offset_at_time(self, time):
+		"""Returns the offset of the frame containing time (in seconds)"""
+		time_scale = frame_time_scale(self.header)
+		if time_scale is None:
+			raise ValueError("Sequence header has no time scale")
+		time0, frame_period = time_scale
+		return int(np.floor((time - time0) / frame_period + 1e-6))
+	def read(self, nframe, stride=None, begin=None):
+		"""Iterates over spans of nframe frames, starting at frame begin
+
+		By default, reading begins where the sequence was opened (see
+		Ring.open_sequence_at_time). The gulp can be changed between spans
+		by sending the generator a new (nframe, stride) pair, which applies
+		from the span after the current one.
+		"""
 		if stride is None:
 			stride = nframe
+		if begin is None:
+			begin = self._begin_frame
 		offset = begin
+		skips = self._overrun in ('drop', 'lag')
 		while True:
+			if skips:
+				nbyte_skipped = self.nbyte_skipped
 			with self.acquire(offset, nframe) as ispan:
-				yield ispan
+				if skips:
+					# Continue on from wherever the data had to be skipped to
+					nbyte_skipped = self.nbyte_skipped - nbyte_skipped
+					offset += nbyte_skipped // self.tensor['frame_nbyte']
+				gulp = yield ispan
 			offset += stride
+			if gulp is not None:
+				nframe, stride = gulp
 	def resize(self, gulp_nframe, buf_nframe=None, buffer_factor=None):
+		return self._ring.resize(*self._buffer_nbytes(gulp_nframe, buf_nframe,
+		                                              buffer_factor))
+	def _buffer_nbytes(self, gulp_nframe, buf_nframe, buffer_factor):
+		"""Returns the (contiguous, total) no. bytes to request from the
+		ring in resize"""
 		if buf_nframe is None:
 			if buffer_factor is None:
 				buffer_factor = 3
 			buf_nframe = int(np.ceil(gulp_nframe * buffer_factor))
 		tensor = self.tensor
-		return self._ring.resize(gulp_nframe*tensor['frame_nbyte'],
-		                         buf_nframe*tensor['frame_nbyte'])
+		return (gulp_nframe*tensor['frame_nbyte'],
+		        buf_nframe*tensor['frame_nbyte'])
+
+class RingSnapshot(object):
+	"""A range of frames being written from a ring to a file
+
+	The sequence header, with its time_tag updated to that of the first
+	frame in the file, is written alongside the data to filename + '.json'
+	once the snapshot finishes successfully.
+	"""
+	def __init__(self, ring, filename, begin_time_tag, end_time_tag,
+	             time_tags_per_frame, direct_io=False):
+		if end_time_tag <= begin_time_tag:
+			raise ValueError("end_time_tag must be after begin_time_tag")
+		with ring.open_sequence_at(begin_time_tag, guarantee=False) as seq:
+			self._header = seq.header
+			tensor       = seq.tensor
+			seq_time_tag = seq.time_tag
+		self.filename            = filename
+		self._time_tags_per_frame = time_tags_per_frame
+		self._frame_nbyte = tensor['frame_nbyte']
+		self._time_tag0   = seq_time_tag
+		frame_offset = (begin_time_tag - seq_time_tag) // time_tags_per_frame
+		frame_end    = -(-(end_time_tag - seq_time_tag) // time_tags_per_frame)
+		self.obj = _get(_bf.RingSnapshotBegin(ring=ring.obj,
+		                                      time_tag=begin_time_tag,
+		                                      offset=frame_offset*self._frame_nbyte,
+		                                      size=(frame_end-frame_offset)*self._frame_nbyte,
+		                                      frame_nbyte=self._frame_nbyte,
+		                                      filename=filename,
+		                                      direct_io=direct_io), retarg=0)
+	def __enter__(self):
+		return self
+	def __exit__(self, type, value, tb):
+		if type is None:
+			self.wait()
+		self.close()
+	def __del__(self):
+		self.close()
+	def close(self):
+		"""Releases the snapshot, cancelling it if it has not finished"""
+		if getattr(self, 'obj', None):
+			_check(_bf.RingSnapshotDestroy(self.obj))
+			self.obj = None
+	def wait(self, timeout=None):
+		"""Waits for the snapshot to finish
+
+		If timeout (secs) is not None, raises WouldBlock if the snapshot does
+		not finish in time.
+		"""
+		_check(_bf.RingSnapshotWait(self.obj, -1 if timeout is None else timeout))
+		with open(self.filename + '.json', 'w') as f:
+			json.dump(self.header, f)
+	@property
+	def info(self):
+		"""The progress of the snapshot, in frames"""
+		info = _get(_bf.RingSnapshotGetInfo(self.obj))
+		return {'frame_offset':   info.offset        // self._frame_nbyte,
+		        'nframe':         info.size          // self._frame_nbyte,
+		        'nframe_written': info.nbyte_written // self._frame_nbyte,
+		        'finished':       bool(info.finished)}
+	@property
+	def header(self):
+		header = dict(self._header)
+		header['time_tag'] = (self._time_tag0 +
+		                      self.info['frame_offset']*self._time_tags_per_frame)
+		return header
 
 def accumulate(vals, op='+', init=None, reverse=False):
 	if   op == '+':   op = lambda a,b:a+b
@@ -275,11 +769,14 @@ class SpanBase(object):
 		self._sequence = sequence
 		self.writeable = writeable
 		self._data = None
-	def _set_base_obj(self, obj):
-		self._base_obj = ctypes.cast(obj, _bf.BFspan)
-		self._cache_info()
-	def _cache_info(self):
-		self._info = _get(_bf.RingSpanGetInfo(self._base_obj))
+		self._frame_nbyte = sequence._get_span_layout()[0]
+	def _set_base_obj_info(self, f):
+		"""Unpacks the span handle and info from a bfRingSpan*Info call"""
+		status, args = _check(f)
+		args = list(args)
+		self.obj  = args[0]
+		self._info = args[-1]
+		self._base_obj = ctypes.cast(self.obj, _bf.BFspan)
 	@property
 	def ring(self):
 		return self._ring
@@ -296,10 +793,16 @@ class SpanBase(object):
 	def _stride_bytes(self):
 		return self._info.stride
 	@property
+	def _offset_bytes(self):
+		return self._info.offset
+	@property
+	def frame_nbyte(self):
+		return self._frame_nbyte
+	@property
 	def frame_offset(self):
 		byte_offset = self._info.offset
-		assert(byte_offset % self.frame_nbyte == 0)
-		return byte_offset // self.frame_nbyte
+		assert(byte_offset % self._frame_nbyte == 0)
+		return byte_offset // self._frame_nbyte
 	@property
 	def _nringlet(self):
 		return self._info.nringlet
@@ -308,60 +811,39 @@ class SpanBase(object):
 		return self._info.data
 	@property
 	def nframe(self):
-		size_bytes = self._size_bytes
-		assert(size_bytes % self.tensor['frame_nbyte'] == 0)
-		nframe  = size_bytes // self.tensor['frame_nbyte']
-		return nframe
+		size_bytes = self._info.size
+		assert(size_bytes % self._frame_nbyte == 0)
+		return size_bytes // self._frame_nbyte
 	@property
 	def shape(self):
-		shape = (self.tensor['ringlet_shape'] +
-		         [self.nframe,] +
-		         self.tensor['frame_shape'])
-		return shape
+		_, ringlet_shape, frame_shape, _, _ = self.sequence._get_span_layout()
+		return list(ringlet_shape) + [self.nframe,] + list(frame_shape)
 	@property
 	def strides(self):
-		tensor = self.tensor
-		strides = [tensor['dtype_nbyte']]
-		for dim in reversed(tensor['frame_shape']):
-			strides.append(dim * strides[-1])
-		if len(tensor['ringlet_shape']) > 0:
-			strides.append(self._stride_bytes) # First ringlet dimension
-		for dim in reversed(tensor['ringlet_shape'][1:]):
-			strides.append(dim * strides[-1])
-		strides = list(reversed(strides))
-		return strides
+		_, _, _, ringlet_strides, frame_strides = \
+			self.sequence._get_span_layout()
+		return ([s*self._stride_bytes for s in ringlet_strides] +
+		        list(frame_strides))
 	@property
 	def dtype(self):
 		return self.tensor['dtype']
 	@property
 	def data(self):
-		
-		# TODO: This function used to be super slow due to pyclibrary calls
-		#         Check whether it still is!
-		
-		if self._data is not None:
-			return self._data
-		data_ptr = self._data_ptr
-		
-		space = self.ring.space
-		
-		data_array = ndarray(space=space,
-		                     shape=self.shape,
-		                     strides=self.strides,
-		                     buffer=data_ptr,
-		                     dtype=self.dtype)
-		
-		return data_array
+		if self._data is None:
+			self._data = self.sequence._get_span_view(self._info)
+		return self._data
 
 class WriteSpan(SpanBase):
 	def __init__(self,
 	             ring,
 	             sequence,
-	             nframe):
+	             nframe,
+	             timeout=None):
 		SpanBase.__init__(self, ring, sequence, writeable=True)
-		nbyte = nframe * self.tensor['frame_nbyte']
-		self.obj = _get(_bf.RingSpanReserve(ring=ring.obj, size=nbyte), retarg=0)
-		self._set_base_obj(self.obj)
+		nbyte = nframe * self._frame_nbyte
+		self._set_base_obj_info(
+			_bf.RingSpanReserveInfo(ring=ring.obj, size=nbyte,
+			                        timeout_secs=-1 if timeout is None else timeout))
 		self.commit_nframe = nframe
 		# TODO: Why do exceptions here not show up properly?
 		#raise ValueError("SHOW ME THE ERROR")
@@ -372,18 +854,18 @@ class WriteSpan(SpanBase):
 	def __exit__(self, type, value, tb):
 		self.close()
 	def close(self):
-		commit_nbyte = self.commit_nframe * self.tensor['frame_nbyte']
+		commit_nbyte = self.commit_nframe * self._frame_nbyte
 		_check(_bf.RingSpanCommit(self.obj, commit_nbyte))
 
 class ReadSpan(SpanBase):
-	def __init__(self, sequence, frame_offset, nframe):
+	def __init__(self, sequence, frame_offset, nframe, timeout=None):
 		SpanBase.__init__(self, sequence.ring, sequence, writeable=False)
-		tensor = sequence.tensor
-		self.obj = _get(_bf.RingSpanAcquire(sequence=sequence.obj,
-		                                    offset=frame_offset*tensor['frame_nbyte'],
-		                                    size=nframe*tensor['frame_nbyte']),
-		                retarg=0)
-		self._set_base_obj(self.obj)
+		frame_nbyte = self._frame_nbyte
+		self._set_base_obj_info(
+			_bf.RingSpanAcquireInfo(sequence=sequence.obj,
+			                        offset=frame_offset*frame_nbyte,
+			                        size=nframe*frame_nbyte,
+			                        timeout_secs=-1 if timeout is None else timeout))
 	def __enter__(self):
 		return self
 	def __exit__(self, type, value, tb):
@@ -0,0 +1,96 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Encoding of ring sequence headers
+
+Headers are encoded in a compact binary form by default:
+
+  'BFH1'                 4-byte magic
+  dtype                  16-byte null-padded string (_tensor['dtype'])
+  ndim                   uint32
+  shape                  ndim x int64 (_tensor['shape'])
+  metadata               JSON encoding of the rest of the header
+
+The fixed-layout section describes the tensor and is read in place, without
+copying the header or decoding the metadata, which is decoded only when the
+full header is needed. Headers without a '_tensor' entry (or that do not fit
+the fixed layout) are encoded as plain JSON, which can always be decoded.
+"""
+
+import struct
+try:
+	import simplejson as json
+except ImportError:
+	import json
+
+HEADER_MAGIC = 'BFH1'
+HEADER_FORMATS = ('binary', 'json')
+
+_fixed = struct.Struct('<4s16sI')
+
+def encode_header(header, format='binary'):
+	"""Returns the encoding of header (a dict) as a string"""
+	if format not in HEADER_FORMATS:
+		raise KeyError("Invalid header format '"+str(format)+"'.\nValid formats: "+str(HEADER_FORMATS))
+	tensor = header.get('_tensor', None)
+	if (format == 'json' or tensor is None or
+	    not isinstance(tensor.get('dtype', None), basestring) or
+	    len(tensor['dtype']) > 16 or
+	    'shape' not in tensor):
+		return json.dumps(header)
+	shape = tensor['shape']
+	meta = dict(header)
+	meta['_tensor'] = dict((key, val) for key, val in tensor.items()
+	                       if key not in ('dtype', 'shape'))
+	return (_fixed.pack(HEADER_MAGIC, str(tensor['dtype']), len(shape)) +
+	        struct.pack('<%iq' % len(shape), *shape) +
+	        json.dumps(meta))
+
+def decode_tensor(buf):
+	"""Returns (dtype, shape) from the fixed-layout section of an encoded
+	header (a string or other buffer), or None if it is a JSON header"""
+	if len(buf) < _fixed.size:
+		return None
+	magic, dtype, ndim = _fixed.unpack_from(buf)
+	if magic != HEADER_MAGIC:
+		return None
+	shape = struct.unpack_from('<%iq' % ndim, buf, _fixed.size)
+	return dtype.rstrip('\0'), list(shape)
+
+def decode_header(buf):
+	"""Returns the header (a dict) from its encoding (a string or other
+	buffer)"""
+	tensor = decode_tensor(buf)
+	if tensor is None:
+		return json.loads(str(buffer(buf)))
+	dtype, shape = tensor
+	meta_offset = _fixed.size + 8*len(shape)
+	header = json.loads(str(buffer(buf, meta_offset)))
+	header['_tensor']['dtype'] = dtype
+	header['_tensor']['shape'] = shape
+	return header
@@ -29,6 +29,7 @@
 from pipeline import TransformBlock
 import bifrost as bf
 import bifrost.transpose
+import numpy as np
 
 from copy import deepcopy
 
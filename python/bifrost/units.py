@@ -26,10 +26,75 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import pint
+"""Unit conversion for header axis scales (e.g., _tensor['units'])
+
+Conversions between the units that commonly appear in headers are done
+directly, and others use a single shared pint registry. Conversion factors
+are computed once per pair of units.
+"""
+
+import numpy as np
+
+# Units with direct conversions, as (dimension, value in base units)
+_direct_units = {
+	's':            ('time', 1.),
+	'ms':           ('time', 1e-3),
+	'us':           ('time', 1e-6),
+	'ns':           ('time', 1e-9),
+	'Hz':           ('frequency', 1.),
+	'kHz':          ('frequency', 1e3),
+	'MHz':          ('frequency', 1e6),
+	'GHz':          ('frequency', 1e9),
+	'pc cm^-3':     ('dispersion measure', 1.),
+	'pc/cm^3':      ('dispersion measure', 1.),
+	'pc cm**-3':    ('dispersion measure', 1.),
+	'pc / cm ** 3': ('dispersion measure', 1.)
+}
+
+_ureg = None
+def get_unit_registry():
+	"""Returns the pint UnitRegistry shared by all conversions"""
+	global _ureg
+	if _ureg is None:
+		# Note: pint is imported here because it is slow to import
+		import pint
+		_ureg = pint.UnitRegistry()
+	return _ureg
+
+_conversion_factors = {}
+def conversion_factors(old_units, new_units):
+	"""Returns (scale, offset) such that new = old * scale + offset"""
+	key = (old_units, new_units)
+	if key in _conversion_factors:
+		return _conversion_factors[key]
+	if old_units == new_units:
+		factors = (1., 0.)
+	elif old_units in _direct_units and new_units in _direct_units:
+		old_dim, old_base = _direct_units[old_units]
+		new_dim, new_base = _direct_units[new_units]
+		if old_dim != new_dim:
+			raise ValueError("Cannot convert from '%s' (%s) to '%s' (%s)" %
+			                 (old_units, old_dim, new_units, new_dim))
+		factors = (old_base / new_base, 0.)
+	else:
+		ureg = get_unit_registry()
+		# Note: Converting 0 and 1 also handles units with offsets (e.g., degC)
+		offset = ureg.Quantity(0., old_units).to(new_units).m
+		scale  = ureg.Quantity(1., old_units).to(new_units).m - offset
+		factors = (scale, offset)
+	_conversion_factors[key] = factors
+	return factors
 
 def convert_units(value, old_units, new_units):
-	ureg = pint.UnitRegistry()
-	old_quantity = value * ureg.parse_expression(old_units)
-	new_quantity = old_quantity.to(new_units)
-	return new_quantity.m
+	"""Converts value (a scalar or array) from old_units to new_units"""
+	scale, offset = conversion_factors(old_units, new_units)
+	if scale == 1. and offset == 0.:
+		return value
+	if isinstance(value, (list, tuple)):
+		value = np.asarray(value, dtype=np.float64)
+	return value * scale + offset
+
+def convert_scale(scale, old_units, new_units):
+	"""Converts an axis scale [offset, step] from old_units to new_units"""
+	factor, offset = conversion_factors(old_units, new_units)
+	return [scale[0] * factor + offset, scale[1] * factor]
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Generates static ctypes bindings for libbifrost from its headers
+
+Usage: python generate_bindings.py -o bifrost/libbifrost_generated.py \
+           ../src/bifrost/*.h
+
+The headers are parsed (with pyclibrary) once at build time, and the
+generated module declares the argument and return types of every bf*
+function along with the library's structs, typedefs and constants, so that
+importing bifrost does not need to parse the headers.
+"""
+
+import os
+import sys
+import argparse
+from collections import OrderedDict
+
+# Fundamental C types and their ctypes equivalents
+C_TYPES = OrderedDict([
+	('bool',                   'c_bool'),
+	('char',                   'c_char'),
+	('wchar',                  'c_wchar'),
+	('unsigned char',          'c_ubyte'),
+	('signed char',            'c_byte'),
+	('short',                  'c_short'),
+	('short int',              'c_short'),
+	('unsigned short',         'c_ushort'),
+	('unsigned short int',     'c_ushort'),
+	('int',                    'c_int'),
+	('signed int',             'c_int'),
+	('unsigned',               'c_uint'),
+	('unsigned int',           'c_uint'),
+	('long',                   'c_long'),
+	('long int',               'c_long'),
+	('signed long',            'c_long'),
+	('unsigned long',          'c_ulong'),
+	('unsigned long int',      'c_ulong'),
+	('long long',              'c_longlong'),
+	('long long int',          'c_longlong'),
+	('signed long long',       'c_longlong'),
+	('unsigned long long',     'c_ulonglong'),
+	('unsigned long long int', 'c_ulonglong'),
+	('float',                  'c_float'),
+	('double',                 'c_double'),
+	('long double',            'c_longdouble'),
+	('uint8_t',                'c_uint8'),
+	('int8_t',                 'c_int8'),
+	('uint16_t',               'c_uint16'),
+	('int16_t',                'c_int16'),
+	('uint32_t',               'c_uint32'),
+	('int32_t',                'c_int32'),
+	('uint64_t',               'c_uint64'),
+	('int64_t',                'c_int64'),
+	('size_t',                 'c_size_t'),
+])
+# Pointers to these have their own ctypes
+C_POINTER_TYPES = {'char':    'c_char_p',
+                   'wchar':   'c_wchar_p',
+                   'wchar_t': 'c_wchar_p',
+                   'void':    'c_void_p'}
+
+def struct_class_name(name):
+	return 'struct_' + name
+
+class BindingGenerator(object):
+	def __init__(self, parser):
+		self.parser = parser
+		self.defs   = parser.defs
+	def base_expr(self, base):
+		if base in C_TYPES:
+			return C_TYPES[base]
+		if base.startswith('struct ') or base.startswith('union '):
+			return struct_class_name(self.defs['types'][base][1])
+		if base.startswith('enum '):
+			return 'c_int'
+		if base == 'void':
+			return 'None'
+		raise KeyError("Unknown base type: " + base)
+	def type_expr(self, typ):
+		"""Returns a Python expression for the ctypes type of typ"""
+		typ  = list(self.parser.eval_type(typ))
+		mods = typ[1:]
+		if len(mods) and mods[0] == '*' and typ[0] in C_POINTER_TYPES:
+			expr = C_POINTER_TYPES[typ[0]]
+			mods = mods[1:]
+		else:
+			expr = self.base_expr(typ[0])
+		while len(mods):
+			mod = mods.pop(0)
+			if isinstance(mod, tuple):
+				# Function pointer
+				if not len(mods) or mods[0] != '*':
+					raise ValueError("Function type without pointer: " +
+					                 str(typ))
+				mods.pop(0)
+				args = [self.type_expr(arg[1]) for arg in mod]
+				expr = 'CFUNCTYPE(%s)' % ', '.join([expr] + args)
+			elif isinstance(mod, list):
+				for dim in mod:
+					if dim == -1: # Unsized array
+						expr = 'POINTER(%s)' % expr
+					else:
+						expr = '(%s * %i)' % (expr, dim)
+			elif mod[0] in '*&':
+				for _ in mod:
+					expr = 'POINTER(%s)' % expr
+			else:
+				raise ValueError("Unknown type modifier: " + str(mod))
+		return expr
+	def struct_dependencies(self, struct):
+		"""Returns the structs that struct contains by value"""
+		deps = []
+		for member in struct['members']:
+			typ = list(self.parser.eval_type(member[1]))
+			if (typ[0].startswith('struct ') or typ[0].startswith('union ')) and \
+			   not any(isinstance(mod, tuple) or (not isinstance(mod, list) and
+			                                      mod[0] in '*&')
+			           for mod in typ[1:]):
+				deps.append(self.defs['types'][typ[0]][1])
+		return deps
+	def sorted_structs(self, kind):
+		"""Returns struct names with by-value members ahead of their users"""
+		structs = self.defs[kind]
+		ordered = []
+		def visit(name):
+			if name in ordered:
+				return
+			for dep in self.struct_dependencies(structs[name]):
+				if dep in structs:
+					visit(dep)
+			ordered.append(name)
+		for name in sorted(structs.keys()):
+			visit(name)
+		return ordered
+	def generate(self):
+		lines = []
+		add = lines.append
+		add("# Generated by generate_bindings.py from the Bifrost headers. Do not edit.")
+		add("")
+		add("from ctypes import *")
+		add("")
+		for kind, base in [('structs', 'Structure'), ('unions', 'Union')]:
+			for name in sorted(self.defs[kind].keys()):
+				add("class %s(%s):" % (struct_class_name(name), base))
+				add("\tpass")
+		for kind in ['structs', 'unions']:
+			for name in self.sorted_structs(kind):
+				members = self.defs[kind][name]['members']
+				if not len(members):
+					continue # Opaque
+				add("%s._fields_ = [" % struct_class_name(name))
+				for member in members:
+					add("\t(%r, %s)," % (str(member[0]), self.type_expr(member[1])))
+				add("]")
+		add("")
+		add("types = {")
+		for name, expr in C_TYPES.items():
+			add("\t%r: %s," % (name, expr))
+		for name in sorted(self.defs['types'].keys()):
+			if ' ' in name:
+				continue # E.g., 'struct X'
+			add("\t%r: %s," % (str(name), self.type_expr(self.defs['types'][name])))
+		for kind in ['structs', 'unions']:
+			for name in sorted(self.defs[kind].keys()):
+				add("\t%r: %s," % (str(name), struct_class_name(name)))
+		add("}")
+		add("")
+		add("values = {")
+		for name in sorted(self.defs['values'].keys()):
+			value = self.defs['values'][name]
+			if value is None:
+				continue
+			add("\t%r: %r," % (str(name), value))
+		add("}")
+		add("")
+		add("# name: (restype, ((argname, argtype), ...))")
+		add("functions = {")
+		for name in sorted(self.defs['functions'].keys()):
+			restype, args = self.defs['functions'][name]
+			args = [arg for arg in args if arg[1] != ('void',)]
+			add("\t%r: (%s, (" % (str(name), self.type_expr(restype)))
+			for i, arg in enumerate(args):
+				argname = str(arg[0]) if arg[0] is not None else 'arg%i' % i
+				add("\t\t(%r, %s)," % (argname, self.type_expr(arg[1])))
+			add("\t)),")
+		add("}")
+		return '\n'.join(lines) + '\n'
+
+def main(argv):
+	parser = argparse.ArgumentParser(
+		description="Generates static ctypes bindings for libbifrost")
+	parser.add_argument('headers', nargs='+', help="Bifrost C headers")
+	parser.add_argument('-o', '--output', required=True,
+	                    help="Output Python module")
+	args = parser.parse_args(argv)
+	import ctypes
+	import pyclibrary
+	from pyclibrary import CParser
+	# Note: The parser only knows the fundamental types to begin with
+	extra_types = dict((name, getattr(ctypes, C_TYPES[name]))
+	                   for name in ['uint8_t', 'int8_t', 'uint16_t', 'int16_t',
+	                                'uint32_t', 'int32_t', 'uint64_t', 'int64_t',
+	                                'size_t'])
+	try:
+		pyclibrary.auto_init(extra_types=extra_types)
+	except RuntimeError:
+		pass # WAR for annoying "Can only initialise the parser once"
+	headers = sorted(args.headers)
+	pyclibrary.utils.add_header_locations(
+		sorted(set(os.path.dirname(os.path.abspath(h)) for h in headers)))
+	source = BindingGenerator(CParser(headers)).generate()
+	with open(args.output, 'w') as f:
+		f.write(source)
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -36,6 +36,10 @@
 //#include <sched.h>
 #include <unistd.h>
 #include <errno.h>
+#include <dirent.h>
+#include <cstdio>
+#include <cstring>
+#include <string>
 
 // Note: Pass core_id = -1 to unbind
 BFstatus bfAffinitySetCore(int core) {
@@ -96,6 +100,47 @@ BFstatus bfAffinityGetCore(int* core) {
 	// No cores are set! (Not sure if this is possible)
 	return BF_STATUS_INVALID_STATE;
 }
+// Returns the no. entries in dirname whose names are prefix followed by a
+//   number, and the value of that number for the last such entry.
+static int count_numbered_entries(std::string dirname, const char* prefix,
+                                  int* last_number) {
+	DIR* dir = ::opendir(dirname.c_str());
+	if( !dir ) {
+		return 0;
+	}
+	int count = 0;
+	size_t prefix_len = ::strlen(prefix);
+	while( struct dirent* entry = ::readdir(dir) ) {
+		int number;
+		char extra;
+		if( ::strncmp(entry->d_name, prefix, prefix_len) == 0 &&
+		    ::sscanf(entry->d_name + prefix_len, "%d%c", &number, &extra) == 1 ) {
+			++count;
+			if( last_number ) {
+				*last_number = number;
+			}
+		}
+	}
+	::closedir(dir);
+	return count;
+}
+BFstatus bfAffinityGetNumaNode(int core, int* node) {
+	BF_ASSERT(node, BF_STATUS_INVALID_POINTER);
+	int ncore = sysconf(_SC_NPROCESSORS_CONF);
+	BF_ASSERT(core >= 0 && core < ncore, BF_STATUS_INVALID_ARGUMENT);
+	*node = -1;
+#if defined __linux__ && __linux__
+	if( count_numbered_entries("/sys/devices/system/node", "node", 0) > 1 ) {
+		std::string cpu_dir = ("/sys/devices/system/cpu/cpu" +
+		                       std::to_string(core));
+		int cpu_node;
+		if( count_numbered_entries(cpu_dir, "node", &cpu_node) == 1 ) {
+			*node = cpu_node;
+		}
+	}
+#endif
+	return BF_STATUS_SUCCESS;
+}
 BFstatus bfAffinitySetOpenMPCores(BFsize     nthread,
                                   const int* thread_cores) {
 	int host_core = -1;
@@ -87,7 +87,8 @@ using std::endl;
 		try { code; } \
 		catch( BFexception const& err ) { \
 			onfail; \
-			if( err.status() != BF_STATUS_END_OF_DATA ) { \
+			if( err.status() != BF_STATUS_END_OF_DATA && \
+			    err.status() != BF_STATUS_WOULD_BLOCK ) { \
 				BF_REPORT_ERROR(err.status()); \
 			} \
 			return err.status(); \
@@ -116,7 +117,8 @@ using std::endl;
 #define BF_ASSERT_EXCEPTION(pred, err) \
 	do { \
 		if( !(pred) ) { \
-			if( err != BF_STATUS_END_OF_DATA ) { \
+			if( err != BF_STATUS_END_OF_DATA && \
+			    err != BF_STATUS_WOULD_BLOCK ) { \
 				BF_REPORT_ERROR(err); \
 			} \
 			throw BFexception(err); \
@@ -43,6 +43,8 @@ extern "C" {
 // Note: Pass core=-1 to unbind
 BFstatus bfAffinitySetCore(int core);
 BFstatus bfAffinityGetCore(int* core);
+// Note: Returns node=-1 if the system does not have multiple NUMA nodes
+BFstatus bfAffinityGetNumaNode(int core, int* node);
 BFstatus bfAffinitySetOpenMPCores(BFsize     nthread,
                                   const int* thread_cores);
 
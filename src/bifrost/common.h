@@ -66,6 +66,7 @@ typedef enum {
 	BF_STATUS_INVALID_SHAPE                            = 7,
 	BF_STATUS_INVALID_STRIDE                           = 8,
 	BF_STATUS_INVALID_DTYPE                            = 9,
+	BF_STATUS_WOULD_BLOCK                              = 10,
 	BF_STATUS_MEM_ALLOC_FAILED                         = 16,
 	BF_STATUS_MEM_OP_FAILED                            = 17,
 	BF_STATUS_UNSUPPORTED                              = 18,
@@ -52,7 +52,26 @@ typedef enum {
 	BF_SPACE_CUDA_MANAGED = 4  // cudaMallocManaged
 } BFspace;
 
+// Placement options for BF_SPACE_SYSTEM allocations (may be OR'd together)
+typedef enum {
+	BF_MALLOC_DEFAULT            = 0,
+	BF_MALLOC_HUGEPAGES          = 1 << 0, // Transparent huge pages (madvise)
+	BF_MALLOC_HUGEPAGES_EXPLICIT = 1 << 1, // Reserved (hugetlbfs) huge pages
+	BF_MALLOC_PREFAULT           = 1 << 2, // Touch all pages up front
+	BF_MALLOC_LOCK               = 1 << 3  // mlock the pages into RAM
+} BFmalloc_flags;
+
 BFstatus bfMalloc(void** ptr, BFsize size, BFspace space);
+/*! \p flags is a combination of BFmalloc_flags, and \p numa_node is the
+ *    NUMA node to bind the memory to (or -1 for no binding). Options other
+ *    than the defaults are only supported for BF_SPACE_SYSTEM.
+ *  Memory allocated with this function must be freed with bfFree.
+ */
+BFstatus bfMallocEx(void**   ptr,
+                    BFsize   size,
+                    BFspace  space,
+                    unsigned flags,
+                    int      numa_node);
 BFstatus bfFree(void* ptr, BFspace space);
 
 BFstatus bfGetSpace(const void* ptr, BFspace* space);
@@ -67,11 +67,25 @@ typedef struct BFwsequence_impl*   BFwsequence;
 typedef struct BFspan_impl*        BFspan;
 typedef struct BFrspan_impl*       BFrspan;
 typedef struct BFwspan_impl*       BFwspan;
+typedef struct BFsnapshot_impl*    BFsnapshot;
 
 // TODO: bfCudaEnabled
 
 // Ring
 BFstatus bfRingCreate(BFring* ring, BFspace space);
+/*! \p bfRingCreateShared creates a ring in POSIX shared memory that other
+ *  processes can attach to by name using \p bfRingAttachShared.
+ *
+ * \param ring  Pointer to the returned ring handle
+ * \param name  Unique name of the ring (must not contain '/')
+ * \param space Memory space of the ring (must be BF_SPACE_SYSTEM)
+ * \note Readers and writers may live in any of the attached processes.
+ * The shared memory is unlinked when the creating process destroys the
+ * ring; processes that are still attached remain valid until they too
+ * destroy their handles.
+ */
+BFstatus bfRingCreateShared(BFring* ring, const char* name, BFspace space);
+BFstatus bfRingAttachShared(BFring* ring, const char* name);
 BFstatus bfRingDestroy(BFring ring);
 /*! \p bfRingResize requests allocation of memory for the ring
  * 
@@ -89,6 +103,78 @@ BFstatus bfRingResize(BFring ring,
                       BFsize capacity_bytes,
                       BFsize nringlet);
 BFstatus bfRingGetSpace(BFring ring, BFspace* space);
+/*! \p bfRingSetMirroring controls whether system-space rings use a
+ *  mirrored buffer, in which each ringlet's memory is mapped twice
+ *  back-to-back in virtual memory. This makes spans of up to the full
+ *  ring size contiguous without any ghost-region copies.
+ *
+ * \note Mirroring is enabled by default. Changes take effect at the next
+ * reallocation. If a mirrored mapping cannot be created, the ring falls
+ * back to a regular buffer with a ghost region; \p bfRingGetMirrored
+ * reports which kind of buffer is currently in use.
+ */
+BFstatus bfRingSetMirroring(BFring ring, BFbool enabled);
+BFstatus bfRingGetMirrored(BFring ring, BFbool* mirrored);
+/*! \p bfRingSetAllocOptions sets the placement options used when allocating
+ *  a system-space ring's buffer.
+ *
+ *  \p flags is a combination of BFmalloc_flags (see bifrost/memory.h), and
+ *  \p numa_node is the NUMA node to bind the buffer to (or -1 for none).
+ *
+ * \note Changes take effect at the next reallocation. Explicit huge pages
+ * round the size of mirrored buffers up to a multiple of the huge page size;
+ * shared rings cannot use explicit huge pages and fall back to transparent
+ * ones.
+ */
+BFstatus bfRingSetAllocOptions(BFring ring, unsigned flags, int numa_node);
+BFstatus bfRingGetAllocOptions(BFring ring, unsigned* flags, int* numa_node);
+typedef enum {
+	BF_RING_WAIT_BLOCK = 0, // Block on a condition variable
+	BF_RING_WAIT_SPIN  = 1, // Spin for a limited time, then block
+	BF_RING_WAIT_POLL  = 2  // Busy-poll; never block
+} BFring_wait_policy;
+/*! \p bfRingSetWaitPolicy controls how readers and writers of a ring wait
+ *  for data or space to become available.
+ *
+ *  \p spin_count is the no. pause iterations to spin for before blocking
+ *  when \p policy is BF_RING_WAIT_SPIN (it is ignored otherwise).
+ *
+ * \note Spinning avoids the cost of a sleep and wakeup for each span handoff
+ * at the expense of keeping a CPU core busy while waiting. Polling should
+ * only be used when every waiting thread has a dedicated core.
+ */
+BFstatus bfRingSetWaitPolicy(BFring             ring,
+                             BFring_wait_policy policy,
+                             BFsize             spin_count);
+BFstatus bfRingGetWaitPolicy(BFring              ring,
+                             BFring_wait_policy* policy,
+                             BFsize*             spin_count);
+/*! \p bfRingSetSPSC enables single-producer/single-consumer mode, in which
+ *  spans are reserved, committed, acquired and released without taking the
+ *  ring's lock whenever possible.
+ *
+ * \note In this mode the ring must be written by only one thread and read by
+ * only one thread, and at most one sequence may be open for reading at a
+ * time. The lock-free path is only used with mirrored buffers (see
+ * \p bfRingSetMirroring), and shared rings do not support this mode. It must
+ * be enabled before writing begins.
+ */
+BFstatus bfRingSetSPSC(BFring ring, BFbool enabled);
+BFstatus bfRingGetSPSC(BFring ring, BFbool* enabled);
+/*! \p bfRingExpectReaders protects the first sequence written to the ring
+ *  for \p nreader guaranteed readers that may not yet have opened it.
+ *
+ * \note Until each of these readers opens the sequence (with a guarantee),
+ * the ring holds a guarantee at its beginning on the reader's behalf, so the
+ * writer blocks rather than overwriting data that the reader has not seen.
+ * This must be called before writing begins.
+ */
+BFstatus bfRingExpectReaders(BFring ring, BFsize nreader);
+/*! \p bfRingCancelExpectedReader stops protecting the first sequence for
+ *  one of the readers given to \p bfRingExpectReaders, which will not open
+ *  it after all (e.g., because it failed).
+ */
+BFstatus bfRingCancelExpectedReader(BFring ring);
 
 //BFsize   bfRingGetNRinglet(BFring ring);
 // TODO: BFsize bfRingGetSizeBytes
@@ -104,6 +190,46 @@ BFstatus bfRingLockedGetContiguousSpan(BFring ring, BFsize* val);
 BFstatus bfRingLockedGetTotalSpan(BFring ring, BFsize* val);
 BFstatus bfRingLockedGetNRinglet(BFring ring, BFsize* val);
 BFstatus bfRingLockedGetStride(BFring ring, BFsize* val);
+/*! \p bfRingGetGhostCopyStats returns the total no. bytes (summed over
+ *  ringlets) copied into and out of the ghost region of a non-mirrored
+ *  ring to keep spans that cross the end of the buffer contiguous.
+ */
+BFstatus bfRingGetGhostCopyStats(BFring  ring,
+                                 BFsize* nbyte_to_ghost,
+                                 BFsize* nbyte_from_ghost);
+
+#define BF_RING_STATS_MAX_GUARANTEES 32
+
+typedef struct {
+	BFoffset tail;
+	BFoffset head;
+	BFoffset reserve_head;
+	BFsize   capacity;          // Bytes per ringlet
+	BFsize   nringlet;
+	BFoffset nbyte_committed;   // Total bytes committed by writers
+	BFoffset nbyte_overwritten; // Bytes requested by unguaranteed readers
+	                            //   that had already been overwritten
+	// Distance of each guaranteed reader behind the head, most-lagging
+	//   first (only the first BF_RING_STATS_MAX_GUARANTEES are reported)
+	BFsize   nguarantee;
+	BFsize   guarantee_lag[BF_RING_STATS_MAX_GUARANTEES];
+	// No. waits that blocked and total time (secs) spent blocked in them
+	BFsize   read_wait_count;        // Readers waiting for data
+	double   read_wait_time;
+	BFsize   write_wait_count;       // Writers waiting for readers (guarantees)
+	double   write_wait_time;
+	BFsize   write_close_wait_count; // Writers committing out of order
+	double   write_close_wait_time;
+	BFsize   realloc_wait_count;     // Resizes waiting for open spans
+	double   realloc_wait_time;
+	BFsize   nbyte_copied_to_ghost;
+	BFsize   nbyte_copied_from_ghost;
+} BFring_stats;
+/*! \p bfRingGetStats returns a snapshot of a ring's occupancy and
+ *  contention statistics. All counters are cumulative over the life of
+ *  the ring.
+ */
+BFstatus bfRingGetStats(BFring ring, BFring_stats* stats);
 
 // Note: These allow one to ensure that processing is completed before
 //         the ring is destroyed. EndWriting effects an end to the
@@ -123,6 +249,20 @@ BFstatus bfRingSequenceBegin(BFwsequence* sequence,
                              BFoffset     offset_from_head);
 BFstatus bfRingSequenceEnd(BFwsequence sequence,
                            BFoffset    offset_from_head);
+/*! \p bfRingSequenceSetTimeScale adds a sequence to the ring's time index,
+ *  allowing readers to open it at an arbitrary time using
+ *  \p bfRingSequenceOpenAtTime.
+ *
+ *  \p time0 is the time of the sequence's first frame, \p frame_period is
+ *  the time between frames (in the same, arbitrary, units), and
+ *  \p frame_nbyte is the size of each frame.
+ *
+ * \note This should be called immediately after \p bfRingSequenceBegin.
+ */
+BFstatus bfRingSequenceSetTimeScale(BFwsequence sequence,
+                                    double      time0,
+                                    double      frame_period,
+                                    BFsize      frame_nbyte);
 
 // Sequence read
 BFstatus bfRingSequenceOpen(BFrsequence* sequence,
@@ -140,6 +280,19 @@ BFstatus bfRingSequenceOpenAt(BFrsequence* sequence,
                               BFring       ring,
                               BFoffset     time_tag,
                               BFbool       guarantee);
+/*! \p bfRingSequenceOpenAtTime opens the sequence containing \p time,
+ *  using the ring's time index (see \p bfRingSequenceSetTimeScale), and
+ *  returns in \p offset the byte offset within it of the frame containing
+ *  \p time. If \p guarantee is true, the guarantee starts at \p offset.
+ *
+ * \note The same restrictions on \p time apply as for
+ * \p bfRingSequenceOpenAt. Sequences without a time scale are not indexed.
+ */
+BFstatus bfRingSequenceOpenAtTime(BFrsequence* sequence,
+                                  BFring       ring,
+                                  double       time,
+                                  BFbool       guarantee,
+                                  BFoffset*    offset);
 BFstatus bfRingSequenceOpenLatest(BFrsequence* sequence,
                                   BFring       ring,
                                   BFbool       guarantee);
@@ -151,6 +304,40 @@ BFstatus bfRingSequenceOpenEarliest(BFrsequence* sequence,
 BFstatus bfRingSequenceNext(BFrsequence sequence);
 BFstatus bfRingSequenceOpenSame(BFrsequence* sequence, BFrsequence existing);
 BFstatus bfRingSequenceClose(BFrsequence sequence);
+typedef enum {
+	BF_RING_OVERRUN_BLOCK = 0, // Block the writer until the reader catches up
+	BF_RING_OVERRUN_DROP  = 1, // Never block the writer; skip lost data
+	BF_RING_OVERRUN_LAG   = 2  // Block the writer up to a max lag, then skip
+} BFring_overrun_policy;
+/*! \p bfRingSequenceSetOverrunPolicy controls what happens when the writer
+ *  of a ring catches up with this reader.
+ *
+ *  With BF_RING_OVERRUN_BLOCK the writer waits for the reader (as for a
+ *  guaranteed read). With BF_RING_OVERRUN_DROP the reader never holds the
+ *  writer back. With BF_RING_OVERRUN_LAG the writer waits for the reader
+ *  only while it is within \p max_lag bytes of the writer; beyond that the
+ *  reader's oldest data are dropped instead (\p max_lag is ignored
+ *  otherwise, and a \p max_lag of at least the ring's capacity is the same
+ *  as BF_RING_OVERRUN_BLOCK).
+ *
+ *  Under the drop and lag policies, acquiring a span that has (partly)
+ *  been lost skips forward by a multiple of \p frame_nbyte to the earliest
+ *  data still available and returns a full-size span there; the no. bytes
+ *  skipped by this reader is given by \p bfRingSequenceGetNSkipped.
+ *
+ * \note The guarantee is re-placed at the start of the sequence (or the
+ * tail of the ring) when the policy is set, so this should be called
+ * before reading. The policy persists across \p bfRingSequenceNext.
+ * BF_RING_OVERRUN_LAG is not supported by shared or SPSC rings.
+ */
+BFstatus bfRingSequenceSetOverrunPolicy(BFrsequence           sequence,
+                                        BFring_overrun_policy policy,
+                                        BFsize                max_lag,
+                                        BFsize                frame_nbyte);
+/*! \p bfRingSequenceGetNSkipped returns the total no. bytes that this
+ *  reader has lost to the writer so far (across all of its sequences).
+ */
+BFstatus bfRingSequenceGetNSkipped(BFrsequence sequence, BFsize* nbyte_skipped);
 
 // Sequence common
 BFstatus bfRingSequenceGetRing(BFsequence sequence, BFring* ring);
@@ -178,11 +365,30 @@ BFstatus bfRingSpanReserve(BFwspan*    span,
                            BFsize      size);
 BFstatus bfRingSpanCommit(BFwspan span,
                           BFsize  size);
+/*! \p bfRingSpanReserveTimeout is like \p bfRingSpanReserve, but gives up
+ *  and returns \p BF_STATUS_WOULD_BLOCK if space does not become available
+ *  within \p timeout_secs. A timeout of 0 never blocks (try-only), and a
+ *  negative timeout waits forever.
+ */
+BFstatus bfRingSpanReserveTimeout(BFwspan* span,
+                                  BFring   ring,
+                                  BFsize   size,
+                                  double   timeout_secs);
 // Read span
 BFstatus bfRingSpanAcquire(BFrspan*    span,
                            BFrsequence sequence,
                            BFoffset    offset,
                            BFsize      size);
+/*! \p bfRingSpanAcquireTimeout is like \p bfRingSpanAcquire, but gives up
+ *  and returns \p BF_STATUS_WOULD_BLOCK if the requested data does not
+ *  arrive within \p timeout_secs. A timeout of 0 never blocks (try-only),
+ *  and a negative timeout waits forever.
+ */
+BFstatus bfRingSpanAcquireTimeout(BFrspan*    span,
+                                  BFrsequence sequence,
+                                  BFoffset    offset,
+                                  BFsize      size,
+                                  double      timeout_secs);
 BFstatus bfRingSpanRelease(BFrspan span);
 
 //BFstatus bfRingSpanClose(BFrspan span);
@@ -208,6 +414,68 @@ typedef struct {
 	BFsize      nringlet;
 } BFspan_info;
 BFstatus bfRingSpanGetInfo(BFspan span, BFspan_info* span_info);
+/*! \p bfRingSpanReserveInfo and \p bfRingSpanAcquireInfo combine
+ *  \p bfRingSpanReserveTimeout and \p bfRingSpanAcquireTimeout
+ *  (respectively) with \p bfRingSpanGetInfo, saving a call per span. A
+ *  negative \p timeout_secs waits forever.
+ */
+BFstatus bfRingSpanReserveInfo(BFwspan*     span,
+                               BFring       ring,
+                               BFsize       size,
+                               double       timeout_secs,
+                               BFspan_info* span_info);
+BFstatus bfRingSpanAcquireInfo(BFrspan*     span,
+                               BFrsequence  sequence,
+                               BFoffset     offset,
+                               BFsize       size,
+                               double       timeout_secs,
+                               BFspan_info* span_info);
+
+// Snapshot
+/*! \p bfRingSnapshotBegin starts writing a range of a sequence to a file on
+ *  a background thread.
+ *
+ *  The sequence is selected by \p time_tag as for \p bfRingSequenceOpenAt,
+ *  and the range is the \p size bytes starting \p offset bytes into it.
+ *  The range is pinned (guaranteed) before this function returns, so the
+ *  writer cannot overwrite it until it has been written out, and the pin is
+ *  moved forward as each chunk is written. Any part of the range that has
+ *  already been overwritten is skipped (in whole multiples of
+ *  \p frame_nbyte), and the range is truncated if the sequence ends before
+ *  it. Parts of the range that have not yet been
+ *  written to the ring are waited for. The ringlets of the range are written
+ *  one after another, each occupying \p size bytes of the file.
+ *
+ *  If \p direct_io is true, the file is opened with O_DIRECT and written
+ *  via an aligned bounce buffer, bypassing the page cache.
+ *
+ * \note The pin stalls the ring's writer if the file cannot be written as
+ * fast as the ring is being filled and the ring fills up.
+ */
+BFstatus bfRingSnapshotBegin(BFsnapshot* snapshot,
+                             BFring      ring,
+                             BFoffset    time_tag,
+                             BFoffset    offset,
+                             BFsize      size,
+                             BFsize      frame_nbyte,
+                             const char* filename,
+                             BFbool      direct_io);
+/*! \p bfRingSnapshotWait waits for a snapshot to finish and returns the
+ *  status of the write. It returns \p BF_STATUS_WOULD_BLOCK if the snapshot
+ *  has not finished within \p timeout_secs (a negative timeout waits
+ *  forever).
+ */
+BFstatus bfRingSnapshotWait(BFsnapshot snapshot, double timeout_secs);
+typedef struct {
+	BFoffset offset;        // Byte offset of the file's data in the sequence
+	BFsize   size;          // No. bytes per ringlet in the file
+	BFsize   nbyte_written; // No. bytes per ringlet written so far
+	BFsize   nringlet;
+	BFbool   finished;
+} BFsnapshot_info;
+BFstatus bfRingSnapshotGetInfo(BFsnapshot snapshot, BFsnapshot_info* info);
+// Note: This cancels the snapshot if it has not finished
+BFstatus bfRingSnapshotDestroy(BFsnapshot snapshot);
 
 #ifdef __cplusplus
 } // extern "C"
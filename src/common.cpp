@@ -44,6 +44,7 @@ const char* bfGetStatusString(BFstatus status) {
 		BF_STATUS_STRING_CASE(BF_STATUS_INVALID_SHAPE);
 		BF_STATUS_STRING_CASE(BF_STATUS_INVALID_STRIDE);
 		BF_STATUS_STRING_CASE(BF_STATUS_INVALID_DTYPE);
+		BF_STATUS_STRING_CASE(BF_STATUS_WOULD_BLOCK);
 		BF_STATUS_STRING_CASE(BF_STATUS_MEM_ALLOC_FAILED);
 		BF_STATUS_STRING_CASE(BF_STATUS_MEM_OP_FAILED);
 		BF_STATUS_STRING_CASE(BF_STATUS_UNSUPPORTED);
@@ -28,12 +28,19 @@
  */
 
 #include <bifrost/memory.h>
+#include "memory.hpp"
 #include "utils.hpp"
 #include "cuda.hpp"
 
 #include <cstdlib> // For posix_memalign
 #include <cstring> // For memcpy
+#include <cstdio>
 #include <iostream>
+#include <map>
+#include <mutex>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/syscall.h>
 
 #define BF_IS_POW2(x) (x) && !((x) & ((x) - 1))
 static_assert(BF_IS_POW2(BF_ALIGNMENT), "BF_ALIGNMENT must be a power of 2");
@@ -74,11 +81,145 @@ BFstatus bfGetSpace(const void* ptr, BFspace* space) {
 	return BF_STATUS_SUCCESS;
 }
 
+// Note: These are defined here to avoid a dependency on libnuma
+#ifndef MPOL_BIND
+#define MPOL_BIND 2
+#endif
+#ifndef MADV_HUGEPAGE
+#define MADV_HUGEPAGE 14
+#endif
+
+// System memory allocated with placement options is mmap'd rather than
+//   malloc'd, so we keep track of it here in order to free it correctly.
+class MappedAllocations {
+	std::map<void*,BFsize> _sizes;
+	std::mutex             _mutex;
+public:
+	void insert(void* ptr, BFsize nbyte) {
+		std::lock_guard<std::mutex> lock(_mutex);
+		_sizes[ptr] = nbyte;
+	}
+	// Returns the size of the mapping, or 0 if ptr was not mapped here
+	BFsize remove(void* ptr) {
+		std::lock_guard<std::mutex> lock(_mutex);
+		std::map<void*,BFsize>::iterator it = _sizes.find(ptr);
+		if( it == _sizes.end() ) {
+			return 0;
+		}
+		BFsize nbyte = it->second;
+		_sizes.erase(it);
+		return nbyte;
+	}
+};
+static MappedAllocations g_mapped_allocations;
+
+BFsize explicit_hugepage_size() {
+	static BFsize size = 0;
+	if( !size ) {
+		size = 2*1024*1024; // Default for x86 and most ARM systems
+		FILE* meminfo = ::fopen("/proc/meminfo", "r");
+		if( meminfo ) {
+			char line[256];
+			unsigned long kb;
+			while( ::fgets(line, sizeof(line), meminfo) ) {
+				if( ::sscanf(line, "Hugepagesize: %lu kB", &kb) == 1 ) {
+					size = kb*1024;
+					break;
+				}
+			}
+			::fclose(meminfo);
+		}
+	}
+	return size;
+}
+static BFstatus bind_to_numa_node(void* ptr, BFsize nbyte, int numa_node) {
+#if defined __linux__ && defined SYS_mbind
+	const int MAX_NUMA_NODE = 1024;
+	BF_ASSERT(numa_node >= 0 && numa_node < MAX_NUMA_NODE,
+	          BF_STATUS_INVALID_ARGUMENT);
+	const int NBIT = sizeof(unsigned long)*8;
+	unsigned long nodemask[MAX_NUMA_NODE/NBIT] = {0};
+	nodemask[numa_node/NBIT] = 1ul << (numa_node % NBIT);
+	// Note: The kernel expects maxnode to be one more than the no. bits
+	long ret = ::syscall(SYS_mbind, ptr, nbyte, MPOL_BIND,
+	                     nodemask, (unsigned long)MAX_NUMA_NODE+1, 0u);
+	BF_ASSERT(ret == 0, BF_STATUS_UNSUPPORTED);
+	return BF_STATUS_SUCCESS;
+#else
+	BF_FAIL("NUMA binding supported", BF_STATUS_UNSUPPORTED);
+#endif
+}
+BFstatus apply_memory_placement(void*    ptr,
+                                BFsize   nbyte,
+                                unsigned flags,
+                                int      numa_node) {
+	// Note: The binding must be applied before the pages are first touched
+	if( numa_node >= 0 ) {
+		BFstatus ret = bind_to_numa_node(ptr, nbyte, numa_node);
+		if( ret != BF_STATUS_SUCCESS ) {
+			return ret;
+		}
+	}
+	if( flags & (BF_MALLOC_HUGEPAGES | BF_MALLOC_HUGEPAGES_EXPLICIT) ) {
+		// Note: This is only advice, so failure (e.g., because THP is
+		//         disabled) is not an error.
+		::madvise(ptr, nbyte, MADV_HUGEPAGE);
+	}
+	if( flags & BF_MALLOC_PREFAULT ) {
+		// Note: The memory is freshly mapped and therefore already zeroed
+		BFsize page_size = sysconf(_SC_PAGESIZE);
+		volatile char* data = (volatile char*)ptr;
+		for( BFsize i=0; i<nbyte; i+=page_size ) {
+			data[i] = 0;
+		}
+	}
+	if( flags & BF_MALLOC_LOCK ) {
+		BF_ASSERT(::mlock(ptr, nbyte) == 0, BF_STATUS_MEM_ALLOC_FAILED);
+	}
+	return BF_STATUS_SUCCESS;
+}
+static BFstatus map_system_memory(void**   ptr,
+                                  BFsize   size,
+                                  unsigned flags,
+                                  int      numa_node) {
+	int    mmap_flags = MAP_PRIVATE | MAP_ANONYMOUS;
+	BFsize nbyte      = round_up(std::max(size, (BFsize)1), sysconf(_SC_PAGESIZE));
+	if( flags & BF_MALLOC_HUGEPAGES_EXPLICIT ) {
+#ifdef MAP_HUGETLB
+		mmap_flags |= MAP_HUGETLB;
+		nbyte = round_up(nbyte, explicit_hugepage_size());
+#else
+		BF_FAIL("Explicit huge pages supported", BF_STATUS_UNSUPPORTED);
+#endif
+	}
+	void* data = ::mmap(0, nbyte, PROT_READ | PROT_WRITE, mmap_flags, -1, 0);
+	// Note: This fails if not enough huge pages have been reserved
+	BF_ASSERT(data != MAP_FAILED, BF_STATUS_MEM_ALLOC_FAILED);
+	BFstatus ret = apply_memory_placement(data, nbyte, flags, numa_node);
+	if( ret != BF_STATUS_SUCCESS ) {
+		::munmap(data, nbyte);
+		return ret;
+	}
+	g_mapped_allocations.insert(data, nbyte);
+	*ptr = data;
+	return BF_STATUS_SUCCESS;
+}
+
 BFstatus bfMalloc(void** ptr, BFsize size, BFspace space) {
+	return bfMallocEx(ptr, size, space, BF_MALLOC_DEFAULT, -1);
+}
+BFstatus bfMallocEx(void**   ptr,
+                    BFsize   size,
+                    BFspace  space,
+                    unsigned flags,
+                    int      numa_node) {
 	//printf("bfMalloc(%p, %lu, %i)\n", ptr, size, space);
 	void* data;
 	switch( space ) {
 	case BF_SPACE_SYSTEM: {
+		if( flags != BF_MALLOC_DEFAULT || numa_node >= 0 ) {
+			return map_system_memory(ptr, size, flags, numa_node);
+		}
 		//data = std::aligned_alloc(std::max(BF_ALIGNMENT,8), size);
 		int err = ::posix_memalign((void**)&data, std::max(BF_ALIGNMENT,8), size);
 		BF_ASSERT(!err, BF_STATUS_MEM_ALLOC_FAILED);
@@ -88,19 +229,23 @@ BFstatus bfMalloc(void** ptr, BFsize size, BFspace space) {
 	}
 #if defined BF_CUDA_ENABLED && BF_CUDA_ENABLED
 	case BF_SPACE_CUDA: {
+		BF_ASSERT(flags == BF_MALLOC_DEFAULT && numa_node < 0,
+		          BF_STATUS_UNSUPPORTED);
 		BF_CHECK_CUDA(cudaMalloc((void**)&data, size),
 		              BF_STATUS_MEM_ALLOC_FAILED);
 		break;
 	}
 	case BF_SPACE_CUDA_HOST: {
-		unsigned flags = cudaHostAllocDefault;
-		BF_CHECK_CUDA(cudaHostAlloc((void**)&data, size, flags),
+		BF_ASSERT(flags == BF_MALLOC_DEFAULT && numa_node < 0,
+		          BF_STATUS_UNSUPPORTED);
+		BF_CHECK_CUDA(cudaHostAlloc((void**)&data, size, cudaHostAllocDefault),
 		              BF_STATUS_MEM_ALLOC_FAILED);
 		break;
 	}
 	case BF_SPACE_CUDA_MANAGED: {
-		unsigned flags = cudaMemAttachGlobal;
-		BF_CHECK_CUDA(cudaMallocManaged((void**)&data, size, flags),
+		BF_ASSERT(flags == BF_MALLOC_DEFAULT && numa_node < 0,
+		          BF_STATUS_UNSUPPORTED);
+		BF_CHECK_CUDA(cudaMallocManaged((void**)&data, size, cudaMemAttachGlobal),
 		              BF_STATUS_MEM_ALLOC_FAILED);
 		break;
 	}
@@ -117,7 +262,12 @@ BFstatus bfFree(void* ptr, BFspace space) {
 		bfGetSpace(ptr, &space);
 	}
 	switch( space ) {
-	case BF_SPACE_SYSTEM:       ::free(ptr); break;
+	case BF_SPACE_SYSTEM: {
+		BFsize nbyte = g_mapped_allocations.remove(ptr);
+		if( nbyte ) ::munmap(ptr, nbyte);
+		else        ::free(ptr);
+		break;
+	}
 #if defined BF_CUDA_ENABLED && BF_CUDA_ENABLED
 	case BF_SPACE_CUDA:         cudaFree(ptr); break;
 	case BF_SPACE_CUDA_HOST:    cudaFreeHost(ptr); break;
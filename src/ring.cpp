@@ -39,6 +39,18 @@ BFstatus bfRingCreate(BFring* ring, BFspace space) {
 	BF_TRY_RETURN_ELSE(*ring = new BFring_impl(space),
 	                   *ring = 0);
 }
+BFstatus bfRingCreateShared(BFring* ring, const char* name, BFspace space) {
+	BF_ASSERT(ring, BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(name, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN_ELSE(*ring = new BFring_impl(name, space),
+	                   *ring = 0);
+}
+BFstatus bfRingAttachShared(BFring* ring, const char* name) {
+	BF_ASSERT(ring, BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(name, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN_ELSE(*ring = new BFring_impl(name),
+	                   *ring = 0);
+}
 BFstatus bfRingDestroy(BFring ring) {
 	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
 	delete ring;
@@ -58,6 +70,66 @@ BFstatus bfRingGetSpace(BFring ring, BFspace* space) {
 	BF_ASSERT(space, BF_STATUS_INVALID_POINTER);
 	BF_TRY_RETURN(*space = ring->space());
 }
+BFstatus bfRingSetMirroring(BFring ring, BFbool enabled) {
+	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN(ring->set_mirror_enabled(enabled));
+}
+BFstatus bfRingSetAllocOptions(BFring ring, unsigned flags, int numa_node) {
+	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(!(flags & ~(BF_MALLOC_HUGEPAGES          |
+	                      BF_MALLOC_HUGEPAGES_EXPLICIT |
+	                      BF_MALLOC_PREFAULT           |
+	                      BF_MALLOC_LOCK)), BF_STATUS_INVALID_ARGUMENT);
+	BF_ASSERT(numa_node >= -1, BF_STATUS_INVALID_ARGUMENT);
+	BF_TRY_RETURN(ring->set_alloc_options(flags, numa_node));
+}
+BFstatus bfRingGetAllocOptions(BFring ring, unsigned* flags, int* numa_node) {
+	BF_ASSERT(ring,      BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(flags,     BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(numa_node, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN(ring->get_alloc_options(flags, numa_node));
+}
+BFstatus bfRingSetWaitPolicy(BFring             ring,
+                             BFring_wait_policy policy,
+                             BFsize             spin_count) {
+	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(policy == BF_RING_WAIT_BLOCK ||
+	          policy == BF_RING_WAIT_SPIN  ||
+	          policy == BF_RING_WAIT_POLL, BF_STATUS_INVALID_ARGUMENT);
+	BF_TRY_RETURN(ring->set_wait_policy(policy, spin_count));
+}
+BFstatus bfRingGetWaitPolicy(BFring              ring,
+                             BFring_wait_policy* policy,
+                             BFsize*             spin_count) {
+	BF_ASSERT(ring,       BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(policy,     BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(spin_count, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN(ring->get_wait_policy(policy, spin_count));
+}
+BFstatus bfRingSetSPSC(BFring ring, BFbool enabled) {
+	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN(ring->set_spsc(enabled));
+}
+BFstatus bfRingGetSPSC(BFring ring, BFbool* enabled) {
+	BF_ASSERT(ring,    BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(enabled, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN_ELSE(*enabled = ring->spsc(),
+	                   *enabled = 0);
+}
+BFstatus bfRingExpectReaders(BFring ring, BFsize nreader) {
+	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN(ring->expect_readers(nreader));
+}
+BFstatus bfRingCancelExpectedReader(BFring ring) {
+	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN(ring->cancel_expected_reader());
+}
+BFstatus bfRingGetMirrored(BFring ring, BFbool* mirrored) {
+	BF_ASSERT(ring,     BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(mirrored, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN_ELSE(*mirrored = ring->mirrored(),
+	                   *mirrored = 0);
+}
 //BFsize   bfRingGetNRinglet(BFring ring) {
 //	BF_ASSERT(ring, 0);
 //	return ring->nringlet();
@@ -96,6 +168,19 @@ BFstatus   bfRingLockedGetStride(BFring ring, BFsize* size) {
 	                   *size = 0);
 }
 
+BFstatus bfRingGetGhostCopyStats(BFring  ring,
+                                 BFsize* nbyte_to_ghost,
+                                 BFsize* nbyte_from_ghost) {
+	BF_ASSERT(ring,             BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(nbyte_to_ghost,   BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(nbyte_from_ghost, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN(ring->ghost_copy_stats(nbyte_to_ghost, nbyte_from_ghost));
+}
+BFstatus bfRingGetStats(BFring ring, BFring_stats* stats) {
+	BF_ASSERT(ring,  BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(stats, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN(ring->get_stats(stats));
+}
 BFstatus bfRingBeginWriting(BFring ring) {
 	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
 	BF_TRY_RETURN(ring->begin_writing());
@@ -148,6 +233,13 @@ BFstatus    bfRingSequenceEnd(BFwsequence sequence,
 	return BF_STATUS_SUCCESS;
 	*/
 }
+BFstatus bfRingSequenceSetTimeScale(BFwsequence sequence,
+                                    double      time0,
+                                    double      frame_period,
+                                    BFsize      frame_nbyte) {
+	BF_ASSERT(sequence, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN(sequence->set_time_scale(time0, frame_period, frame_nbyte));
+}
 
 BFstatus bfRingSequenceOpen(BFrsequence* sequence,
                             BFring       ring,
@@ -174,6 +266,20 @@ BFstatus bfRingSequenceOpenAt(BFrsequence* sequence,
 	                                                    guarantee),
 	                   *sequence = 0);
 }
+BFstatus bfRingSequenceOpenAtTime(BFrsequence* sequence,
+                                  BFring       ring,
+                                  double       time,
+                                  BFbool       guarantee,
+                                  BFoffset*    offset) {
+	BF_ASSERT(sequence, BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(ring,     BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(offset,   BF_STATUS_INVALID_POINTER);
+	BFsequence_sptr found;
+	BF_TRY_ELSE(found = ring->get_sequence_at_time(time, offset),
+	            *sequence = 0);
+	BF_TRY_RETURN_ELSE(*sequence = new BFrsequence_impl(found, guarantee, *offset),
+	                   *sequence = 0);
+}
 BFstatus bfRingSequenceOpenLatest(BFrsequence* sequence,
                                   BFring       ring,
                                   BFbool       guarantee) {
@@ -252,6 +358,19 @@ BFstatus bfRingSequenceClose(BFrsequence sequence) {
 	//delete sequence; // Delete the smart pointer
 	//return BF_STATUS_SUCCESS;
 }
+BFstatus bfRingSequenceSetOverrunPolicy(BFrsequence           sequence,
+                                        BFring_overrun_policy policy,
+                                        BFsize                max_lag,
+                                        BFsize                frame_nbyte) {
+	BF_ASSERT(sequence, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN(sequence->set_overrun_policy(policy, max_lag, frame_nbyte));
+}
+BFstatus bfRingSequenceGetNSkipped(BFrsequence sequence, BFsize* nbyte_skipped) {
+	BF_ASSERT(sequence,      BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(nbyte_skipped, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN_ELSE(*nbyte_skipped = sequence->nbyte_skipped(),
+	                   *nbyte_skipped = 0);
+}
 
 BFstatus    bfRingSequenceGetRing(BFsequence sequence, BFring* ring) {
 	BF_ASSERT(sequence, BF_STATUS_INVALID_HANDLE);
@@ -302,6 +421,15 @@ BFstatus   bfRingSpanReserve(BFwspan*    span,
 	                                            size),
 	                   *span = 0);
 }
+BFstatus   bfRingSpanReserveTimeout(BFwspan* span,
+                                    BFring   ring,
+                                    BFsize   size,
+                                    double   timeout_secs) {
+	BF_ASSERT(span, BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(ring, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN_ELSE(*span = new BFwspan_impl(ring, size, timeout_secs),
+	                   *span = 0);
+}
 // TODO: Separate setsize/shrink vs. commit methods?
 BFstatus   bfRingSpanCommit(BFwspan span,
                             BFsize  size) {
@@ -318,6 +446,17 @@ BFstatus   bfRingSpanAcquire(BFrspan*    span,
 	BF_TRY_RETURN_ELSE(*span = new BFrspan_impl(sequence, offset, size),
 	                   *span = 0);
 }
+BFstatus   bfRingSpanAcquireTimeout(BFrspan*    span,
+                                    BFrsequence sequence,
+                                    BFoffset    offset,
+                                    BFsize      size,
+                                    double      timeout_secs) {
+	BF_ASSERT(span,     BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(sequence, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN_ELSE(*span = new BFrspan_impl(sequence, offset, size,
+	                                            timeout_secs),
+	                   *span = 0);
+}
 BFstatus   bfRingSpanRelease(BFrspan span) {
 	BF_ASSERT(span, BF_STATUS_INVALID_HANDLE);
 	delete span;
@@ -387,14 +526,45 @@ BFstatus bfRingSpanGetNRinglet(BFspan span, BFsize* val) {
 	BF_TRY_RETURN_ELSE(*val = span->nringlet(),
 	                   *val = 0);
 }
+static void get_span_info(BFspan span, BFspan_info* span_info) {
+	span_info->ring     = span->ring();
+	span_info->data     = span->data();
+	span_info->size     = span->size();
+	span_info->stride   = span->stride();
+	span_info->offset   = span->offset();
+	span_info->nringlet = span->nringlet();
+}
 BFstatus bfRingSpanGetInfo(BFspan span, BFspan_info* span_info) {
 	BF_ASSERT(span,      BF_STATUS_INVALID_HANDLE);
 	BF_ASSERT(span_info, BF_STATUS_INVALID_POINTER);
-	BF_TRY_RETURN_ELSE(span_info->ring     = span->ring();
-	                   span_info->data     = span->data();
-	                   span_info->size     = span->size();
-	                   span_info->stride   = span->stride();
-	                   span_info->offset   = span->offset();
-	                   span_info->nringlet = span->nringlet(),
+	BF_TRY_RETURN_ELSE(get_span_info(span, span_info),
+	                   ::memset(span_info, 0, sizeof(BFspan_info)));
+}
+BFstatus bfRingSpanReserveInfo(BFwspan*     span,
+                               BFring       ring,
+                               BFsize       size,
+                               double       timeout_secs,
+                               BFspan_info* span_info) {
+	BF_ASSERT(span,      BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(ring,      BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(span_info, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN_ELSE(*span = new BFwspan_impl(ring, size, timeout_secs);
+	                   get_span_info(*span, span_info),
+	                   *span = 0;
+	                   ::memset(span_info, 0, sizeof(BFspan_info)));
+}
+BFstatus bfRingSpanAcquireInfo(BFrspan*     span,
+                               BFrsequence  sequence,
+                               BFoffset     offset,
+                               BFsize       size,
+                               double       timeout_secs,
+                               BFspan_info* span_info) {
+	BF_ASSERT(span,      BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(sequence,  BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(span_info, BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN_ELSE(*span = new BFrspan_impl(sequence, offset, size,
+	                                            timeout_secs);
+	                   get_span_info(*span, span_info),
+	                   *span = 0;
 	                   ::memset(span_info, 0, sizeof(BFspan_info)));
 }
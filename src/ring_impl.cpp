@@ -52,6 +52,17 @@
 
 #include <bifrost/cuda.h>
 #include "cuda.hpp"
+#include "memory.hpp"
+
+#include <cstring>
+#include <cmath>
+#include <string>
+#include <atomic>
+#include <fcntl.h>
+#include <sys/syscall.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
 // This implements a lock with the condition that no reads or writes
 //   can be open while it is held.
@@ -68,27 +79,23 @@ public:
 	inline RingReallocLock(unique_lock_type& lock,
 	                       BFring_impl*      ring)
 		: _lock(lock), _ring(ring) {
-		++_ring->_nrealloc_pending;
-		_ring->_realloc_condition.wait(_lock, [&]() {
-			return (_ring->_nwrite_open == 0 &&
-			        _ring->_nread_open == 0);
+		// Note: The counters are accessed atomically because the SPSC fast
+		//         path uses them without holding the lock.
+		__atomic_fetch_add(&_ring->_nrealloc_pending, 1, __ATOMIC_SEQ_CST);
+		_ring->_wait(_ring->_realloc_condition, _lock,
+		             _ring->_state->realloc_wait, [&]() {
+			return (__atomic_load_n(&_ring->_nwrite_open, __ATOMIC_SEQ_CST) == 0 &&
+			        __atomic_load_n(&_ring->_nread_open,  __ATOMIC_SEQ_CST) == 0);
 		});
 	}
 	inline ~RingReallocLock() {
-		--_ring->_nrealloc_pending;
+		__atomic_fetch_sub(&_ring->_nrealloc_pending, 1, __ATOMIC_SEQ_CST);
 		_ring->_read_condition.notify_all();
 		_ring->_write_condition.notify_all();
 	}
 };
 
-BFring_impl::BFring_impl(BFspace space)
-	: _space(space), _buf(nullptr),
-	  _ghost_span(0), _span(0), _stride(0), _nringlet(0), _offset0(0),
-	  _tail(0), _head(0), _reserve_head(0),
-	  _ghost_dirty(false),
-	  _writing_begun(false), _writing_ended(false), _eod(0),
-	  _nread_open(0), _nwrite_open(0), _nrealloc_pending(0) {
-
+static void check_ring_space(BFspace space) {
 #if defined BF_CUDA_ENABLED && BF_CUDA_ENABLED
 	BF_ASSERT_EXCEPTION(space==BF_SPACE_SYSTEM       ||
 	                    space==BF_SPACE_CUDA         ||
@@ -100,11 +107,360 @@ BFring_impl::BFring_impl(BFspace space)
 	                    BF_STATUS_INVALID_ARGUMENT);
 #endif
 }
+static void init_ring_state(BFring_state* state, BFspace space,
+                            bool process_shared) {
+	::memset(state, 0, sizeof(BFring_state));
+	state->version = BFring_state::VERSION;
+	state->space   = space;
+	state->mutex.init(process_shared);
+	state->read_condition.init(process_shared);
+	state->write_condition.init(process_shared);
+	state->write_close_condition.init(process_shared);
+	state->realloc_condition.init(process_shared);
+	state->sequence_condition.init(process_shared);
+	state->guarantees.init();
+	state->ghost_dirty.clear();
+	state->mirror_enabled = true;
+	state->alloc_flags    = BF_MALLOC_DEFAULT;
+	state->numa_node      = -1;
+	state->wait_policy    = BF_RING_WAIT_BLOCK;
+	state->spsc           = false;
+	state->nsequence_slot = process_shared ? BFring_state::NSEQUENCE_SLOT : 0;
+}
+static BFring_state* create_private_state(BFspace space) {
+	check_ring_space(space);
+	BFring_state* state = new BFring_state;
+	init_ring_state(state, space, false);
+	state->magic = BFring_state::MAGIC;
+	return state;
+}
+
+// Shared rings consist of a control segment holding the BFring_state and
+//   a table of published sequences, plus a separate data segment for the
+//   buffer itself. Data segments are versioned by a generation number that
+//   is incremented each time the buffer is reallocated.
+static BFsize shared_state_offset() {
+	return round_up(sizeof(BFring_state), 64);
+}
+static BFsize shared_state_nbyte() {
+	return round_up(shared_state_offset() +
+	                BFring_state::NSEQUENCE_SLOT*sizeof(BFring_shared_sequence),
+	                4096);
+}
+static std::string shared_state_segment_name(std::string name) {
+	return "/bifrost_ring_" + name;
+}
+static std::string shared_buf_segment_name(std::string name,
+                                           BFoffset    generation) {
+	return "/bifrost_ring_" + name + "_buf" + std::to_string(generation);
+}
+static int open_shared_segment(std::string name, BFsize nbyte, bool create) {
+	int fd = shm_open(name.c_str(),
+	                  O_RDWR | (create ? O_CREAT | O_EXCL : 0),
+	                  S_IRUSR | S_IWUSR);
+	BF_ASSERT_EXCEPTION(fd != -1, BF_STATUS_INVALID_ARGUMENT);
+	if( create ) {
+		if( ftruncate(fd, nbyte) != 0 ) {
+			::close(fd);
+			shm_unlink(name.c_str());
+			throw BFexception(BF_STATUS_MEM_ALLOC_FAILED);
+		}
+	}
+	else {
+		struct stat st;
+		if( fstat(fd, &st) != 0 || (BFsize)st.st_size != nbyte ) {
+			::close(fd);
+			throw BFexception(BF_STATUS_INVALID_STATE);
+		}
+	}
+	return fd;
+}
+static void* map_shared_segment(std::string name, BFsize nbyte, bool create) {
+	int fd = open_shared_segment(name, nbyte, create);
+	void* ptr = mmap(0, nbyte, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+	::close(fd); // Note: The mapping remains valid after closing
+	if( ptr == MAP_FAILED ) {
+		if( create ) {
+			shm_unlink(name.c_str());
+		}
+		throw BFexception(BF_STATUS_MEM_ALLOC_FAILED);
+	}
+	return ptr;
+}
+
+// Mirrored buffers map the memory of each ringlet twice, back-to-back, so
+//   that any span of up to the full ringlet size is contiguous in virtual
+//   memory. This removes the need for ghost-region copies entirely.
+#ifndef MFD_HUGETLB
+#define MFD_HUGETLB 0x0004U
+#endif
+static BFsize mirror_granularity(bool explicit_hugepages) {
+	BFsize granularity = std::max((BFsize)sysconf(_SC_PAGESIZE), bfGetAlignment());
+	if( explicit_hugepages ) {
+		granularity = std::max(granularity, explicit_hugepage_size());
+	}
+	return granularity;
+}
+static int create_anonymous_fd(BFsize nbyte, bool explicit_hugepages) {
+	int fd = -1;
+#if defined __linux__ && defined SYS_memfd_create
+	fd = syscall(SYS_memfd_create, "bifrost_ring",
+	             explicit_hugepages ? MFD_HUGETLB : 0u);
+#endif
+	if( fd == -1 && explicit_hugepages ) {
+		// Note: POSIX shared memory cannot be backed by huge pages
+		return -1;
+	}
+	if( fd == -1 ) {
+		// Fall back to an immediately-unlinked POSIX shared memory segment
+		static std::atomic<unsigned> counter(0);
+		std::string name = ("/bifrost_anon_" + std::to_string(getpid()) +
+		                    "_" + std::to_string(counter++));
+		fd = shm_open(name.c_str(), O_RDWR | O_CREAT | O_EXCL, S_IRUSR | S_IWUSR);
+		if( fd == -1 ) {
+			return -1;
+		}
+		shm_unlink(name.c_str());
+	}
+	if( ftruncate(fd, nbyte) != 0 ) {
+		::close(fd);
+		return -1;
+	}
+	return fd;
+}
+// Returns nullptr on failure
+static void* map_mirrored(int fd, BFsize span, BFsize nringlet) {
+	BFsize nbyte = 2*span*nringlet;
+	// Reserve a contiguous range of address space to map into
+	uint8_t* base = (uint8_t*)mmap(0, nbyte, PROT_NONE,
+	                               MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+	if( base == MAP_FAILED ) {
+		return nullptr;
+	}
+	for( BFsize r=0; r<nringlet; ++r ) {
+		for( BFsize m=0; m<2; ++m ) {
+			void* ptr = mmap(base + (2*r+m)*span, span,
+			                 PROT_READ | PROT_WRITE, MAP_SHARED | MAP_FIXED,
+			                 fd, r*span);
+			if( ptr == MAP_FAILED ) {
+				munmap(base, nbyte);
+				return nullptr;
+			}
+		}
+	}
+	return base;
+}
+static void check_shared_name(const char* name) {
+	BF_ASSERT_EXCEPTION(name, BF_STATUS_INVALID_POINTER);
+	std::string sname(name);
+	BF_ASSERT_EXCEPTION(!sname.empty() && sname.size() < 200 &&
+	                    sname.find('/') == std::string::npos,
+	                    BF_STATUS_INVALID_ARGUMENT);
+}
+static BFring_state* create_shared_state(const char* name, BFspace space) {
+	check_shared_name(name);
+	check_ring_space(space);
+	// TODO: Support BF_SPACE_CUDA_HOST by registering the mapped memory
+	BF_ASSERT_EXCEPTION(space==BF_SPACE_SYSTEM, BF_STATUS_UNSUPPORTED_SPACE);
+	BFring_state* state = (BFring_state*)map_shared_segment(
+		shared_state_segment_name(name), shared_state_nbyte(), true);
+	init_ring_state(state, space, true);
+	// Note: The magic number is set last to mark the state as initialised
+	__sync_synchronize();
+	state->magic = BFring_state::MAGIC;
+	return state;
+}
+static BFring_state* attach_shared_state(const char* name) {
+	check_shared_name(name);
+	BFsize nbyte = shared_state_nbyte();
+	BFring_state* state = (BFring_state*)map_shared_segment(
+		shared_state_segment_name(name), nbyte, false);
+	__sync_synchronize();
+	if( state->magic   != BFring_state::MAGIC ||
+	    state->version != BFring_state::VERSION ) {
+		munmap(state, nbyte);
+		throw BFexception(BF_STATUS_INVALID_STATE);
+	}
+	return state;
+}
+
+BFring_impl::BFring_impl(BFring_state* state, BFsize state_nbyte,
+                         std::string shared_name, bool shared_owner)
+	: _shared_name(shared_name), _shared_owner(shared_owner),
+	  _shared_owner_pid(getpid()),
+	  _state(state), _state_nbyte(state_nbyte),
+	  _shared_sequences(nullptr), _nsequence_seen(0),
+	  _space(state->space), _buf(nullptr), _buf_nbyte(0), _buf_mirrored(false),
+	  _buf_generation(0),
+	  _ghost_span(state->ghost_span), _span(state->span),
+	  _stride(state->stride), _nringlet(state->nringlet),
+	  _offset0(state->offset0),
+	  _tail(state->tail), _head(state->head),
+	  _reserve_head(state->reserve_head),
+	  _ghost_dirty(state->ghost_dirty),
+	  _writing_begun(state->writing_begun),
+	  _writing_ended(state->writing_ended), _eod(state->eod),
+	  _mutex(state->mutex),
+	  _read_condition(state->read_condition),
+	  _write_condition(state->write_condition),
+	  _write_close_condition(state->write_close_condition),
+	  _realloc_condition(state->realloc_condition),
+	  _sequence_condition(state->sequence_condition),
+	  _nread_open(state->nread_open), _nwrite_open(state->nwrite_open),
+	  _nrealloc_pending(state->nrealloc_pending),
+	  _guarantees(state->guarantees) {
+	if( this->shared() ) {
+		_shared_sequences = (BFring_shared_sequence*)
+			((char*)state + shared_state_offset());
+	}
+}
+BFring_impl::BFring_impl(BFspace space)
+	: BFring_impl(create_private_state(space), sizeof(BFring_state),
+	              "", true) {}
+BFring_impl::BFring_impl(const char* name, BFspace space)
+	: BFring_impl(create_shared_state(name, space), shared_state_nbyte(),
+	              name, true) {}
+BFring_impl::BFring_impl(const char* name)
+	: BFring_impl(attach_shared_state(name), shared_state_nbyte(),
+	              name, false) {}
 BFring_impl::~BFring_impl() {
 	// TODO: Should check if anything is still open here?
+	if( !this->shared() ) {
+		if( _buf ) {
+			this->_free_buf(_buf, _buf_nbyte, _buf_mirrored, 0);
+		}
+		_state->mutex.destroy();
+		_state->read_condition.destroy();
+		_state->write_condition.destroy();
+		_state->write_close_condition.destroy();
+		_state->realloc_condition.destroy();
+		_state->sequence_condition.destroy();
+		delete _state;
+		return;
+	}
+	if( _buf ) {
+		munmap(_buf, _buf_nbyte);
+	}
+	// Note: Processes that are still attached retain valid mappings after
+	//         the segments are unlinked. Forked children inherit ownership,
+	//         but only the creating process unlinks.
+	if( _shared_owner && getpid() == _shared_owner_pid ) {
+		if( _state->buf_generation ) {
+			shm_unlink(shared_buf_segment_name(_shared_name,
+			                                   _state->buf_generation).c_str());
+		}
+		shm_unlink(shared_state_segment_name(_shared_name).c_str());
+	}
+	munmap(_state, _state_nbyte);
+}
+BFring_impl::pointer BFring_impl::_allocate_buf(BFsize    span,
+                                                BFsize    stride,
+                                                BFsize    nringlet,
+                                                bool      mirrored,
+                                                BFoffset* generation) {
+	*generation = this->shared() ? _state->buf_generation + 1 : 0;
+	std::string name = (this->shared() ?
+	                    shared_buf_segment_name(_shared_name, *generation) :
+	                    std::string());
+	if( mirrored ) {
+		// Note: This returns nullptr on failure so that the caller can
+		//         fall back to a regular (ghosted) buffer.
+		BFsize nbyte = span*nringlet;
+		int fd;
+		if( this->shared() ) {
+			try {
+				fd = open_shared_segment(name, nbyte, true);
+			}
+			catch( BFexception const& ) {
+				return nullptr;
+			}
+		}
+		else {
+			fd = create_anonymous_fd(nbyte, this->_explicit_hugepages());
+			if( fd == -1 ) {
+				return nullptr;
+			}
+		}
+		void* buf = map_mirrored(fd, span, nringlet);
+		::close(fd);
+		if( !buf && this->shared() ) {
+			shm_unlink(name.c_str());
+		}
+		if( buf ) {
+			this->_apply_alloc_options(buf, 2*nbyte, name);
+		}
+		return (pointer)buf;
+	}
+	BFsize nbyte = stride*nringlet;
+	if( !this->shared() ) {
+		pointer buf = nullptr;
+		BFstatus ret = bfMallocEx((void**)&buf, nbyte, _space,
+		                          _state->alloc_flags, _state->numa_node);
+		BF_ASSERT_EXCEPTION(ret == BF_STATUS_SUCCESS, ret);
+		return buf;
+	}
+	void* buf = map_shared_segment(name, nbyte, true);
+	this->_apply_alloc_options(buf, nbyte, name);
+	return (pointer)buf;
+}
+bool BFring_impl::_explicit_hugepages() const {
+	// Note: Shared rings fall back to transparent huge pages
+	return !this->shared() && (_state->alloc_flags & BF_MALLOC_HUGEPAGES_EXPLICIT);
+}
+void BFring_impl::_apply_alloc_options(void*       buf,
+                                       BFsize      nbyte,
+                                       std::string name) {
+	if( _state->alloc_flags == BF_MALLOC_DEFAULT && _state->numa_node < 0 ) {
+		return;
+	}
+	BFstatus ret = apply_memory_placement(buf, nbyte, _state->alloc_flags,
+	                                      _state->numa_node);
+	if( ret != BF_STATUS_SUCCESS ) {
+		munmap(buf, nbyte);
+		if( this->shared() ) {
+			shm_unlink(name.c_str());
+		}
+		throw BFexception(ret);
+	}
+}
+void BFring_impl::_free_buf(pointer  buf,
+                            BFsize   nbyte,
+                            bool     mirrored,
+                            BFoffset generation) {
+	if( !this->shared() && !mirrored ) {
+		bfFree(buf, _space);
+		return;
+	}
+	munmap(buf, nbyte);
+	if( this->shared() ) {
+		shm_unlink(shared_buf_segment_name(_shared_name, generation).c_str());
+	}
+}
+void BFring_impl::_sync_buf() {
+	// Ensures that this process' mapping of a shared ring's buffer is
+	//   current (it may have been reallocated by another process).
+	// Note: Must be called with the lock held
+	if( !this->shared() || _buf_generation == _state->buf_generation ) {
+		return;
+	}
 	if( _buf ) {
-		bfFree(_buf, _space);
+		munmap(_buf, _buf_nbyte);
+		_buf = nullptr;
+	}
+	std::string name = shared_buf_segment_name(_shared_name,
+	                                           _state->buf_generation);
+	if( _state->buf_mirrored ) {
+		int fd = open_shared_segment(name, _span*_nringlet, false);
+		_buf = (pointer)map_mirrored(fd, _span, _nringlet);
+		::close(fd);
+		BF_ASSERT_EXCEPTION(_buf, BF_STATUS_MEM_ALLOC_FAILED);
 	}
+	else {
+		_buf = (pointer)map_shared_segment(name, _state->buf_nbyte, false);
+	}
+	_buf_nbyte      = _state->buf_nbyte;
+	_buf_mirrored   = _state->buf_mirrored;
+	_buf_generation = _state->buf_generation;
 }
 void BFring_impl::resize(BFsize contiguous_span,
                          BFsize total_span,
@@ -117,6 +473,7 @@ void BFring_impl::resize(BFsize contiguous_span,
 		return;
 	}
 	realloc_lock_type realloc_lock(lock, this);
+	this->_sync_buf();
 	// Check if reallocation is still actually necessary
 	if( contiguous_span <= _ghost_span &&
 	    total_span      <= _span &&
@@ -136,11 +493,37 @@ void BFring_impl::resize(BFsize contiguous_span,
 	// TODO: Not sure if this is a good idea or not
 	//new_ghost_span = round_up_pow2(new_ghost_span);
 	new_ghost_span = round_up(new_ghost_span, bfGetAlignment());
-	BFsize  new_stride = new_span + new_ghost_span;
-	BFsize  new_nbyte  = new_stride*new_nringlet;
+	BFsize   new_stride;
+	BFsize   new_nbyte;
+	BFoffset new_generation;
+	pointer  new_buf      = nullptr;
+	bool     new_mirrored = (_state->mirror_enabled && _space == BF_SPACE_SYSTEM);
+	if( new_mirrored ) {
+		// The whole span is contiguous, so the ghost region is simply the
+		//   mirror image of the front of the buffer.
+		BFsize mirror_span = round_up_pow2(std::max(std::max(new_span, new_ghost_span),
+		                                            mirror_granularity(this->_explicit_hugepages())));
+		new_stride = 2*mirror_span;
+		new_nbyte  = new_stride*new_nringlet;
+		new_buf    = this->_allocate_buf(mirror_span, new_stride, new_nringlet,
+		                                 true, &new_generation);
+		if( new_buf ) {
+			new_span       = mirror_span;
+			new_ghost_span = mirror_span;
+		}
+		else {
+			// Fall back to a regular ghosted buffer
+			new_mirrored = false;
+		}
+	}
+	if( !new_buf ) {
+		new_stride = new_span + new_ghost_span;
+		new_nbyte  = new_stride*new_nringlet;
+		new_buf    = this->_allocate_buf(new_span, new_stride, new_nringlet,
+		                                 false, &new_generation);
+	}
 	//pointer new_buf    = (pointer)bfMalloc(new_nbyte, _space);
 	//std::cout << "new_buf = " << (void*)new_buf << std::endl; // HACK TESTING
-	pointer new_buf = nullptr;
 	//std::cout << "contig_span:    " << contiguous_span << std::endl;
 	//std::cout << "total_span:     " << total_span << std::endl;
 	//std::cout << "new_span:       " << new_span << std::endl;
@@ -148,8 +531,6 @@ void BFring_impl::resize(BFsize contiguous_span,
 	//std::cout << "new_nringlet:   " << new_nringlet << std::endl;
 	//std::cout << "new_stride:     " << new_stride << std::endl;
 	//std::cout << "Allocating " << new_nbyte << std::endl;
-	BF_ASSERT_EXCEPTION(bfMalloc((void**)&new_buf, new_nbyte, _space) == BF_STATUS_SUCCESS,
-	                    BF_STATUS_MEM_ALLOC_FAILED);
 	
 	if( _buf ) {
 		// Must move existing data and delete old buf
@@ -170,24 +551,136 @@ void BFring_impl::resize(BFsize contiguous_span,
 			           _span - _buf_offset(_tail), _nringlet);
 			_offset0 = _head - _buf_offset(_head); // TODO: Check this for sign/overflow issues
 		}
-		// Copy old ghost region to new buffer
-		bfMemcpy2D(new_buf + new_span, new_stride, _space,
-		           _buf    +    _span,    _stride, _space,
-		           _ghost_span, _nringlet);
-		// Copy the part of the beg corresponding to the extra ghost space
-		bfMemcpy2D(new_buf + new_span + _ghost_span, new_stride, _space,
-		           _buf + _ghost_span,                  _stride, _space,
-		           std::min(new_ghost_span, _span) - _ghost_span, _nringlet);
-		_ghost_dirty = true; // TODO: Is this the right thing to do?
-		bfFree(_buf, _space);
+		// Note: The ghost region of a mirrored buffer is the front of the
+		//         buffer, so it must not be written to here.
+		if( !new_mirrored ) {
+			// Copy old ghost region to new buffer
+			bfMemcpy2D(new_buf + new_span, new_stride, _space,
+			           _buf    +    _span,    _stride, _space,
+			           _ghost_span, _nringlet);
+			// Copy the part of the beg corresponding to the extra ghost space
+			bfMemcpy2D(new_buf + new_span + _ghost_span, new_stride, _space,
+			           _buf + _ghost_span,                  _stride, _space,
+			           std::min(new_ghost_span, _span) - _ghost_span, _nringlet);
+			// TODO: Is this the right thing to do?
+			_ghost_dirty.clear();
+			_ghost_dirty.add(0, new_ghost_span);
+		}
+		this->_free_buf(_buf, _buf_nbyte, _buf_mirrored, _buf_generation);
 		bfStreamSynchronize();
 	}
 	_buf        = new_buf;
+	_buf_nbyte  = new_nbyte;
+	_buf_mirrored   = new_mirrored;
+	_buf_generation = new_generation;
+	_state->buf_nbyte      = new_nbyte;
+	_state->buf_mirrored   = new_mirrored;
+	_state->buf_generation = new_generation;
 	_ghost_span = new_ghost_span;
 	_span       = new_span;
 	_stride     = new_stride;
 	_nringlet   = new_nringlet;
 }
+void BFring_impl::set_mirror_enabled(bool enabled) {
+	lock_guard_type lock(_mutex);
+	_state->mirror_enabled = enabled;
+}
+void BFring_impl::set_alloc_options(unsigned flags, int numa_node) {
+	lock_guard_type lock(_mutex);
+	BF_ASSERT_EXCEPTION(flags == BF_MALLOC_DEFAULT || _space == BF_SPACE_SYSTEM,
+	                    BF_STATUS_UNSUPPORTED);
+	BF_ASSERT_EXCEPTION(numa_node < 0 || _space == BF_SPACE_SYSTEM,
+	                    BF_STATUS_UNSUPPORTED);
+	_state->alloc_flags = flags;
+	_state->numa_node   = numa_node;
+}
+void BFring_impl::get_alloc_options(unsigned* flags, int* numa_node) {
+	lock_guard_type lock(_mutex);
+	*flags     = _state->alloc_flags;
+	*numa_node = _state->numa_node;
+}
+void BFring_impl::set_wait_policy(BFring_wait_policy policy,
+                                  BFsize             spin_count) {
+	lock_guard_type lock(_mutex);
+	_state->wait_policy = policy;
+	_state->spin_count  = spin_count;
+}
+void BFring_impl::get_wait_policy(BFring_wait_policy* policy,
+                                  BFsize*             spin_count) {
+	lock_guard_type lock(_mutex);
+	*policy     = _state->wait_policy;
+	*spin_count = _state->spin_count;
+}
+void BFring_impl::set_spsc(bool enabled) {
+	lock_guard_type lock(_mutex);
+	// Note: The fast path relies on the buffer address being fixed while
+	//         spans are open, which is not true of shared rings.
+	BF_ASSERT_EXCEPTION(!enabled || !this->shared(), BF_STATUS_UNSUPPORTED);
+	BF_ASSERT_EXCEPTION(!_writing_begun,             BF_STATUS_INVALID_STATE);
+	BF_ASSERT_EXCEPTION(_state->nreader <= 1,        BF_STATUS_INVALID_STATE);
+	__atomic_store_n(&_state->spsc, enabled, __ATOMIC_SEQ_CST);
+}
+bool BFring_impl::spsc() {
+	return __atomic_load_n(&_state->spsc, __ATOMIC_SEQ_CST);
+}
+void BFring_impl::expect_readers(BFsize nreader) {
+	lock_guard_type lock(_mutex);
+	BF_ASSERT_EXCEPTION(!_writing_begun, BF_STATUS_INVALID_STATE);
+	_state->nreader_expected = nreader;
+}
+void BFring_impl::cancel_expected_reader() {
+	lock_guard_type lock(_mutex);
+	if( _state->npending_guarantee ) {
+		--_state->npending_guarantee;
+		this->_remove_guarantee(_state->pending_guarantee);
+	}
+	else if( _state->nreader_expected ) {
+		--_state->nreader_expected;
+	}
+}
+bool BFring_impl::mirrored() {
+	lock_guard_type lock(_mutex);
+	return _state->buf_mirrored;
+}
+void BFring_impl::get_stats(BFring_stats* stats) {
+	lock_guard_type lock(_mutex);
+	::memset(stats, 0, sizeof(BFring_stats));
+	stats->tail              = _tail;
+	stats->head              = _head;
+	stats->reserve_head      = _reserve_head;
+	stats->capacity          = _span;
+	stats->nringlet          = _nringlet;
+	stats->nbyte_committed   = _state->nbyte_committed;
+	stats->nbyte_overwritten = _state->nbyte_overwritten;
+	// Report the lags of guaranteed readers, most-lagging first
+	for( BFsize i=0; i<_guarantees.size(); ++i ) {
+		for( BFsize j=0; j<_guarantees.count(i); ++j ) {
+			if( stats->nguarantee < BF_RING_STATS_MAX_GUARANTEES ) {
+				stats->guarantee_lag[stats->nguarantee] =
+					_head - _guarantees.offset(i);
+			}
+			++stats->nguarantee;
+		}
+	}
+	RingWaitStats const* waits[4] = {&_state->read_wait,
+	                                 &_state->write_wait,
+	                                 &_state->write_close_wait,
+	                                 &_state->realloc_wait};
+	BFsize* counts[4] = {&stats->read_wait_count,
+	                     &stats->write_wait_count,
+	                     &stats->write_close_wait_count,
+	                     &stats->realloc_wait_count};
+	double* times[4]  = {&stats->read_wait_time,
+	                     &stats->write_wait_time,
+	                     &stats->write_close_wait_time,
+	                     &stats->realloc_wait_time};
+	for( int i=0; i<4; ++i ) {
+		*counts[i] = waits[i]->count;
+		*times[i]  = waits[i]->nanoseconds * 1e-9;
+	}
+	stats->nbyte_copied_to_ghost   = _state->nbyte_copied_to_ghost;
+	stats->nbyte_copied_from_ghost = _state->nbyte_copied_from_ghost;
+}
 void BFring_impl::begin_writing() {
 	lock_guard_type lock(_mutex);
 	BF_ASSERT_EXCEPTION(!_writing_begun, BF_STATUS_INVALID_STATE);
@@ -227,27 +720,41 @@ BFring_impl::pointer BFring_impl::_buf_pointer(BFoffset offset) const {
 	return _buf + _buf_offset(offset);
 }
 void BFring_impl::_ghost_write(BFoffset offset, BFsize span) {
+	if( _buf_mirrored ) {
+		return;
+	}
 	BFoffset buf_offset_beg = _buf_offset(offset);
 	BFoffset buf_offset_end = _buf_offset(offset + span);
 	if( buf_offset_end < buf_offset_beg ) {
 		// The write went into the ghost region, so copy to the ghosted part
 		this->_copy_from_ghost(0, buf_offset_end);
+		// The front and ghost copies of this part are now in sync
+		_ghost_dirty.remove(0, buf_offset_end);
 	}
 	else if( buf_offset_beg < (BFoffset)_ghost_span ) {
 		// The write touched the ghosted front of the buffer
-		_ghost_dirty = true;
-		// TODO: Implement fine-grained dirty region tracking
+		_ghost_dirty.add(buf_offset_beg,
+		                 std::min(buf_offset_end, (BFoffset)_ghost_span));
 	}
 }
 void BFring_impl::_ghost_read(BFoffset offset, BFsize span) {
+	if( _buf_mirrored ) {
+		return;
+	}
 	BFoffset buf_offset_beg = _buf_offset(offset);
 	BFoffset buf_offset_end = _buf_offset(offset + span);
 	if( buf_offset_end < buf_offset_beg ) {
-		// The read will enter the ghost region, so copy from the ghosted part
-		if( _ghost_dirty ) {
-			this->_copy_to_ghost(0, _ghost_span);
-			_ghost_dirty = false;
+		// The read will enter the ghost region, so copy from the ghosted
+		//   part only those bytes that it will read and that are stale.
+		for( BFsize i=0; i<_ghost_dirty.size(); ++i ) {
+			BFoffset dirty_beg = _ghost_dirty.begin(i);
+			BFoffset dirty_end = std::min(_ghost_dirty.end(i), buf_offset_end);
+			if( dirty_beg >= buf_offset_end ) {
+				break;
+			}
+			this->_copy_to_ghost(dirty_beg, dirty_end - dirty_beg);
 		}
+		_ghost_dirty.remove(0, buf_offset_end);
 	}
 }
 void BFring_impl::_copy_to_ghost(BFoffset buf_offset, BFsize span) {
@@ -256,6 +763,7 @@ void BFring_impl::_copy_to_ghost(BFoffset buf_offset, BFsize span) {
 	           _buf + buf_offset,           _stride, _space,
 	           span, _nringlet);
 	bfStreamSynchronize();
+	_state->nbyte_copied_to_ghost += span*_nringlet;
 }
 void BFring_impl::_copy_from_ghost(BFoffset buf_offset, BFsize span) {
 	// Copy from the ghost region to the front of the buffer
@@ -263,6 +771,13 @@ void BFring_impl::_copy_from_ghost(BFoffset buf_offset, BFsize span) {
 	           _buf + (_span + buf_offset), _stride, _space,
 	           span, _nringlet);
 	bfStreamSynchronize();
+	_state->nbyte_copied_from_ghost += span*_nringlet;
+}
+void BFring_impl::ghost_copy_stats(BFsize* nbyte_to_ghost,
+                                   BFsize* nbyte_from_ghost) {
+	lock_guard_type lock(_mutex);
+	*nbyte_to_ghost   = _state->nbyte_copied_to_ghost;
+	*nbyte_from_ghost = _state->nbyte_copied_from_ghost;
 }
 BFsequence_sptr BFring_impl::begin_sequence(const char* name,
                                             BFoffset    time_tag,
@@ -274,6 +789,7 @@ BFsequence_sptr BFring_impl::begin_sequence(const char* name,
 	BF_ASSERT_EXCEPTION(header || !header_size, BF_STATUS_INVALID_ARGUMENT);
 	lock_guard_type lock(_mutex);
 	//unique_lock_type lock(_mutex);
+	this->_import_sequences();
 	BF_ASSERT_EXCEPTION(nringlet <= _nringlet,  BF_STATUS_INVALID_ARGUMENT);
 	// Cannot have any writes still open
 	// TODO: Removed this since allowing writes independent of sequences
@@ -297,46 +813,220 @@ BFsequence_sptr BFring_impl::begin_sequence(const char* name,
 	// Cannot have existing sequence with same name
 	BF_ASSERT_EXCEPTION(_sequence_map.count(name)==0,              BF_STATUS_INVALID_ARGUMENT);
 	BF_ASSERT_EXCEPTION(_sequence_time_tag_map.count(time_tag)==0, BF_STATUS_INVALID_ARGUMENT);
+	// Note: The SPSC fast path pulls the tail without removing old sequences
+	this->_pop_old_sequences();
 	BFsequence_sptr sequence(new BFsequence_impl(this, name, time_tag, header_size,
 	                                             header, nringlet, seq_begin));
+	if( _state->nreader_expected ) {
+		// Hold a guarantee for each expected reader until it opens this
+		//   sequence, so that nothing is overwritten before then.
+		for( BFsize i=0; i<_state->nreader_expected; ++i ) {
+			this->_add_guarantee(seq_begin);
+		}
+		_state->npending_guarantee = _state->nreader_expected;
+		_state->pending_guarantee  = seq_begin;
+		_state->pending_time_tag   = time_tag;
+		_state->nreader_expected   = 0;
+	}
+	this->_publish_sequence(sequence.get());
+	this->_add_sequence(sequence);
+	return sequence;
+}
+void BFring_impl::_add_sequence(BFsequence_sptr sequence) {
 	if( _sequence_queue.size() ) {
 		_sequence_queue.back()->set_next(sequence);
 		//_sequence_condition.notify_all();
 	}
 	_sequence_queue.push(sequence);
 	_sequence_condition.notify_all();
-	if( !std::string(name).empty() ) {
-		_sequence_map.insert(std::make_pair(std::string(name),sequence));
+	if( !sequence->_name.empty() ) {
+		_sequence_map.insert(std::make_pair(sequence->_name,sequence));
 	}
-	if( time_tag != BFoffset(-1) ) {
-		_sequence_time_tag_map.insert(std::make_pair(time_tag,sequence));
+	if( sequence->_time_tag != BFoffset(-1) ) {
+		_sequence_time_tag_map.insert(std::make_pair(sequence->_time_tag,sequence));
 	}
-	return sequence;
+	this->_index_sequence_time(sequence);
+}
+void BFring_impl::_publish_sequence(BFsequence_impl* sequence) {
+	// Makes a new sequence visible to other processes using a shared ring
+	if( !this->shared() ) {
+		return;
+	}
+	BF_ASSERT_EXCEPTION(sequence->_name.size() < BFring_shared_sequence::MAX_NAME_SIZE,
+	                    BF_STATUS_INVALID_ARGUMENT);
+	BF_ASSERT_EXCEPTION(sequence->header_size() <= BFring_shared_sequence::MAX_HEADER_SIZE,
+	                    BF_STATUS_INSUFFICIENT_STORAGE);
+	BFoffset index = _state->nsequence;
+	BFring_shared_sequence* record =
+		&_shared_sequences[index % _state->nsequence_slot];
+	record->index       = index;
+	record->time_tag    = sequence->_time_tag;
+	record->nringlet    = sequence->_nringlet;
+	record->begin       = sequence->_begin;
+	record->end         = sequence->_end;
+	record->header_size = sequence->header_size();
+	record->time0        = sequence->_time0;
+	record->frame_period = sequence->_frame_period;
+	record->frame_nbyte  = sequence->_frame_nbyte;
+	::strcpy(record->name, sequence->name());
+	if( sequence->header_size() ) {
+		::memcpy(record->header, sequence->header(), sequence->header_size());
+	}
+	sequence->_shared_index = index;
+	_nsequence_seen = ++_state->nsequence;
+}
+void BFring_impl::_publish_sequence_end(BFsequence_impl* sequence) {
+	if( !this->shared() || sequence->_shared_index == BFoffset(-1) ) {
+		return;
+	}
+	BFring_shared_sequence* record =
+		&_shared_sequences[sequence->_shared_index % _state->nsequence_slot];
+	if( record->index == sequence->_shared_index ) {
+		record->end = sequence->_end;
+	}
+}
+void BFring_impl::set_sequence_time_scale(BFsequence_sptr sequence,
+                                          double          time0,
+                                          double          frame_period,
+                                          BFsize          frame_nbyte) {
+	BF_ASSERT_EXCEPTION(frame_period > 0, BF_STATUS_INVALID_ARGUMENT);
+	BF_ASSERT_EXCEPTION(frame_nbyte  > 0, BF_STATUS_INVALID_ARGUMENT);
+	lock_guard_type lock(_mutex);
+	BF_ASSERT_EXCEPTION(!sequence->time_indexed(), BF_STATUS_INVALID_STATE);
+	BF_ASSERT_EXCEPTION(_sequence_time_map.count(time0)==0, BF_STATUS_INVALID_ARGUMENT);
+	sequence->_time0        = time0;
+	sequence->_frame_period = frame_period;
+	sequence->_frame_nbyte  = frame_nbyte;
+	if( this->shared() && sequence->_shared_index != BFoffset(-1) ) {
+		BFring_shared_sequence* record =
+			&_shared_sequences[sequence->_shared_index % _state->nsequence_slot];
+		if( record->index == sequence->_shared_index ) {
+			record->time0        = time0;
+			record->frame_period = frame_period;
+			record->frame_nbyte  = frame_nbyte;
+		}
+	}
+	this->_index_sequence_time(sequence);
+}
+void BFring_impl::_index_sequence_time(BFsequence_sptr sequence) {
+	if( sequence->time_indexed() ) {
+		_sequence_time_map.insert(std::make_pair(sequence->_time0, sequence));
+	}
+}
+void BFring_impl::_import_sequences() {
+	// Brings this process' view of a shared ring's sequences up to date
+	//   with those published by other processes.
+	// Note: Must be called with the lock held
+	if( !this->shared() ) {
+		return;
+	}
+	BFsize   nslot     = _state->nsequence_slot;
+	BFoffset nsequence = _state->nsequence;
+	// Refresh the end of the most recent sequence if it was still open
+	//   when it was imported.
+	if( !_sequence_queue.empty() ) {
+		BFsequence_sptr back = _sequence_queue.back();
+		BFoffset index = back->_shared_index;
+		if( !back->is_finished() && index != BFoffset(-1) ) {
+			BFring_shared_sequence const* record = &_shared_sequences[index % nslot];
+			if( record->index == index ) {
+				back->_end = record->end;
+				// The time scale may also have been set since it was imported
+				if( !back->time_indexed() && record->frame_nbyte ) {
+					back->_time0        = record->time0;
+					back->_frame_period = record->frame_period;
+					back->_frame_nbyte  = record->frame_nbyte;
+					this->_index_sequence_time(back);
+				}
+			}
+		}
+	}
+	BFoffset first = nsequence - std::min(nsequence, (BFoffset)nslot);
+	for( BFoffset index=std::max(_nsequence_seen, first); index<nsequence; ++index ) {
+		BFring_shared_sequence const* record = &_shared_sequences[index % nslot];
+		BFsequence_sptr sequence(new BFsequence_impl(this, record->name,
+		                                             record->time_tag,
+		                                             record->header_size,
+		                                             record->header,
+		                                             record->nringlet,
+		                                             record->begin));
+		sequence->_end          = record->end;
+		sequence->_shared_index = index;
+		if( record->frame_nbyte ) {
+			sequence->_time0        = record->time0;
+			sequence->_frame_period = record->frame_period;
+			sequence->_frame_nbyte  = record->frame_nbyte;
+		}
+		if( !_sequence_queue.empty() && !_sequence_queue.back()->is_finished() ) {
+			// The previous sequence's record has already been recycled, so
+			//   the best we can do is to end it where this one begins.
+			// Note: Sequences are always finished before the next one begins
+			_sequence_queue.back()->_end = record->begin;
+		}
+		this->_add_sequence(sequence);
+	}
+	_nsequence_seen = nsequence;
+	this->_pop_old_sequences();
 }
 void BFring_impl::open_sequence(BFsequence_sptr sequence,
                                 BFbool          guarantee,
-                                BFoffset*       guarantee_begin) {
+                                BFoffset*       guarantee_begin,
+                                BFoffset        guarantee_offset) {
 	lock_guard_type lock(_mutex);
 	// Check that the sequence is still within the ring
+	this->_import_sequences();
 	BF_ASSERT_EXCEPTION(!sequence->is_finished() ||
 	                    BFoffset(_head - sequence->end()) <= BFoffset(_head - _tail),
 	                    BF_STATUS_INVALID_ARGUMENT);
+	// SPSC mode allows only a single reader at a time
+	BF_ASSERT_EXCEPTION(!_state->spsc || _state->nreader == 0,
+	                    BF_STATUS_INVALID_STATE);
+	++_state->nreader;
 	if( guarantee ) {
-		if( BFoffset(_head - sequence->begin()) > BFoffset(_head - _tail) ) {
-			// Sequence starts before tail
+		BFoffset begin = sequence->begin() + guarantee_offset;
+		if( BFdelta(begin - _head) > 0 ) {
+			// Guarantee starts in the future, so it can only be placed at
+			//   the head (guarantees must never be ahead of the writer).
+			*guarantee_begin = _head;
+		}
+		else if( BFoffset(_head - begin) > BFoffset(_head - _tail) ) {
+			// Guarantee starts before tail
 			*guarantee_begin = _tail;
 		}
 		else {
-			*guarantee_begin = sequence->begin();
+			*guarantee_begin = begin;
 		}
 		//_guarantees.insert(*guarantee_begin);
 		this->_add_guarantee(*guarantee_begin);
+		if( _state->spsc ) {
+			// The writer may have reserved past the new guarantee on the fast
+			//   path without seeing it, in which case the guarantee must be
+			//   moved forward to where the tail is about to be pulled to.
+			BFoffset reserve_head = __atomic_load_n(&_reserve_head,
+			                                        __ATOMIC_SEQ_CST);
+			if( BFoffset(reserve_head - *guarantee_begin) > _span ) {
+				BFoffset new_begin = reserve_head - _span;
+				BF_ASSERT_EXCEPTION(_guarantees.move_sole(*guarantee_begin,
+				                                          new_begin),
+				                    BF_STATUS_INTERNAL_ERROR);
+				*guarantee_begin = new_begin;
+			}
+		}
+		if( _state->npending_guarantee &&
+		    sequence->begin()    == _state->pending_guarantee &&
+		    sequence->time_tag() == _state->pending_time_tag ) {
+			// The reader now has its own guarantee, so release the one that
+			//   was held for it
+			--_state->npending_guarantee;
+			this->_remove_guarantee(_state->pending_guarantee);
+		}
 	}
 }
 void BFring_impl::close_sequence(BFsequence_sptr sequence,
                                  BFbool          guarantee,
                                  BFoffset        guarantee_begin) {
 	lock_guard_type lock(_mutex);
+	--_state->nreader;
 	if( guarantee ) {
 		this->_remove_guarantee(guarantee_begin);
 		//auto iter = _guarantees.find(guarantee_begin);
@@ -346,11 +1036,13 @@ void BFring_impl::close_sequence(BFsequence_sptr sequence,
 }
 BFsequence_sptr BFring_impl::get_sequence(const char* name) {
 	lock_guard_type lock(_mutex);
+	this->_import_sequences();
 	BF_ASSERT_EXCEPTION(_sequence_map.count(name), BF_STATUS_INVALID_ARGUMENT);
 	return _sequence_map.find(name)->second;
 }
 BFsequence_sptr BFring_impl::get_sequence_at(BFoffset time_tag) {
 	lock_guard_type lock(_mutex);
+	this->_import_sequences();
 	// Note: This function only works if time_tag resides within the buffer
 	//         (or in its overwritten history) at the time of the call.
 	//         There is no way for the function to know if a time_tag
@@ -367,10 +1059,28 @@ BFsequence_sptr BFring_impl::get_sequence_at(BFoffset time_tag) {
 	                    BF_STATUS_INVALID_ARGUMENT);
 	return (--iter)->second;
 }
+BFsequence_sptr BFring_impl::get_sequence_at_time(double time, BFoffset* offset) {
+	lock_guard_type lock(_mutex);
+	this->_import_sequences();
+	// Note: As for get_sequence_at, time must not be before the first
+	//         sequence (with a time scale) in the buffer, and times in the
+	//         future may turn out to belong to a later sequence.
+	auto iter = _sequence_time_map.upper_bound(time);
+	BF_ASSERT_EXCEPTION(iter != _sequence_time_map.begin(),
+	                    BF_STATUS_INVALID_ARGUMENT);
+	BFsequence_sptr sequence = (--iter)->second;
+	// Note: The tolerance avoids times that fall exactly on a frame boundary
+	//         being rounded down to the previous frame.
+	double   frame_time = (time - sequence->_time0) / sequence->_frame_period;
+	BFoffset frame = (BFoffset)std::floor(frame_time + 1e-6);
+	*offset = frame * sequence->_frame_nbyte;
+	return sequence;
+}
 BFsequence_sptr BFring_impl::get_latest_sequence() {
 	unique_lock_type lock(_mutex);
 	// Wait until a sequence has been opened or writing has ended
 	_sequence_condition.wait(lock, [&]() {
+			this->_import_sequences();
 			return !_sequence_queue.empty() || _writing_ended;
 		});
 	BF_ASSERT_EXCEPTION(!(_sequence_queue.empty() && !_writing_ended), BF_STATUS_INVALID_STATE);
@@ -383,6 +1093,7 @@ BFsequence_sptr BFring_impl::get_earliest_sequence() {
 	unique_lock_type lock(_mutex);
 	// Wait until a sequence has been opened or writing has ended
 	_sequence_condition.wait(lock, [&]() {
+			this->_import_sequences();
 			return !_sequence_queue.empty() || _writing_ended;
 		});
 	BF_ASSERT_EXCEPTION(!(_sequence_queue.empty() && !_writing_ended), BF_STATUS_INVALID_STATE);
@@ -406,7 +1117,8 @@ BFsequence_impl::BFsequence_impl(BFring      ring,
 	          (const char*)header+header_size),
 	  //_header(new header_type((const char*)header,
 	  //                        (const char*)header+header_size)),
-	  _next(nullptr) {
+	  _next(nullptr),
+	  _time0(0), _frame_period(0), _frame_nbyte(0) {
 	//std::cout << "BEGIN SEQUENCE: " << _begin << std::endl;
 	  }
 void BFsequence_impl::finish(BFoffset offset_from_head) {
@@ -418,7 +1130,9 @@ void BFsequence_impl::finish(BFoffset offset_from_head) {
 	BF_ASSERT_EXCEPTION(!_ring->_sequence_queue.empty() &&
 	                    !_ring->_sequence_queue.back()->is_finished(),
 	                    BF_STATUS_INVALID_STATE);
-	_end = _ring->_head + offset_from_head;
+	// Note: This is read without the lock by the SPSC fast path
+	__atomic_store_n(&_end, _ring->_head + offset_from_head, __ATOMIC_SEQ_CST);
+	_ring->_publish_sequence_end(this);
 	_ring->_read_condition.notify_all();
 	//std::cout << "END SEQUENCE: " << _end << std::endl;
 }
@@ -429,6 +1143,7 @@ BFsequence_sptr BFsequence_impl::get_next() const {
 	BFring_impl::unique_lock_type lock(_ring->_mutex);
 	// Wait until the next sequence has been opened or writing has ended
 	_ring->_sequence_condition.wait(lock, [&]() {
+			_ring->_import_sequences();
 			return ((bool)_next) || _ring->_writing_ended;
 		});
 	BF_ASSERT_EXCEPTION(_next, BF_STATUS_END_OF_DATA);
@@ -443,57 +1158,253 @@ void BFring_impl::_pull_tail(unique_lock_type& lock) {
 	
 	// Note: By using _span, this correctly handles ring resizes that occur
 	//         while waiting on the condition.
-	// TODO: This enables guaranteed reads to "cover for" unguaranteed
-	//         siblings that would be too slow on their own. Is this actually
-	//         a problem, and if so is there any way around it?
-	_write_condition.wait(lock, [&]() {
-			return ((_guarantees.empty() ||
-			         BFoffset(_reserve_head - _get_earliest_guarantee()) <= _span) &&
-			        _nrealloc_pending == 0);
+	// Note: Guaranteed reads can "cover for" unguaranteed siblings that
+	//         would be too slow on their own; readers that must not hold
+	//         up the writer should use the drop or lag overrun policies.
+	this->_drop_lagging_readers(_reserve_head);
+	this->_wait(_write_condition, lock, _state->write_wait, [&]() {
+			return this->_can_reserve_to(_reserve_head);
 		});
 	
 	BFoffset cur_span = _reserve_head - _tail;
 	if( cur_span > _span ) {
 		// Pull the tail
-		 _tail += cur_span - _span;
-		// Delete old sequences
-		while( !_sequence_queue.empty() &&
-		       //_sequence_queue.front()->_end != BFsequence_impl::BF_SEQUENCE_OPEN &&
-		       _sequence_queue.front()->is_finished() &&
-		       //_sequence_queue.front()->_end <= _tail ) {
-		       BFoffset(_head - _sequence_queue.front()->_end) >= BFoffset(_head - _tail) ) {
-			if( !_sequence_queue.front()->_name.empty() ) {
-				_sequence_map.erase(_sequence_queue.front()->_name);
-			}
-			if( _sequence_queue.front()->_time_tag != BFoffset(-1) ) {
-				_sequence_time_tag_map.erase(_sequence_queue.front()->_time_tag);
-			}
-			//delete _sequence_queue.front();
-			_sequence_queue.pop();
+		__atomic_store_n(&_tail, _tail + (cur_span - _span), __ATOMIC_SEQ_CST);
+		this->_pop_old_sequences();
+	}
+}
+void BFring_impl::_drop_lagging_readers(BFoffset reserve_head) {
+	// Moves the guarantees of lag-bounded readers that would otherwise be
+	//   more than their max lag behind reserve_head forward, dropping their
+	//   oldest data instead of making the writer wait for them.
+	for( BFrsequence reader : _lag_readers ) {
+		BFoffset begin = reader->guarantee_begin();
+		if( reader->max_lag() >= _span ||
+		    BFoffset(reserve_head - begin) <= reader->max_lag() ) {
+			continue;
+		}
+		BFoffset new_begin = reserve_head - reader->max_lag();
+		if( BFdelta(new_begin - _head) > 0 ) {
+			// Guarantees must never be ahead of the writer
+			new_begin = _head;
 		}
+		if( BFdelta(new_begin - begin) <= 0 ) {
+			continue;
+		}
+		this->_add_guarantee(new_begin);
+		this->_remove_guarantee(begin);
+		reader->set_guarantee_begin(new_begin);
+	}
+}
+void BFring_impl::_add_lag_reader(BFrsequence reader) {
+	lock_guard_type lock(_mutex);
+	_lag_readers.insert(reader);
+}
+void BFring_impl::_remove_lag_reader(BFrsequence reader) {
+	lock_guard_type lock(_mutex);
+	_lag_readers.erase(reader);
+}
+void BFring_impl::_pop_old_sequences() {
+	// Delete old sequences that have fallen off the tail
+	while( !_sequence_queue.empty() &&
+	       //_sequence_queue.front()->_end != BFsequence_impl::BF_SEQUENCE_OPEN &&
+	       _sequence_queue.front()->is_finished() &&
+	       //_sequence_queue.front()->_end <= _tail ) {
+	       BFoffset(_head - _sequence_queue.front()->_end) >= BFoffset(_head - _tail) ) {
+		if( !_sequence_queue.front()->_name.empty() ) {
+			_sequence_map.erase(_sequence_queue.front()->_name);
+		}
+		if( _sequence_queue.front()->_time_tag != BFoffset(-1) ) {
+			_sequence_time_tag_map.erase(_sequence_queue.front()->_time_tag);
+		}
+		if( _sequence_queue.front()->time_indexed() ) {
+			_sequence_time_map.erase(_sequence_queue.front()->_time0);
+		}
+		//delete _sequence_queue.front();
+		_sequence_queue.pop();
 	}
 }
 
-void BFring_impl::reserve_span(BFsize size, BFoffset* begin, void** data) {
+// Single-producer/single-consumer (SPSC) fast path
+// In SPSC mode there is only one writing thread, which owns _reserve_head,
+//   _head and _tail, and one reading thread, which owns the (lone)
+//   guarantee. Spans are then reserved, committed, acquired and released
+//   without taking the lock, and the lock is only taken to notify when the
+//   other side is actually waiting. Anything that cannot be done this way
+//   (waiting, partially-available or overwritten spans, sequence ends,
+//   reallocation, non-mirrored buffers) falls back to the locked path.
+// Note: Each side publishes its update and then checks for the other side
+//         (and for pending reallocations) using sequentially-consistent
+//         atomics, while waiters register on the condition before
+//         re-checking their predicate. This ensures that no update or
+//         wakeup can be missed by both sides.
+bool BFring_impl::_enter_fast_path(BFsize& nopen) {
+	if( !__atomic_load_n(&_state->spsc, __ATOMIC_RELAXED) ) {
+		return false;
+	}
+	__atomic_fetch_add(&nopen, 1, __ATOMIC_SEQ_CST);
+	// Note: Once this passes, reallocations must wait for nopen to drop
+	//         back to zero, so the buffer cannot change under us.
+	if( __atomic_load_n(&_nrealloc_pending, __ATOMIC_SEQ_CST) ||
+	    !_buf_mirrored ) {
+		this->_leave_fast_path(nopen);
+		return false;
+	}
+	return true;
+}
+void BFring_impl::_leave_fast_path(BFsize& nopen) {
+	__atomic_fetch_sub(&nopen, 1, __ATOMIC_SEQ_CST);
+	this->_notify_waiters(_realloc_condition);
+}
+void BFring_impl::_notify_waiters(condition_type& cond) {
+	if( cond.has_waiters() ) {
+		lock_guard_type lock(_mutex);
+		cond.notify_all();
+	}
+}
+bool BFring_impl::_try_reserve_span_fast(BFsize size, BFoffset* begin,
+                                         void** data, double timeout_secs) {
+	if( !this->_enter_fast_path(_nwrite_open) ) {
+		return false;
+	}
+	// Note: Spans must be committed in order, so only a lone open span can
+	//         be handled here.
+	if( __atomic_load_n(&_nwrite_open, __ATOMIC_SEQ_CST) != 1 ||
+	    size > _ghost_span ||
+	    (timeout_secs >= 0 && !this->_can_reserve_to(_reserve_head + size)) ) {
+		this->_leave_fast_path(_nwrite_open);
+		return false;
+	}
+	BFoffset reserve_head = _reserve_head + size;
+	__atomic_store_n(&_reserve_head, reserve_head, __ATOMIC_SEQ_CST);
+	*begin = reserve_head - size;
+	if( !this->_can_reserve_to(reserve_head) ) {
+		// The reader is behind (or a reallocation is pending), so wait for
+		//   it on the locked path
+		// Note: As in reserve_span, the reservation stands while waiting,
+		//         but the span is not counted as open until the wait is over
+		//         so that a pending reallocation can proceed.
+		__atomic_fetch_sub(&_nwrite_open, 1, __ATOMIC_SEQ_CST);
+		unique_lock_type lock(_mutex);
+		_realloc_condition.notify_all();
+		this->_pull_tail(lock);
+		__atomic_fetch_add(&_nwrite_open, 1, __ATOMIC_SEQ_CST);
+		*data = _buf_pointer(*begin);
+		return true;
+	}
+	BFoffset cur_span = reserve_head - _tail;
+	if( cur_span > _span ) {
+		// Pull the tail
+		// Note: Old sequences are removed later by the locked path
+		__atomic_store_n(&_tail, _tail + (cur_span - _span), __ATOMIC_SEQ_CST);
+	}
+	*data = _buf_pointer(*begin);
+	return true;
+}
+bool BFring_impl::_try_commit_span_fast(BFoffset begin,
+                                        BFsize   reserve_size,
+                                        BFsize   commit_size) {
+	if( !__atomic_load_n(&_state->spsc, __ATOMIC_RELAXED) ||
+	    !_buf_mirrored ||
+	    __atomic_load_n(&_nwrite_open, __ATOMIC_SEQ_CST) != 1 ||
+	    begin != _head ||
+	    _reserve_head != begin + reserve_size ) {
+		return false;
+	}
+	// Note: This also handles cancellation (commit_size == 0)
+	BFoffset head = begin + commit_size;
+	__atomic_store_n(&_reserve_head, head, __ATOMIC_SEQ_CST);
+	__atomic_store_n(&_head,         head, __ATOMIC_SEQ_CST);
+	__atomic_fetch_add(&_state->nbyte_committed, commit_size, __ATOMIC_RELAXED);
+	this->_notify_waiters(_read_condition);
+	this->_leave_fast_path(_nwrite_open);
+	return true;
+}
+bool BFring_impl::_try_acquire_span_fast(BFsequence_impl* sequence,
+                                         BFoffset         offset,
+                                         BFsize           size,
+                                         BFoffset*        begin,
+                                         void**           data) {
+	if( !this->_enter_fast_path(_nread_open) ) {
+		return false;
+	}
+	BFoffset requested_begin = sequence->begin() + offset;
+	BFoffset requested_end   = requested_begin + size;
+	// Note: The head is loaded before the sequence end so that if the data
+	//         belong to a later sequence, the end of this one is visible.
+	BFoffset head = __atomic_load_n(&_head,          __ATOMIC_SEQ_CST);
+	BFoffset end  = __atomic_load_n(&sequence->_end, __ATOMIC_SEQ_CST);
+	BFoffset tail = __atomic_load_n(&_tail,          __ATOMIC_SEQ_CST);
+	// Only whole spans that are already available are handled here
+	bool available = (size <= _ghost_span &&
+	                  BFdelta(requested_begin - tail) >= 0 &&
+	                  BFdelta(head - requested_end)   >= 0 &&
+	                  (end == (BFoffset)BFsequence_impl::BF_SEQUENCE_OPEN ||
+	                   BFdelta(end - requested_end) >= 0));
+	if( !available ) {
+		this->_leave_fast_path(_nread_open);
+		return false;
+	}
+	*begin = requested_begin;
+	*data  = _buf_pointer(requested_begin);
+	return true;
+}
+bool BFring_impl::_try_release_span_fast(BFrsequence sequence,
+                                         BFoffset    offset,
+                                         BFsize      size) {
+	if( !__atomic_load_n(&_state->spsc, __ATOMIC_RELAXED) ) {
+		return false;
+	}
+	if( sequence->guaranteed() ) {
+		BFoffset new_begin = offset + size;
+		if( !_guarantees.move_sole(sequence->guarantee_begin(), new_begin) ) {
+			return false;
+		}
+		sequence->set_guarantee_begin(new_begin);
+		this->_notify_waiters(_write_condition);
+	}
+	this->_leave_fast_path(_nread_open);
+	return true;
+}
+
+void BFring_impl::reserve_span(BFsize size, BFoffset* begin, void** data,
+                               double timeout_secs) {
+	if( this->_try_reserve_span_fast(size, begin, data, timeout_secs) ) {
+		return;
+	}
 	unique_lock_type lock(_mutex);
 	BF_ASSERT_EXCEPTION(size <= _ghost_span, BF_STATUS_INVALID_ARGUMENT);
+	if( timeout_secs >= 0 ) {
+		// Wait for space before actually reserving, so that there is
+		//   nothing to undo if the wait times out.
+		this->_drop_lagging_readers(_reserve_head + size);
+		bool ready = this->_wait(_write_condition, lock, _state->write_wait, [&]() {
+				return this->_can_reserve_to(_reserve_head + size);
+			}, timeout_secs);
+		BF_ASSERT_EXCEPTION(ready, BF_STATUS_WOULD_BLOCK);
+	}
 	
 	*begin = _reserve_head;
-	_reserve_head += size;
+	__atomic_store_n(&_reserve_head, _reserve_head + size, __ATOMIC_SEQ_CST);
 	this->_pull_tail(lock); // Must be called after updating _reserve_head
 	/*
-	_write_condition.wait(lock, [&]() {
+	this->_wait(_write_condition, lock, _state->write_wait, [&]() {
 			return ((_guarantees.empty() ||
 			         //_guarantees.begin()->first >= _tail) &&
 			         BFoffset(_head - _get_earliest_guarantee()) <= BFoffset(_head - _tail)) &&
 			        _nrealloc_pending == 0);
 		});
 	*/
-	++_nwrite_open;
+	__atomic_fetch_add(&_nwrite_open, 1, __ATOMIC_SEQ_CST);
+	this->_sync_buf();
 	*data = _buf_pointer(*begin);
 }
 void BFring_impl::commit_span(BFoffset begin, BFsize reserve_size, BFsize commit_size) {
+	if( this->_try_commit_span_fast(begin, reserve_size, commit_size) ) {
+		return;
+	}
 	unique_lock_type lock(_mutex);
+	this->_sync_buf();
 	_ghost_write(begin, commit_size);
 
 	// TODO: Refactor/tidy this function a bit
@@ -504,8 +1415,8 @@ void BFring_impl::commit_span(BFoffset begin, BFsize reserve_size, BFsize commit
 	    _reserve_head == begin + reserve_size ) {
 		// This is the last-opened block so we can 'cancel' it by pulling back
 		//   the reserve head.
-		_reserve_head = begin;
-		--_nwrite_open;
+		__atomic_store_n(&_reserve_head, begin, __ATOMIC_SEQ_CST);
+		__atomic_fetch_sub(&_nwrite_open, 1, __ATOMIC_SEQ_CST);
 		_realloc_condition.notify_all();
 		return;
 	}
@@ -516,7 +1427,7 @@ void BFring_impl::commit_span(BFoffset begin, BFsize reserve_size, BFsize commit
 	//         in order (i.e., they will automatically synchronise).
 	//         This is useful for multithreading with OpenMP
 	//std::cout << "(1) begin, head, rhead: " << begin << ", " << _head << ", " << _reserve_head << std::endl;
-	_write_close_condition.wait(lock, [&]() {
+	this->_wait(_write_close_condition, lock, _state->write_close_wait, [&]() {
 			return (begin == _head);
 		});
 	_write_close_condition.notify_all();
@@ -524,7 +1435,7 @@ void BFring_impl::commit_span(BFoffset begin, BFsize reserve_size, BFsize commit
 	if( _reserve_head == _head + reserve_size ) {
 		// This is the front-most wspan, so we can pull back
 		//   the reserve head if commit_size < size.
-		_reserve_head = _head + commit_size;
+		__atomic_store_n(&_reserve_head, _head + commit_size, __ATOMIC_SEQ_CST);
 	}
 	else if( commit_size < reserve_size ) {
 		// There are reservations in front of this one, so we
@@ -534,23 +1445,25 @@ void BFring_impl::commit_span(BFoffset begin, BFsize reserve_size, BFsize commit
 		//return;
 		BF_ASSERT_EXCEPTION(false, BF_STATUS_INVALID_STATE);
 	}
-	_head += commit_size;
+	__atomic_store_n(&_head, _head + commit_size, __ATOMIC_SEQ_CST);
+	__atomic_fetch_add(&_state->nbyte_committed, commit_size, __ATOMIC_RELAXED);
 	
 	_read_condition.notify_all();
-	--_nwrite_open;
+	__atomic_fetch_sub(&_nwrite_open, 1, __ATOMIC_SEQ_CST);
 	_realloc_condition.notify_all();
 	//std::cout << "(2) begin, head, rhead: " << begin << ", " << _head << ", " << _reserve_head << std::endl;
 }
 
 BFwspan_impl::BFwspan_impl(//BFwsequence sequence,
                            BFring      ring,
-                           BFsize      size)
+                           BFsize      size,
+                           double      timeout_secs)
 	: //BFspan_impl(sequence->sequence(), size),
 	  BFspan_impl(ring, size),
 	//_sequence(sequence),
 	  _begin(0),
 	  _commit_size(size), _data(nullptr) {
-	this->ring()->reserve_span(size, &_begin, &_data);
+	this->ring()->reserve_span(size, &_begin, &_data, timeout_secs);
 }
 BFwspan_impl* BFwspan_impl::commit(BFsize size) {
 	BF_ASSERT_EXCEPTION(size <= this->size(), BF_STATUS_INVALID_ARGUMENT);
@@ -565,7 +1478,8 @@ void BFring_impl::acquire_span(BFrsequence rsequence,
                                BFoffset    offset,
                                BFsize*     size_,
                                BFoffset*   begin_,
-                               void**      data_) {
+                               void**      data_,
+                               double      timeout_secs) {
 	BF_ASSERT_EXCEPTION(rsequence,             BF_STATUS_INVALID_HANDLE);
 	BF_ASSERT_EXCEPTION(size_,                 BF_STATUS_INVALID_POINTER);
 	BF_ASSERT_EXCEPTION(begin_,                BF_STATUS_INVALID_POINTER);
@@ -573,6 +1487,10 @@ void BFring_impl::acquire_span(BFrsequence rsequence,
 	// Cannot go back beyond the start of the sequence
 	BF_ASSERT_EXCEPTION(offset >= 0,           BF_STATUS_INVALID_ARGUMENT);
 	BFsequence_sptr sequence = rsequence->sequence();
+	if( this->_try_acquire_span_fast(sequence.get(), offset, *size_,
+	                                 begin_, data_) ) {
+		return;
+	}
 	unique_lock_type lock(_mutex);
 	BF_ASSERT_EXCEPTION(*size_ <= _ghost_span, BF_STATUS_INVALID_ARGUMENT);
 	
@@ -583,22 +1501,54 @@ void BFring_impl::acquire_span(BFrsequence rsequence,
 	//   (meaning not overwritten and not past the end of the sequence).
 	//   It will return a 0-length span if the requested span has been
 	//     completely overwritten.
+	//   Readers that skip lost data (see bfRingSequenceSetOverrunPolicy)
+	//     instead get a full-size span starting at the first whole frame
+	//     that is still available.
 	// It throws BF_STATUS_END_OF_DATA if the requested span begins
 	//   after the end of the sequence.
+	bool skip = rsequence->skips_lost_data();
+	auto available_begin = [&]() -> BFoffset {
+		if( !skip ) {
+			return std::max(requested_begin, _tail);
+		}
+		BFoffset earliest = _tail;
+		if( rsequence->guaranteed() &&
+		    BFdelta(rsequence->guarantee_begin() - earliest) > 0 ) {
+			// The writer may have moved the guarantee of a lagging reader
+			earliest = rsequence->guarantee_begin();
+		}
+		BFdelta lost = BFdelta(earliest - requested_begin);
+		if( lost <= 0 ) {
+			return requested_begin;
+		}
+		BFsize frame_nbyte = rsequence->frame_nbyte();
+		return requested_begin + round_up(BFsize(lost), frame_nbyte);
+	};
 	
 	// Wait until requested span has been written or sequence has ended
-	_read_condition.wait(lock, [&]() {
-			return ((BFdelta(_head         - std::max(requested_begin, _tail)) >=
-			         BFdelta(requested_end - std::max(requested_begin, _tail)) ||
+	bool ready = this->_wait(_read_condition, lock, _state->read_wait, [&]() {
+			this->_import_sequences();
+			BFoffset begin = available_begin();
+			BFoffset end   = skip ? begin + *size_ : requested_end;
+			return ((BFdelta(_head - begin) >= BFdelta(end - begin) ||
 			         sequence->is_finished()) &&
-			        _nrealloc_pending == 0);
-		});
+			        __atomic_load_n(&_nrealloc_pending, __ATOMIC_SEQ_CST) == 0);
+		}, timeout_secs);
+	BF_ASSERT_EXCEPTION(ready, BF_STATUS_WOULD_BLOCK);
 	
 	// Constrain to what is in the buffer (i.e., what hasn't been overwritten)
-	BFoffset begin = std::max(requested_begin, _tail);
+	BFoffset begin = available_begin();
 	// Note: This results in size being 0 if the requested span has been
 	//         completely overwritten.
-	BFsize   size  = std::max(requested_end - begin, BFoffset(0));
+	BFsize   size  = (skip ? *size_ :
+	                  BFdelta(requested_end - begin) > 0 ?
+	                  requested_end - begin : 0);
+	if( begin != requested_begin ) {
+		// Part of the requested span was overwritten before we got to it
+		BFsize nbyte_lost = skip ? BFsize(begin - requested_begin) : *size_ - size;
+		_state->nbyte_overwritten += nbyte_lost;
+		rsequence->_nbyte_skipped += nbyte_lost;
+	}
 	
 	if( sequence->is_finished() ) {
 		BF_ASSERT_EXCEPTION(begin < sequence->end(),
@@ -608,38 +1558,51 @@ void BFring_impl::acquire_span(BFrsequence rsequence,
 	*begin_ = begin;
 	*size_  = size;
 	
-	++_nread_open;
+	__atomic_fetch_add(&_nread_open, 1, __ATOMIC_SEQ_CST);
+	this->_sync_buf();
 	_ghost_read(begin, size);
 	*data_ = _buf_pointer(begin);
 }
 void BFring_impl::release_span(BFrsequence sequence,
                                BFoffset    offset,
                                BFsize      size) {
+	if( this->_try_release_span_fast(sequence, offset, size) ) {
+		return;
+	}
 	unique_lock_type lock(_mutex);
-	if( sequence->guaranteed() ) {
+	// Note: The writer may already have moved the guarantee of a lag-bounded
+	//         reader beyond this span.
+	if( sequence->guaranteed() &&
+	    (sequence->overrun_policy() != BF_RING_OVERRUN_LAG ||
+	     BFdelta(offset + size - sequence->guarantee_begin()) > 0) ) {
 		// Move the guarantee to the end of this span
+		// Note: The new guarantee is added before the old one is removed so
+		//         that the earliest guarantee never appears to jump forward
+		//         to lock-free observers (see _try_reserve_span_fast).
+		BFoffset new_begin = offset + size;
+		//_guarantees.insert(new_begin);
+		this->_add_guarantee(new_begin);
 		this->_remove_guarantee(sequence->guarantee_begin());
 		//auto iter = _guarantees.find(sequence->guarantee_begin());
 		//BF_ASSERT_EXCEPTION(iter != _guarantees.end(), BF_STATUS_INTERNAL_ERROR);
 		//_guarantees.erase(iter);
-		BFoffset new_begin = offset + size;
-		//_guarantees.insert(new_begin);
-		this->_add_guarantee(new_begin);
 		sequence->set_guarantee_begin(new_begin);
 	}
-	--_nread_open;
+	__atomic_fetch_sub(&_nread_open, 1, __ATOMIC_SEQ_CST);
 	_realloc_condition.notify_all();
 }
 
 BFrspan_impl::BFrspan_impl(BFrsequence sequence,
                            BFoffset    offset,
-                           BFsize      requested_size)
+                           BFsize      requested_size,
+                           double      timeout_secs)
 	: //BFspan_impl(sequence->sequence(), requested_size),
 	  BFspan_impl(sequence->ring(), requested_size),
 	  _sequence(sequence), _begin(0),
 	  _data(nullptr) {
 	BFsize returned_size = requested_size;
-	this->ring()->acquire_span(sequence, offset, &returned_size, &_begin, &_data);
+	this->ring()->acquire_span(sequence, offset, &returned_size, &_begin, &_data,
+	                           timeout_secs);
 	this->set_base_size(returned_size);
 }
 BFrspan_impl::~BFrspan_impl() {
@@ -36,16 +36,17 @@
 
 #include <bifrost/ring.h>
 #include "assert.hpp"
+#include "sync.hpp"
 
 #include <stdexcept>
 #include <vector>
-#include <mutex>
-#include <condition_variable>
 #include <string>
 #include <map>
 #include <queue>
 #include <set>
 #include <memory>
+#include <chrono>
+#include <sys/types.h>
 
 class BFsequence_impl;
 class BFspan_impl;
@@ -63,6 +64,275 @@ public:
 	BFsequence_sptr(Y* ptr) : super_type(ptr) {}
 };
 */
+// Fixed-capacity set of guaranteed read positions (offset-->count), kept
+//   sorted by offset so that the earliest guarantee is always at the front.
+// Note: This is a POD type so that it can live in shared memory.
+//       The size and offsets are accessed atomically so that the earliest
+//         guarantee can be queried, and a lone guarantee moved, without
+//         holding the ring lock (see BFring_impl's SPSC mode). All other
+//         modifications require the lock.
+class RingGuarantees {
+public:
+	enum { CAPACITY = 256 };
+private:
+	BFsize   _size;
+	BFoffset _offsets[CAPACITY];
+	BFsize   _counts[CAPACITY];
+	inline void _set_size(BFsize size) {
+		__atomic_store_n(&_size, size, __ATOMIC_SEQ_CST);
+	}
+	inline void _set_offset(BFsize i, BFoffset offset) {
+		__atomic_store_n(&_offsets[i], offset, __ATOMIC_SEQ_CST);
+	}
+public:
+	inline void     init()                   { _set_size(0); }
+	inline bool     empty()            const { return this->size() == 0; }
+	inline BFsize   size()             const {
+		return __atomic_load_n(&_size, __ATOMIC_SEQ_CST);
+	}
+	inline BFoffset offset(BFsize i)   const {
+		return __atomic_load_n(&_offsets[i], __ATOMIC_SEQ_CST);
+	}
+	inline BFsize   count(BFsize i)    const { return _counts[i]; }
+	inline BFoffset earliest()         const { return this->offset(0); }
+	inline void add(BFoffset offset) {
+		BFsize i = 0;
+		while( i < _size && _offsets[i] < offset ) {
+			++i;
+		}
+		if( i < _size && _offsets[i] == offset ) {
+			++_counts[i];
+			return;
+		}
+		BF_ASSERT_EXCEPTION(_size < (BFsize)CAPACITY, BF_STATUS_INSUFFICIENT_STORAGE);
+		for( BFsize j=_size; j>i; --j ) {
+			_set_offset(j, _offsets[j-1]);
+			_counts[j] = _counts[j-1];
+		}
+		_set_offset(i, offset);
+		_counts[i] = 1;
+		_set_size(_size + 1);
+	}
+	// Returns true if the last reference to offset was removed
+	inline bool remove(BFoffset offset) {
+		BFsize i = 0;
+		while( i < _size && _offsets[i] != offset ) {
+			++i;
+		}
+		BF_ASSERT_EXCEPTION(i < _size, BF_STATUS_INTERNAL_ERROR);
+		if( --_counts[i] ) {
+			return false;
+		}
+		for( BFsize j=i+1; j<_size; ++j ) {
+			_set_offset(j-1, _offsets[j]);
+			_counts[j-1] = _counts[j];
+		}
+		_set_size(_size - 1);
+		return true;
+	}
+	// Moves the guarantee at offset 'from' to offset 'to' if it is the only
+	//   guarantee, returning false (and doing nothing) otherwise
+	// Note: Only the thread that owns the guarantee may call this without
+	//         holding the ring lock.
+	inline bool move_sole(BFoffset from, BFoffset to) {
+		if( _size != 1 || _offsets[0] != from || _counts[0] != 1 ) {
+			return false;
+		}
+		_set_offset(0, to);
+		return true;
+	}
+};
+
+// Fixed-capacity set of disjoint byte ranges [begin,end), kept sorted
+// Note: This is a POD type so that it can live in shared memory.
+//       If capacity is exceeded, ranges are merged conservatively (i.e.,
+//         the set may grow to cover bytes that were never added to it).
+class RingIntervalSet {
+public:
+	enum { CAPACITY = 32 };
+private:
+	BFsize   _size;
+	BFoffset _begins[CAPACITY];
+	BFoffset _ends[CAPACITY];
+public:
+	inline void     clear()                { _size = 0; }
+	inline bool     empty()          const { return _size == 0; }
+	inline BFsize   size()           const { return _size; }
+	inline BFoffset begin(BFsize i)  const { return _begins[i]; }
+	inline BFoffset end(BFsize i)    const { return _ends[i]; }
+	inline void add(BFoffset begin, BFoffset end) {
+		if( begin >= end ) {
+			return;
+		}
+		// Find the range of existing intervals that touch the new one
+		BFsize i = 0;
+		while( i < _size && _ends[i] < begin ) {
+			++i;
+		}
+		BFsize j = i;
+		while( j < _size && _begins[j] <= end ) {
+			begin = std::min(begin, _begins[j]);
+			end   = std::max(end,   _ends[j]);
+			++j;
+		}
+		if( j == i ) {
+			if( _size == (BFsize)CAPACITY ) {
+				// Merge into a neighbour instead of inserting
+				if( i < _size ) {
+					_begins[i] = begin;
+				}
+				else {
+					_ends[i-1] = end;
+				}
+				return;
+			}
+			for( BFsize k=_size; k>i; --k ) {
+				_begins[k] = _begins[k-1];
+				_ends[k]   = _ends[k-1];
+			}
+			++_size;
+		}
+		else {
+			// Replace intervals [i,j) with the merged one
+			BFsize nremove = j - i - 1;
+			for( BFsize k=j; k<_size; ++k ) {
+				_begins[k-nremove] = _begins[k];
+				_ends[k-nremove]   = _ends[k];
+			}
+			_size -= nremove;
+		}
+		_begins[i] = begin;
+		_ends[i]   = end;
+	}
+	inline void remove(BFoffset begin, BFoffset end) {
+		if( begin >= end ) {
+			return;
+		}
+		BFoffset new_begins[CAPACITY];
+		BFoffset new_ends[CAPACITY];
+		BFsize   new_size = 0;
+		for( BFsize k=0; k<_size; ++k ) {
+			BFoffset pieces[2][2] = {{_begins[k], std::min(_ends[k], begin)},
+			                         {std::max(_begins[k], end), _ends[k]}};
+			for( int p=0; p<2; ++p ) {
+				if( pieces[p][0] >= pieces[p][1] ) {
+					continue;
+				}
+				if( new_size == (BFsize)CAPACITY ) {
+					// No room to split; conservatively leave the set unchanged
+					return;
+				}
+				new_begins[new_size] = pieces[p][0];
+				new_ends[new_size]   = pieces[p][1];
+				++new_size;
+			}
+		}
+		for( BFsize k=0; k<new_size; ++k ) {
+			_begins[k] = new_begins[k];
+			_ends[k]   = new_ends[k];
+		}
+		_size = new_size;
+	}
+};
+
+// Cumulative statistics for waits on one of a ring's conditions
+struct RingWaitStats {
+	BFsize   count;       // No. waits that were not immediately satisfied
+	BFoffset nanoseconds; // Total time spent spinning or blocked
+};
+
+// A sequence as published to other processes attached to a shared ring
+struct BFring_shared_sequence {
+	enum {
+		MAX_NAME_SIZE   = 256,
+		MAX_HEADER_SIZE = 65536
+	};
+	BFoffset index; // Global sequence no.; slot is index % nsequence_slot
+	BFoffset time_tag;
+	BFsize   nringlet;
+	BFoffset begin;
+	BFoffset end;
+	BFsize   header_size;
+	double   time0;        // Time scale for the ring's time index
+	double   frame_period; //   (see BFsequence_impl)
+	BFsize   frame_nbyte;
+	char     name[MAX_NAME_SIZE];
+	char     header[MAX_HEADER_SIZE];
+};
+
+// All of the mutable state of a ring that must be visible to every user
+//   of it. This lives on the heap for private rings and at the start of a
+//   POSIX shared memory segment for shared rings.
+struct BFring_state {
+	enum {
+		MAGIC          = 0x42467267, // "BFrg"
+		VERSION        = 5,
+		NSEQUENCE_SLOT = 64
+	};
+	uint32_t       magic;
+	uint32_t       version;
+	BFspace        space;
+	
+	PosixMutex     mutex;
+	PosixCondition read_condition;
+	PosixCondition write_condition;
+	PosixCondition write_close_condition;
+	PosixCondition realloc_condition;
+	PosixCondition sequence_condition;
+	
+	BFsize         ghost_span;
+	BFsize         span;
+	BFsize         stride;
+	BFsize         nringlet;
+	BFoffset       offset0;
+	
+	BFoffset       tail;
+	BFoffset       head;
+	BFoffset       reserve_head;
+	
+	// Ranges at the front of the buffer whose ghost copies are out of date
+	RingIntervalSet ghost_dirty;
+	BFsize         nbyte_copied_to_ghost;
+	BFsize         nbyte_copied_from_ghost;
+	
+	bool           writing_begun;
+	bool           writing_ended;
+	BFoffset       eod;
+	
+	BFsize         nread_open;
+	BFsize         nwrite_open;
+	BFsize         nrealloc_pending;
+	BFsize         nreader;        // No. open read sequences
+	bool           spsc;           // Single-producer/single-consumer mode
+	
+	RingGuarantees guarantees;
+	// Guarantees held at the beginning of the first sequence for readers
+	//   that have yet to open it (see BFring_impl::expect_readers)
+	BFsize         nreader_expected;
+	BFsize         npending_guarantee;
+	BFoffset       pending_guarantee;
+	BFoffset       pending_time_tag;
+	
+	BFoffset       nbyte_committed;
+	BFoffset       nbyte_overwritten; // Lost by unguaranteed readers
+	RingWaitStats  read_wait;
+	RingWaitStats  write_wait;
+	RingWaitStats  write_close_wait;
+	RingWaitStats  realloc_wait;
+	BFring_wait_policy wait_policy;
+	BFsize         spin_count; // Pause iterations before blocking
+	
+	bool           mirror_enabled; // Use a mirrored buffer where possible
+	unsigned       alloc_flags;    // BFmalloc_flags for the buffer
+	int            numa_node;      // NUMA node to bind the buffer to, or -1
+	bool           buf_mirrored;
+	BFsize         buf_nbyte;      // Size of the buffer's address range
+	// Only used by shared rings
+	BFoffset       buf_generation;
+	BFoffset       nsequence;      // Total no. sequences ever published
+	BFsize         nsequence_slot; // Capacity of the published sequence table
+};
+
 class BFring_impl {
 	friend class BFsequence_impl;
 	friend class BFrsequence_impl;
@@ -71,87 +341,220 @@ class BFring_impl {
 	friend class BFwspan_impl;
 	friend class RingReallocLock;
 	
+	typedef PosixMutex                  mutex_type;
+	typedef std::lock_guard<PosixMutex>  lock_guard_type;
+	typedef std::unique_lock<PosixMutex> unique_lock_type;
+	typedef PosixCondition               condition_type;
+	typedef RingReallocLock              realloc_lock_type;
+	
+	std::string    _shared_name; // Empty for private (non-shared) rings
+	bool           _shared_owner;
+	pid_t          _shared_owner_pid;
+	BFring_state*  _state;
+	BFsize         _state_nbyte;
+	BFring_shared_sequence* _shared_sequences;
+	BFoffset       _nsequence_seen;
+	
 	BFspace        _space;
 	
 	typedef uint8_t*             pointer;
 	typedef uint8_t const* const_pointer;
 	pointer        _buf;
+	BFsize         _buf_nbyte;      // Size of the local mapping of _buf
+	bool           _buf_mirrored;
+	BFoffset       _buf_generation; // Generation of the local mapping of _buf
 	
-	BFsize         _ghost_span;
-	BFsize         _span;
-	BFsize         _stride;
-	BFsize         _nringlet;
-	BFoffset       _offset0;
+	// Note: These all refer to members of *_state
+	BFsize&        _ghost_span;
+	BFsize&        _span;
+	BFsize&        _stride;
+	BFsize&        _nringlet;
+	BFoffset&      _offset0;
 	
-	BFoffset       _tail;
-	BFoffset       _head;
-	BFoffset       _reserve_head;
+	BFoffset&      _tail;
+	BFoffset&      _head;
+	BFoffset&      _reserve_head;
 	
-	bool           _ghost_dirty;
+	RingIntervalSet& _ghost_dirty;
 	
-	bool     _writing_begun;
-	bool     _writing_ended;
-	BFoffset _eod;
+	bool&     _writing_begun;
+	bool&     _writing_ended;
+	BFoffset& _eod;
 	
-	typedef std::mutex                   mutex_type;
-	typedef std::lock_guard<std::mutex>  lock_guard_type;
-	typedef std::unique_lock<std::mutex> unique_lock_type;
-	typedef std::condition_variable      condition_type;
-	typedef RingReallocLock              realloc_lock_type;
-	mutex_type     _mutex;
-	condition_type _read_condition;
-	condition_type _write_condition;
-	condition_type _write_close_condition;
-	condition_type _realloc_condition;
-	condition_type _sequence_condition;
+	mutex_type&     _mutex;
+	condition_type& _read_condition;
+	condition_type& _write_condition;
+	condition_type& _write_close_condition;
+	condition_type& _realloc_condition;
+	condition_type& _sequence_condition;
 	
-	BFsize         _nread_open;
-	BFsize         _nwrite_open;
-	BFsize         _nrealloc_pending;
+	BFsize&        _nread_open;
+	BFsize&        _nwrite_open;
+	BFsize&        _nrealloc_pending;
 	
 	std::queue<BFsequence_sptr>           _sequence_queue;
 	std::map<std::string,BFsequence_sptr> _sequence_map;
 	std::map<BFoffset,BFsequence_sptr>    _sequence_time_tag_map;
-	//typedef std::pair<BFoffset,BFsize>          guarantee_value_type;
-	//typedef BFoffset guarantee_value_type;
-	//typedef std::multiset<guarantee_value_type> guarantee_set;
-	typedef std::map<BFoffset,BFsize> guarantee_set; // offset-->count
-	guarantee_set _guarantees;
+	std::map<double,BFsequence_sptr>      _sequence_time_map;
+	typedef RingGuarantees guarantee_set;
+	guarantee_set& _guarantees;
+	// Readers with a lag-bounded overrun policy (process-local)
+	std::set<BFrsequence> _lag_readers;
+	
+	BFring_impl(BFring_state* state, BFsize state_nbyte,
+	            std::string shared_name, bool shared_owner);
 	
 	BFoffset _wrap_offset(BFoffset offset) const;
 	//BFoffset _advance_offset(BFoffset offset, BFdelta amount) const;
 	BFoffset _buf_offset( BFoffset offset) const;
 	pointer  _buf_pointer(BFoffset offset) const;
+	pointer  _allocate_buf(BFsize span, BFsize stride, BFsize nringlet,
+	                       bool mirrored, BFoffset* generation);
+	bool     _explicit_hugepages() const;
+	void     _apply_alloc_options(void* buf, BFsize nbyte, std::string name);
+	void     _free_buf(pointer buf, BFsize nbyte, bool mirrored,
+	                   BFoffset generation);
+	void     _sync_buf();
 	void _ghost_write(BFoffset offset, BFsize size);
 	void _ghost_read( BFoffset offset, BFsize size);
 	void _copy_to_ghost(  BFoffset buf_offset, BFsize span);
 	void _copy_from_ghost(BFoffset buf_offset, BFsize span);
 	void _pull_tail(unique_lock_type& lock);
-	inline void _add_guarantee(BFoffset offset) {
-		auto iter = _guarantees.find(offset);
-		if( iter == _guarantees.end() ) {
-			_guarantees.insert(std::make_pair(offset, 1));
+	void _drop_lagging_readers(BFoffset reserve_head);
+	// Waits on cond until pred is satisfied, recording wait statistics
+	// Note: A negative timeout means wait forever, and a zero timeout
+	//         means do not wait at all.
+	//       Returns false if the timeout elapsed before pred was satisfied.
+	template<typename Predicate>
+	inline bool _wait(condition_type&   cond,
+	                  unique_lock_type& lock,
+	                  RingWaitStats&    stats,
+	                  Predicate         pred,
+	                  double            timeout_secs=-1) {
+		if( pred() ) {
+			return true;
 		}
-		else {
-			++iter->second;
+		if( timeout_secs == 0 ) {
+			return false;
+		}
+		auto t0 = std::chrono::steady_clock::now();
+		PosixConditionWaiter waiter(cond);
+		// Note: pred must be checked again now that we are registered as a
+		//         waiter, as the SPSC fast path only notifies if there are
+		//         waiters.
+		bool satisfied = (pred() ||
+		                  this->_spin(cond, lock, pred, t0, timeout_secs));
+		if( !satisfied ) {
+			if( timeout_secs < 0 ) {
+				cond.wait(lock, pred);
+				satisfied = true;
+			}
+			else {
+				double remaining = timeout_secs - _seconds_since(t0);
+				if( remaining > 0 ) {
+					satisfied = cond.wait_for(lock, remaining, pred);
+				}
+			}
 		}
+		auto t1 = std::chrono::steady_clock::now();
+		++stats.count;
+		stats.nanoseconds +=
+			std::chrono::duration_cast<std::chrono::nanoseconds>(t1 - t0).count();
+		return satisfied;
 	}
-	inline void _remove_guarantee(BFoffset offset) {
-		auto iter = _guarantees.find(offset);
-		if( iter == _guarantees.end() ) {
-			throw BFexception(BF_STATUS_INTERNAL_ERROR);
+	static inline double
+	_seconds_since(std::chrono::steady_clock::time_point t0) {
+		return std::chrono::duration<double>(
+			std::chrono::steady_clock::now() - t0).count();
+	}
+	// Spins (with the lock released) according to the ring's wait policy,
+	//   re-checking pred whenever cond is notified
+	// Note: Returns false if the caller should fall back to blocking
+	template<typename Predicate>
+	inline bool _spin(condition_type&   cond,
+	                  unique_lock_type& lock,
+	                  Predicate         pred,
+	                  std::chrono::steady_clock::time_point t0,
+	                  double            timeout_secs) {
+		BFring_wait_policy policy = _state->wait_policy;
+		if( policy == BF_RING_WAIT_BLOCK ) {
+			return false;
 		}
-		if( !--iter->second ) {
-			_guarantees.erase(iter);
+		bool   poll  = (policy == BF_RING_WAIT_POLL);
+		BFsize nspin = _state->spin_count;
+		BFsize i = 0;
+		while( poll || i < nspin ) {
+			uint32_t nnotify = cond.notify_count();
+			lock.unlock();
+			bool timed_out = false;
+			while( cond.notify_count() == nnotify && (poll || i < nspin) ) {
+				cpu_relax();
+				++i;
+				// Note: The clock is only checked occasionally as it is
+				//         relatively expensive to read.
+				if( timeout_secs > 0 && i % 1024 == 0 &&
+				    _seconds_since(t0) >= timeout_secs ) {
+					timed_out = true;
+					break;
+				}
+			}
+			lock.lock();
+			if( pred() ) {
+				return true;
+			}
+			if( timed_out ) {
+				return false;
+			}
+		}
+		return false;
+	}
+	// True if the tail could be pulled along to accommodate reserve_head
+	inline bool _can_reserve_to(BFoffset reserve_head) {
+		return ((_guarantees.empty() ||
+		         BFoffset(reserve_head - _get_earliest_guarantee()) <= _span) &&
+		        __atomic_load_n(&_nrealloc_pending, __ATOMIC_SEQ_CST) == 0);
+	}
+	// Lock-free fast path used in single-producer/single-consumer mode
+	//   (see ring_impl.cpp). These return false if the operation must
+	//   instead be done via the locked path.
+	bool _enter_fast_path(BFsize& nopen);
+	void _leave_fast_path(BFsize& nopen);
+	void _notify_waiters(condition_type& cond);
+	bool _try_reserve_span_fast(BFsize size, BFoffset* begin, void** data,
+	                            double timeout_secs);
+	bool _try_commit_span_fast(BFoffset begin, BFsize reserve_size,
+	                           BFsize commit_size);
+	bool _try_acquire_span_fast(BFsequence_impl* sequence,
+	                            BFoffset         offset,
+	                            BFsize           size,
+	                            BFoffset*        begin,
+	                            void**           data);
+	bool _try_release_span_fast(BFrsequence sequence,
+	                            BFoffset    offset,
+	                            BFsize      size);
+	void _pop_old_sequences();
+	void _publish_sequence(BFsequence_impl* sequence);
+	void _publish_sequence_end(BFsequence_impl* sequence);
+	void _import_sequences();
+	void _add_sequence(BFsequence_sptr sequence);
+	void _index_sequence_time(BFsequence_sptr sequence);
+	inline void _add_guarantee(BFoffset offset) {
+		_guarantees.add(offset);
+	}
+	inline void _remove_guarantee(BFoffset offset) {
+		if( _guarantees.remove(offset) ) {
 			_write_condition.notify_all();
 		}
 	}
 	inline BFoffset _get_earliest_guarantee() {
-		return _guarantees.begin()->first;
+		return _guarantees.earliest();
 	}
+	void _add_lag_reader(BFrsequence reader);
+	void _remove_lag_reader(BFrsequence reader);
 	void open_sequence(BFsequence_sptr sequence,
 	                   BFbool          guarantee,
-	                   BFoffset*       guarantee_begin);
+	                   BFoffset*       guarantee_begin,
+	                   BFoffset        guarantee_offset=0);
 	void close_sequence(BFsequence_sptr sequence,
 	                    BFbool          guarantee,
 	                    BFoffset        guarantee_begin);
@@ -161,20 +564,42 @@ class BFring_impl {
 	BFring_impl(BFring_impl&& )                 = delete;
 	BFring_impl& operator=(BFring_impl&& )      = delete;
 public:
+	// Creates a private ring
 	BFring_impl(BFspace space);
+	// Creates a ring in shared memory that other processes can attach to
+	BFring_impl(const char* name, BFspace space);
+	// Attaches to a ring created in shared memory by another process
+	BFring_impl(const char* name);
 	~BFring_impl();
 	void resize(BFsize max_contiguous_span,
 	            BFsize max_total_size,
 	            BFsize max_ringlets);
 	inline BFspace space()    const { return _space; }
+	inline bool    shared()   const { return !_shared_name.empty(); }
+	inline const char* shared_name() const { return _shared_name.c_str(); }
+	// Note: Takes effect at the next reallocation
+	void set_mirror_enabled(bool enabled);
+	bool mirrored();
+	// Note: Takes effect at the next reallocation
+	void set_alloc_options(unsigned flags, int numa_node);
+	void get_alloc_options(unsigned* flags, int* numa_node);
+	void set_wait_policy(BFring_wait_policy policy, BFsize spin_count);
+	// Note: Must be set before writing begins
+	void set_spsc(bool enabled);
+	bool spsc();
+	void expect_readers(BFsize nreader);
+	void cancel_expected_reader();
+	void get_wait_policy(BFring_wait_policy* policy, BFsize* spin_count);
 	//inline BFsize nringlet() const { return _nringlet; }
-	inline void   lock()   { _mutex.lock(); }
+	inline void   lock()   { _mutex.lock(); this->_sync_buf(); }
 	inline void   unlock() { _mutex.unlock(); }
 	inline void*  locked_data()            const { return _buf; }
 	inline BFsize locked_contiguous_span() const { return _ghost_span; }
 	inline BFsize locked_total_span()      const { return _span; }
 	inline BFsize locked_nringlet()        const { return _nringlet; }
 	inline BFsize locked_stride()          const { return _stride; }
+	void ghost_copy_stats(BFsize* nbyte_to_ghost, BFsize* nbyte_from_ghost);
+	void get_stats(BFring_stats* stats);
 	// TODO: Add getters for debugging/monitoring queries
 	//         such as positions of tail, head etc. in buffer.
 	
@@ -190,10 +615,20 @@ public:
 	                               BFoffset    offset_from_head=0);
 	BFsequence_sptr get_sequence(const char* name);
 	BFsequence_sptr get_sequence_at(BFoffset time_tag);
+	// Returns the sequence containing time, and the byte offset of the
+	//   frame containing time within it
+	BFsequence_sptr get_sequence_at_time(double time, BFoffset* offset);
+	void set_sequence_time_scale(BFsequence_sptr sequence,
+	                             double          time0,
+	                             double          frame_period,
+	                             BFsize          frame_nbyte);
 	BFsequence_sptr get_latest_sequence();
 	BFsequence_sptr get_earliest_sequence();
 	
-	void reserve_span(BFsize size, BFoffset* begin, void** data);
+	// Note: timeout_secs < 0 means wait forever, and 0 means do not wait.
+	//       Throws BF_STATUS_WOULD_BLOCK if the timeout elapses.
+	void reserve_span(BFsize size, BFoffset* begin, void** data,
+	                  double timeout_secs=-1);
 	void commit_span(BFoffset begin, BFsize reserve_size, BFsize commit_size);
 	
 	//void acquire_span(BFoffset offset, BFsize* size, BFbool guarantee);
@@ -201,7 +636,8 @@ public:
 	                  BFoffset    offset,
 	                  BFsize*     size,
 	                  BFoffset*   begin,
-	                  void**      data);
+	                  void**      data,
+	                  double      timeout_secs=-1);
 	void release_span(BFrsequence sequence,
 	                  BFoffset    offset,
 	                  BFsize      size);
@@ -253,6 +689,12 @@ class BFsequence_impl {
 	//BFsequence_sptr   _next;
 	BFsequence_sptr   _next;
 	BFsize            _readrefcount;
+	BFoffset          _shared_index; // Index in shared ring's table, or -1
+	// Time scale of the sequence's frames, used to index sequences by time
+	// Note: frame_nbyte is 0 if the sequence has not been given a time scale
+	double            _time0;
+	double            _frame_period;
+	BFsize            _frame_nbyte;
 	// No copy or move
 	//BFsequence_impl(BFsequence_impl const& )            = delete;
 	//BFsequence_impl& operator=(BFsequence_impl const& ) = delete;
@@ -279,6 +721,7 @@ public:
 	inline BFsize      nringlet()    const { return _nringlet; }
 	inline BFoffset    begin()       const { return _begin; }
 	inline BFoffset    end()         const { return _end; }
+	inline bool        time_indexed() const { return _frame_nbyte != 0; }
 };
 
 class BFsequence_wrapper {
@@ -335,12 +778,21 @@ public:
 	void set_end_offset_from_head(BFoffset end_offset_from_head) {
 		_end_offset_from_head = end_offset_from_head;
 	}
+	void set_time_scale(double time0, double frame_period, BFsize frame_nbyte) {
+		this->ring()->set_sequence_time_scale(this->sequence(), time0,
+		                                      frame_period, frame_nbyte);
+	}
 };
 class BFrsequence_impl : public BFsequence_wrapper {
 	friend class BFring_impl;
 	BFbool   _guaranteed;
 	BFoffset _guarantee_begin;
+	BFoffset _guarantee_offset; // Where the guarantee starts in the sequence
 	BFbool   _is_open;
+	BFring_overrun_policy _overrun_policy;
+	BFsize   _max_lag;
+	BFsize   _frame_nbyte;   // Granularity with which lost data are skipped
+	BFsize   _nbyte_skipped;
 	void set_guarantee_begin(BFoffset b) { _guarantee_begin = b; }
 	//BFrsequence_impl(BFrsequence_impl const& )            = delete;
 	BFrsequence_impl& operator=(BFrsequence_impl const& ) = delete;
@@ -353,13 +805,22 @@ class BFrsequence_impl : public BFsequence_wrapper {
 		_is_open = true;
 		this->sequence()->ring()->open_sequence(this->sequence(),
 		                                        _guaranteed,
-		                                        &_guarantee_begin);
+		                                        &_guarantee_begin,
+		                                        _guarantee_offset);
+		if( _overrun_policy == BF_RING_OVERRUN_LAG ) {
+			this->sequence()->ring()->_add_lag_reader(this);
+		}
 	}
 	inline void close() {
 		if( !_is_open ) {
 			throw BFexception(BF_STATUS_INTERNAL_ERROR);
 		}
 		_is_open = false;
+		// Note: This must come first, as the writer may move the guarantee
+		//         of a lag-bounded reader until it is removed.
+		if( _overrun_policy == BF_RING_OVERRUN_LAG ) {
+			this->sequence()->ring()->_remove_lag_reader(this);
+		}
 		this->sequence()->ring()->close_sequence(this->sequence(), _guaranteed, _guarantee_begin);
 	}
 	inline BFsequence_sptr get_next() {
@@ -367,8 +828,14 @@ class BFrsequence_impl : public BFsequence_wrapper {
 		return this->sequence()->get_next();
 	}
 public:
-	inline BFrsequence_impl(BFsequence_sptr sequence, BFbool guarantee)
-		: BFsequence_wrapper(sequence), _guaranteed(guarantee), _is_open(false) {
+	// Note: guarantee_offset allows the guarantee to start part-way through
+	//         the sequence instead of at its beginning.
+	inline BFrsequence_impl(BFsequence_sptr sequence, BFbool guarantee,
+	                        BFoffset guarantee_offset=0)
+		: BFsequence_wrapper(sequence), _guaranteed(guarantee),
+		  _guarantee_offset(guarantee_offset), _is_open(false),
+		  _overrun_policy(BF_RING_OVERRUN_BLOCK), _max_lag(0),
+		  _frame_nbyte(1), _nbyte_skipped(0) {
 		//this->sequence()->ring()->open_sequence(sequence,
 		//                                      _guaranteed, &_guarantee_begin);
 		this->open();
@@ -388,7 +855,10 @@ public:
 	inline BFrsequence_impl(BFrsequence_impl const& other)
 		: BFsequence_wrapper(other.sequence()),
 		  _guaranteed(other._guaranteed),
-		  _guarantee_begin(other._guarantee_begin), _is_open(false) {
+		  _guarantee_begin(other._guarantee_begin),
+		  _guarantee_offset(other._guarantee_offset), _is_open(false),
+		  _overrun_policy(other._overrun_policy), _max_lag(other._max_lag),
+		  _frame_nbyte(other._frame_nbyte), _nbyte_skipped(0) {
 		//this->sequence()->ring()->open_sequence(this->sequence(),
 		//                                        _guaranteed, &_guarantee_begin);
 		this->open();
@@ -411,10 +881,40 @@ public:
 		//         Only relevant when no rspans are opened (which is a pathological case)?
 		this->close();
 		this->reset_sequence(this->get_next());
+		_guarantee_offset = 0;
+		this->open();
+	}
+	inline void set_overrun_policy(BFring_overrun_policy policy,
+	                               BFsize                max_lag,
+	                               BFsize                frame_nbyte) {
+		BF_ASSERT_EXCEPTION(policy == BF_RING_OVERRUN_BLOCK ||
+		                    policy == BF_RING_OVERRUN_DROP  ||
+		                    policy == BF_RING_OVERRUN_LAG,
+		                    BF_STATUS_INVALID_ARGUMENT);
+		BF_ASSERT_EXCEPTION(frame_nbyte > 0, BF_STATUS_INVALID_ARGUMENT);
+		BFring ring = this->sequence()->ring();
+		// Note: The writer moves lag-bounded guarantees itself, which cannot
+		//         be done for readers in other processes or without the lock.
+		BF_ASSERT_EXCEPTION(policy != BF_RING_OVERRUN_LAG ||
+		                    !(ring->shared() || ring->spsc()),
+		                    BF_STATUS_UNSUPPORTED);
+		this->close();
+		_overrun_policy = policy;
+		_max_lag        = max_lag;
+		_frame_nbyte    = frame_nbyte;
+		_guaranteed     = (policy != BF_RING_OVERRUN_DROP);
 		this->open();
 	}
 	inline BFbool   guaranteed()      const { return _guaranteed; }
 	inline BFoffset guarantee_begin() const { return _guarantee_begin; }
+	inline BFring_overrun_policy overrun_policy() const { return _overrun_policy; }
+	inline BFsize   max_lag()         const { return _max_lag; }
+	inline BFsize   frame_nbyte()     const { return _frame_nbyte; }
+	inline BFsize   nbyte_skipped()   const { return _nbyte_skipped; }
+	// True if lost data are skipped over instead of truncating spans
+	inline bool     skips_lost_data() const {
+		return _overrun_policy != BF_RING_OVERRUN_BLOCK;
+	}
 };
 
 class BFspan_impl {
@@ -471,7 +971,8 @@ class BFwspan_impl : public BFspan_impl {
 public:
 	BFwspan_impl(//BFwsequence sequence,
 	             BFring      ring,
-	             BFsize      size);
+	             BFsize      size,
+	             double      timeout_secs=-1);
 	~BFwspan_impl();
 	BFwspan_impl* commit(BFsize size);
 	//inline virtual BFsequence_sptr sequence() const { return _sequence; }
@@ -496,7 +997,8 @@ class BFrspan_impl : public BFspan_impl {
 public:
 	BFrspan_impl(BFrsequence sequence,
 	             BFoffset    offset,
-	             BFsize      size);
+	             BFsize      size,
+	             double      timeout_secs=-1);
 	~BFrspan_impl();
 	//void advance(BFdelta delta, BFsize size, BFbool guarantee);
 	//inline virtual BFsequence_sptr sequence() const { return _sequence; }
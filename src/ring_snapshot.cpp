@@ -0,0 +1,329 @@
+/*
+ * Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+ * Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions
+ * are met:
+ * * Redistributions of source code must retain the above copyright
+ *   notice, this list of conditions and the following disclaimer.
+ * * Redistributions in binary form must reproduce the above copyright
+ *   notice, this list of conditions and the following disclaimer in the
+ *   documentation and/or other materials provided with the distribution.
+ * * Neither the name of The Bifrost Authors nor the names of its
+ *   contributors may be used to endorse or promote products derived
+ *   from this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+ * EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+ * IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+ * PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+ * CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+ * EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+ * PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+ * PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+ * OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+// Snapshots write a pinned range of a ring to a file on a background thread
+
+#include <bifrost/ring.h>
+#include "ring_impl.hpp"
+#include "assert.hpp"
+#include "utils.hpp"
+
+#include <cstring>
+#include <cstdlib>
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <condition_variable>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+
+class BFsnapshot_impl {
+	enum {
+		CHUNK_SIZE   = 8*1024*1024, // Max no. bytes per write
+		DIRECT_ALIGN = 4096         // Alignment required by O_DIRECT
+	};
+	BFring                            _ring;
+	BFsequence_sptr                   _sequence;
+	std::unique_ptr<BFrsequence_impl> _rsequence; // Holds the pin
+	int                               _fd;
+	int                               _direct_fd; // -1 unless direct_io
+	void*                             _bounce_buf;
+	BFoffset                          _offset;
+	BFsize                            _size;
+	BFsize                            _frame_nbyte;
+	BFsize                            _nringlet;
+	std::atomic<BFsize>               _nbyte_written;
+	std::atomic<bool>                 _cancelled;
+	std::mutex                        _mutex;
+	std::condition_variable           _finished_condition;
+	bool                              _finished;
+	BFstatus                          _status;
+	std::thread                       _thread;
+	// No copy or move
+	BFsnapshot_impl(BFsnapshot_impl const& )            = delete;
+	BFsnapshot_impl& operator=(BFsnapshot_impl const& ) = delete;
+	BFsnapshot_impl(BFsnapshot_impl&& )                 = delete;
+	BFsnapshot_impl& operator=(BFsnapshot_impl&& )      = delete;
+	
+	static void _pwrite_all(int fd, const char* data, BFsize size, BFoffset pos) {
+		while( size ) {
+			ssize_t n = ::pwrite(fd, data, size, pos);
+			if( n < 0 && errno == EINTR ) {
+				continue;
+			}
+			BF_ASSERT_EXCEPTION(n > 0, (errno == ENOSPC ?
+			                            BF_STATUS_INSUFFICIENT_STORAGE :
+			                            BF_STATUS_MEM_OP_FAILED));
+			data += n;
+			size -= n;
+			pos  += n;
+		}
+	}
+	void _write(const char* data, BFsize size, BFoffset pos) {
+		if( _direct_fd != -1 && pos % DIRECT_ALIGN == 0 ) {
+			// Write the aligned part via the bounce buffer, which satisfies
+			//   O_DIRECT's memory alignment requirement.
+			BFsize ndirect = size - size % DIRECT_ALIGN;
+			for( BFsize i=0; i<ndirect; i+=CHUNK_SIZE ) {
+				BFsize n = std::min(ndirect - i, (BFsize)CHUNK_SIZE);
+				::memcpy(_bounce_buf, data + i, n);
+				_pwrite_all(_direct_fd, (const char*)_bounce_buf, n, pos + i);
+			}
+			data += ndirect;
+			size -= ndirect;
+			pos  += ndirect;
+		}
+		// Note: Unaligned writes cannot use O_DIRECT and go via the page cache
+		_pwrite_all(_fd, data, size, pos);
+	}
+	void _pin() {
+		_rsequence.reset(new BFrsequence_impl(_sequence, true, _offset));
+		// Skip over anything that was overwritten before it could be pinned
+		BFoffset pinned = _rsequence->guarantee_begin() - _sequence->begin();
+		if( BFdelta(pinned - _offset) > 0 ) {
+			BFsize nskip = round_up(pinned - _offset, _frame_nbyte);
+			std::lock_guard<std::mutex> lock(_mutex);
+			_size   -= std::min(_size, nskip);
+			_offset += nskip;
+		}
+	}
+	bool _wait_for_start() {
+		// Note: A range that begins in the future cannot be pinned until the
+		//         writer reaches it, as the pin would stop the writer from
+		//         ever getting there.
+		BFrsequence_impl rsequence(_sequence, false);
+		while( !_cancelled ) {
+			try {
+				BFrspan_impl span(&rsequence, _offset, 1, 0.1);
+				return true;
+			}
+			catch( BFexception const& err ) {
+				if( err.status() == BF_STATUS_END_OF_DATA ) {
+					// The sequence ended before the range
+					std::lock_guard<std::mutex> lock(_mutex);
+					_size = 0;
+					return false;
+				}
+				else if( err.status() != BF_STATUS_WOULD_BLOCK ) {
+					throw;
+				}
+			}
+		}
+		return false;
+	}
+	void _run() {
+		if( !_rsequence ) {
+			if( this->_wait_for_start() ) {
+				this->_pin();
+			}
+		}
+		BFsize pos = 0;
+		// Note: Chunks must be small enough for the writer to be able to
+		//         fill them without overrunning the pin. The writer's gulp
+		//         size is not known, so the chunk size is halved whenever
+		//         a chunk takes too long to arrive, and grows back again
+		//         after each successful write.
+		BFsize max_nbyte = CHUNK_SIZE;
+		while( _rsequence && pos < _size && !_cancelled ) {
+			_ring->lock();
+			BFsize contiguous_span = _ring->locked_contiguous_span();
+			BFsize total_span      = _ring->locked_total_span();
+			_ring->unlock();
+			BFsize nbyte = std::min(std::min(max_nbyte, contiguous_span),
+			                        std::min(total_span/2, _size - pos));
+			if( nbyte < _size - pos && nbyte > DIRECT_ALIGN ) {
+				// Keep the writes aligned for O_DIRECT
+				nbyte -= nbyte % DIRECT_ALIGN;
+			}
+			try {
+				// Note: This times out periodically to check for cancellation
+				BFrspan_impl span(_rsequence.get(), _offset + pos, nbyte, 0.1);
+				BF_ASSERT_EXCEPTION(span.offset() == _sequence->begin() + _offset + pos,
+				                    BF_STATUS_INTERNAL_ERROR);
+				for( BFsize r=0; r<_nringlet; ++r ) {
+					this->_write((const char*)span.data() + r*span.stride(),
+					             span.size(), r*_size + pos);
+				}
+				pos += span.size();
+				_nbyte_written = pos;
+				max_nbyte = std::min(2*nbyte, (BFsize)CHUNK_SIZE);
+				if( span.size() < nbyte ) {
+					// The sequence ended part-way through the range
+					break;
+				}
+			}
+			catch( BFexception const& err ) {
+				if( err.status() == BF_STATUS_WOULD_BLOCK ) {
+					max_nbyte = std::max(nbyte/2, (BFsize)1);
+					continue;
+				}
+				else if( err.status() == BF_STATUS_END_OF_DATA ) {
+					break;
+				}
+				throw;
+			}
+		}
+		if( _cancelled ) {
+			return;
+		}
+		if( pos < _size && _nringlet == 1 ) {
+			// Note: With multiple ringlets the file layout is kept as is
+			std::lock_guard<std::mutex> lock(_mutex);
+			_size = pos;
+		}
+		BF_ASSERT_EXCEPTION(::ftruncate(_fd, _nringlet*_size) == 0,
+		                    BF_STATUS_MEM_OP_FAILED);
+	}
+	void _run_and_finish() {
+		BFstatus status = BF_STATUS_SUCCESS;
+		try {
+			this->_run();
+		}
+		catch( BFexception const& err ) {
+			status = err.status();
+		}
+		catch( std::exception const& err ) {
+			BF_REPORT_INTERNAL_ERROR(err.what());
+			status = BF_STATUS_INTERNAL_ERROR;
+		}
+		// Release the pin straight away rather than when the snapshot is
+		//   destroyed, so that it cannot stall the writer.
+		_rsequence.reset();
+		std::lock_guard<std::mutex> lock(_mutex);
+		_finished = true;
+		_status   = status;
+		_finished_condition.notify_all();
+	}
+	void _close_files() {
+		if( _fd        != -1 ) { ::close(_fd); }
+		if( _direct_fd != -1 ) { ::close(_direct_fd); }
+		::free(_bounce_buf);
+	}
+public:
+	BFsnapshot_impl(BFring      ring,
+	                BFoffset    time_tag,
+	                BFoffset    offset,
+	                BFsize      size,
+	                BFsize      frame_nbyte,
+	                const char* filename,
+	                bool        direct_io)
+		: _ring(ring), _fd(-1), _direct_fd(-1), _bounce_buf(nullptr),
+		  _frame_nbyte(frame_nbyte), _nbyte_written(0), _cancelled(false),
+		  _finished(false), _status(BF_STATUS_SUCCESS) {
+		BF_ASSERT_EXCEPTION(ring->space() == BF_SPACE_SYSTEM ||
+		                    ring->space() == BF_SPACE_CUDA_HOST,
+		                    BF_STATUS_UNSUPPORTED_SPACE);
+		_sequence = ring->get_sequence_at(time_tag);
+		_nringlet = _sequence->nringlet();
+		_offset   = offset;
+		_size     = size;
+		BFring_stats stats;
+		ring->get_stats(&stats);
+		if( BFdelta(stats.head - (_sequence->begin() + _offset)) >= 0 ) {
+			this->_pin();
+		}
+		if( _sequence->is_finished() ) {
+			BFsize sequence_size = _sequence->end() - _sequence->begin();
+			_size = std::min(_size, sequence_size - std::min(sequence_size, _offset));
+		}
+		_fd = ::open(filename, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+		BF_ASSERT_EXCEPTION(_fd != -1, BF_STATUS_INVALID_ARGUMENT);
+		if( direct_io ) {
+			_direct_fd = ::open(filename, O_WRONLY | O_DIRECT);
+			if( _direct_fd == -1 ||
+			    ::posix_memalign(&_bounce_buf, DIRECT_ALIGN, CHUNK_SIZE) != 0 ) {
+				this->_close_files();
+				// Note: O_DIRECT is not supported by all filesystems (e.g., tmpfs)
+				throw BFexception(BF_STATUS_UNSUPPORTED);
+			}
+		}
+		_thread = std::thread(&BFsnapshot_impl::_run_and_finish, this);
+	}
+	~BFsnapshot_impl() {
+		_cancelled = true;
+		_thread.join();
+		this->_close_files();
+	}
+	BFstatus wait(double timeout_secs) {
+		std::unique_lock<std::mutex> lock(_mutex);
+		if( timeout_secs < 0 ) {
+			_finished_condition.wait(lock, [&]() { return _finished; });
+		}
+		else if( !_finished_condition.wait_for(
+			         lock, std::chrono::duration<double>(timeout_secs),
+			         [&]() { return _finished; }) ) {
+			return BF_STATUS_WOULD_BLOCK;
+		}
+		return _status;
+	}
+	void get_info(BFsnapshot_info* info) {
+		std::lock_guard<std::mutex> lock(_mutex);
+		info->offset        = _offset;
+		info->size          = _size;
+		info->nbyte_written = _nbyte_written;
+		info->nringlet      = _nringlet;
+		info->finished      = _finished;
+	}
+};
+
+BFstatus bfRingSnapshotBegin(BFsnapshot* snapshot,
+                             BFring      ring,
+                             BFoffset    time_tag,
+                             BFoffset    offset,
+                             BFsize      size,
+                             BFsize      frame_nbyte,
+                             const char* filename,
+                             BFbool      direct_io) {
+	BF_ASSERT(snapshot, BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(ring,     BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(filename, BF_STATUS_INVALID_POINTER);
+	BF_ASSERT(time_tag!=BFoffset(-1), BF_STATUS_INVALID_ARGUMENT);
+	BF_ASSERT(frame_nbyte > 0,         BF_STATUS_INVALID_ARGUMENT);
+	BF_TRY_RETURN_ELSE(*snapshot = new BFsnapshot_impl(ring, time_tag, offset,
+	                                                   size, frame_nbyte,
+	                                                   filename, direct_io),
+	                   *snapshot = 0);
+}
+BFstatus bfRingSnapshotWait(BFsnapshot snapshot, double timeout_secs) {
+	BF_ASSERT(snapshot, BF_STATUS_INVALID_HANDLE);
+	return snapshot->wait(timeout_secs);
+}
+BFstatus bfRingSnapshotGetInfo(BFsnapshot snapshot, BFsnapshot_info* info) {
+	BF_ASSERT(snapshot, BF_STATUS_INVALID_HANDLE);
+	BF_ASSERT(info,     BF_STATUS_INVALID_POINTER);
+	BF_TRY_RETURN(snapshot->get_info(info));
+}
+BFstatus bfRingSnapshotDestroy(BFsnapshot snapshot) {
+	BF_ASSERT(snapshot, BF_STATUS_INVALID_HANDLE);
+	BF_TRY_RETURN(delete snapshot);
+}
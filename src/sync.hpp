@@ -0,0 +1,202 @@
+/*
+ * Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+ * Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions
+ * are met:
+ * * Redistributions of source code must retain the above copyright
+ *   notice, this list of conditions and the following disclaimer.
+ * * Redistributions in binary form must reproduce the above copyright
+ *   notice, this list of conditions and the following disclaimer in the
+ *   documentation and/or other materials provided with the distribution.
+ * * Neither the name of The Bifrost Authors nor the names of its
+ *   contributors may be used to endorse or promote products derived
+ *   from this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+ * EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+ * IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+ * PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+ * CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+ * EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+ * PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+ * PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+ * OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+// Thin wrappers around pthread mutexes and condition variables
+//   These are used instead of std::mutex/std::condition_variable because
+//     they can optionally be placed in shared memory and used across
+//     processes (PTHREAD_PROCESS_SHARED).
+// Note: These are POD types; they must be explicitly initialised with
+//         init() and released with destroy().
+
+#pragma once
+
+#include <bifrost/common.h>
+#include "assert.hpp"
+
+#include <pthread.h>
+#include <errno.h>
+#include <time.h>
+#include <mutex>
+
+// Hints to the CPU that the caller is busy-waiting
+inline void cpu_relax() {
+#if defined __x86_64__ || defined __i386__
+	__builtin_ia32_pause();
+#elif defined __aarch64__ || defined __arm__
+	asm volatile("yield" ::: "memory");
+#else
+	asm volatile("" ::: "memory");
+#endif
+}
+
+class PosixMutex {
+	pthread_mutex_t _mutex;
+public:
+	inline void init(bool process_shared=false) {
+		pthread_mutexattr_t attr;
+		pthread_mutexattr_init(&attr);
+		if( process_shared ) {
+			pthread_mutexattr_setpshared(&attr, PTHREAD_PROCESS_SHARED);
+#if defined __linux__ && __linux__
+			// Allows recovery if a process dies while holding the lock
+			pthread_mutexattr_setrobust(&attr, PTHREAD_MUTEX_ROBUST);
+#endif
+		}
+		int ret = pthread_mutex_init(&_mutex, &attr);
+		pthread_mutexattr_destroy(&attr);
+		BF_ASSERT_EXCEPTION(ret == 0, BF_STATUS_INTERNAL_ERROR);
+	}
+	inline void destroy() { pthread_mutex_destroy(&_mutex); }
+	inline void lock() {
+		int ret = pthread_mutex_lock(&_mutex);
+#if defined __linux__ && __linux__
+		if( ret == EOWNERDEAD ) {
+			ret = pthread_mutex_consistent(&_mutex);
+		}
+#endif
+		BF_ASSERT_EXCEPTION(ret == 0, BF_STATUS_INTERNAL_ERROR);
+	}
+	inline bool try_lock() {
+		int ret = pthread_mutex_trylock(&_mutex);
+#if defined __linux__ && __linux__
+		if( ret == EOWNERDEAD ) {
+			ret = pthread_mutex_consistent(&_mutex);
+		}
+#endif
+		return ret == 0;
+	}
+	inline void unlock() { pthread_mutex_unlock(&_mutex); }
+	inline pthread_mutex_t* native_handle() { return &_mutex; }
+};
+
+class PosixCondition {
+	pthread_cond_t _cond;
+	uint32_t       _nnotify;  // Incremented by every notify (for spinners)
+	uint32_t       _nwaiting; // No. threads currently waiting (see below)
+public:
+	typedef std::unique_lock<PosixMutex> lock_type;
+	inline void init(bool process_shared=false) {
+		pthread_condattr_t attr;
+		pthread_condattr_init(&attr);
+		if( process_shared ) {
+			pthread_condattr_setpshared(&attr, PTHREAD_PROCESS_SHARED);
+		}
+#if defined __linux__ && __linux__
+		// Note: This makes timed waits immune to changes of the system time
+		pthread_condattr_setclock(&attr, CLOCK_MONOTONIC);
+#endif
+		int ret = pthread_cond_init(&_cond, &attr);
+		pthread_condattr_destroy(&attr);
+		_nnotify  = 0;
+		_nwaiting = 0;
+		BF_ASSERT_EXCEPTION(ret == 0, BF_STATUS_INTERNAL_ERROR);
+	}
+	inline void destroy() { pthread_cond_destroy(&_cond); }
+	inline void wait(lock_type& lock) {
+		pthread_mutex_t* mutex = lock.mutex()->native_handle();
+		int ret = pthread_cond_wait(&_cond, mutex);
+#if defined __linux__ && __linux__
+		if( ret == EOWNERDEAD ) {
+			ret = pthread_mutex_consistent(mutex);
+		}
+#endif
+		BF_ASSERT_EXCEPTION(ret == 0, BF_STATUS_INTERNAL_ERROR);
+	}
+	template<typename Predicate>
+	inline void wait(lock_type& lock, Predicate pred) {
+		while( !pred() ) {
+			this->wait(lock);
+		}
+	}
+	// Returns false if timeout_secs elapsed without pred being satisfied
+	template<typename Predicate>
+	inline bool wait_for(lock_type& lock, double timeout_secs, Predicate pred) {
+#if defined __linux__ && __linux__
+		clockid_t clock_id = CLOCK_MONOTONIC;
+#else
+		clockid_t clock_id = CLOCK_REALTIME;
+#endif
+		struct timespec deadline;
+		clock_gettime(clock_id, &deadline);
+		long whole_secs = (long)timeout_secs;
+		deadline.tv_sec  += whole_secs;
+		deadline.tv_nsec += (long)((timeout_secs - whole_secs) * 1e9);
+		if( deadline.tv_nsec >= 1000000000L ) {
+			deadline.tv_sec  += 1;
+			deadline.tv_nsec -= 1000000000L;
+		}
+		pthread_mutex_t* mutex = lock.mutex()->native_handle();
+		while( !pred() ) {
+			int ret = pthread_cond_timedwait(&_cond, mutex, &deadline);
+			if( ret == ETIMEDOUT ) {
+				return pred();
+			}
+#if defined __linux__ && __linux__
+			if( ret == EOWNERDEAD ) {
+				ret = pthread_mutex_consistent(mutex);
+			}
+#endif
+			BF_ASSERT_EXCEPTION(ret == 0, BF_STATUS_INTERNAL_ERROR);
+		}
+		return true;
+	}
+	// Allows waiters to spin (without holding the lock) until the next
+	//   notification instead of blocking in wait().
+	inline uint32_t notify_count() const {
+		return __atomic_load_n(&_nnotify, __ATOMIC_ACQUIRE);
+	}
+	// Waiters may register themselves (before checking their predicate) so
+	//   that code that updates state without holding the lock can skip
+	//   taking it to notify when nobody is waiting.
+	inline void begin_wait() { __atomic_fetch_add(&_nwaiting, 1, __ATOMIC_SEQ_CST); }
+	inline void end_wait()   { __atomic_fetch_sub(&_nwaiting, 1, __ATOMIC_SEQ_CST); }
+	inline bool has_waiters() const {
+		return __atomic_load_n(&_nwaiting, __ATOMIC_SEQ_CST) != 0;
+	}
+	inline void notify_one() {
+		__atomic_fetch_add(&_nnotify, 1, __ATOMIC_RELEASE);
+		pthread_cond_signal(&_cond);
+	}
+	inline void notify_all() {
+		__atomic_fetch_add(&_nnotify, 1, __ATOMIC_RELEASE);
+		pthread_cond_broadcast(&_cond);
+	}
+};
+
+// Registers the calling thread as a waiter on a condition for its lifetime
+class PosixConditionWaiter {
+	PosixCondition& _cond;
+	PosixConditionWaiter(PosixConditionWaiter const& )            = delete;
+	PosixConditionWaiter& operator=(PosixConditionWaiter const& ) = delete;
+public:
+	inline explicit PosixConditionWaiter(PosixCondition& cond) : _cond(cond) {
+		_cond.begin_wait();
+	}
+	inline ~PosixConditionWaiter() { _cond.end_wait(); }
+};
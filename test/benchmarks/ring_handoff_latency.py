@@ -0,0 +1,92 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+
+
+"""Measures the latency of handing small spans between threads via rings
+
+A span is passed from a 'ping' thread to an 'echo' thread through one ring
+and straight back through a second ring, and the mean round-trip time is
+reported for each ring wait policy.
+
+Usage: python ring_handoff_latency.py [nframe_per_gulp] [ngulp]
+"""
+
+import sys
+import time
+import threading
+import numpy as np
+from bifrost.ring2 import Ring
+
+def make_header(name, nframe_per_gulp):
+	return {'name':        name,
+	        'time_tag':    0,
+	        'gulp_nframe': nframe_per_gulp,
+	        '_tensor':     {'dtype': 'u8',
+	                        'shape': [-1, 64]}}
+
+def forward(iring, oring, gulp_nframe, ngulp, opened, name):
+	with oring.begin_writing() as owriter:
+		with owriter.begin_sequence(make_header(name, gulp_nframe),
+		                            gulp_nframe*4) as oseq:
+			with iring.open_earliest_sequence(guarantee=True) as iseq:
+				opened.set()
+				for i in xrange(ngulp):
+					with iseq.acquire(i*gulp_nframe, gulp_nframe):
+						pass
+					with oseq.reserve(gulp_nframe):
+						pass
+
+def measure(wait_policy, gulp_nframe, ngulp, spin_count=10000):
+	ping_ring = Ring(wait_policy=wait_policy, spin_count=spin_count)
+	echo_ring = Ring(wait_policy=wait_policy, spin_count=spin_count)
+	echo_opened = threading.Event()
+	echo = threading.Thread(target=forward,
+	                        args=(ping_ring, echo_ring, gulp_nframe, ngulp,
+	                              echo_opened, 'echo'))
+	with ping_ring.begin_writing() as owriter:
+		with owriter.begin_sequence(make_header('ping', gulp_nframe),
+		                            gulp_nframe*4) as oseq:
+			echo.start()
+			echo_opened.wait()
+			with echo_ring.open_earliest_sequence(guarantee=True) as iseq:
+				t0 = time.time()
+				for i in xrange(ngulp):
+					with oseq.reserve(gulp_nframe):
+						pass
+					with iseq.acquire(i*gulp_nframe, gulp_nframe):
+						pass
+				t1 = time.time()
+	echo.join()
+	return (t1 - t0) / ngulp
+
+if __name__ == "__main__":
+	gulp_nframe = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+	ngulp       = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+	print "Round-trip handoff latency (%i frame(s) x 64 B per gulp):" % gulp_nframe
+	for wait_policy in ['block', 'spin', 'poll']:
+		latency = measure(wait_policy, gulp_nframe, ngulp)
+		print "  %-6s %8.2f us" % (wait_policy, latency*1e6)
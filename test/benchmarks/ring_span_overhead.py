@@ -0,0 +1,103 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+
+
+"""Measures the per-span overhead of reserving/committing and
+acquiring/releasing spans, with and without the ring's
+single-producer/single-consumer (SPSC) mode, and the Python overhead per
+span (including access to span.data) when nothing has to wait
+
+Usage: python ring_span_overhead.py [nspan]
+"""
+
+import sys
+import time
+import threading
+from bifrost.ring2 import Ring
+
+GULP_NFRAME = 1
+
+def make_header(name):
+	return {'name':        name,
+	        'time_tag':    0,
+	        'gulp_nframe': GULP_NFRAME,
+	        '_tensor':     {'dtype': 'u8',
+	                        'shape': [-1, 64]}}
+
+def write_spans(ring, nspan, opened):
+	with ring.begin_writing() as owriter:
+		with owriter.begin_sequence(make_header('seq0'),
+		                            GULP_NFRAME*64) as oseq:
+			opened.wait()
+			for i in xrange(nspan):
+				with oseq.reserve(GULP_NFRAME):
+					pass
+
+def measure(spsc, nspan):
+	ring = Ring(spsc=spsc)
+	opened = threading.Event()
+	writer = threading.Thread(target=write_spans, args=(ring, nspan, opened))
+	writer.start()
+	with ring.open_earliest_sequence(guarantee=True) as iseq:
+		opened.set()
+		t0 = time.time()
+		for i in xrange(nspan):
+			with iseq.acquire(i*GULP_NFRAME, GULP_NFRAME):
+				pass
+		t1 = time.time()
+	writer.join()
+	return (t1 - t0) / nspan
+
+def measure_python(nspan, access_data):
+	"""Writes and then reads each span from a single thread, so that only
+	the Python and library overhead is measured"""
+	ring = Ring()
+	with ring.begin_writing() as owriter:
+		with owriter.begin_sequence(make_header('seq0'),
+		                            GULP_NFRAME*64) as oseq:
+			with ring.open_earliest_sequence(guarantee=True) as iseq:
+				t0 = time.time()
+				for i in xrange(nspan):
+					with oseq.reserve(GULP_NFRAME) as ospan:
+						if access_data:
+							ospan.data
+					with iseq.acquire(i*GULP_NFRAME, GULP_NFRAME) as ispan:
+						if access_data:
+							ispan.data
+				t1 = time.time()
+	return (t1 - t0) / nspan
+
+if __name__ == "__main__":
+	nspan = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	print "Per-span overhead (one writer thread, one reader thread):"
+	for spsc in [False, True]:
+		overhead = measure(spsc, nspan)
+		print "  spsc=%-5s %8.2f us" % (spsc, overhead*1e6)
+	print "Python overhead per span (write + read, one thread):"
+	for access_data in [False, True]:
+		overhead = measure_python(nspan, access_data)
+		print "  data=%-5s %8.2f us" % (access_data, overhead*1e6)
@@ -0,0 +1,117 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for bifrost.benchmarks"""
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import time
+from bifrost.benchmarks import (BENCHMARKS, match_benchmarks, run_benchmark,
+                                run_benchmarks, compare_results, RateLimiter)
+from bifrost.benchmarks.blocks import (random_frames, synthetic_source,
+                                       synthetic_sink)
+from bifrost.benchmarks.__main__ import main
+
+SMALL_PARAMS = {'nframe': 1024, 'gulp_nframe': 64, 'nchan': 16, 'npol': 2,
+                'depth': 2, 'width': 2}
+
+def make_result(gbps, spans_per_sec, p99):
+	return {'gbps': gbps, 'spans_per_sec': spans_per_sec,
+	        'latency': {'count': 10, 'p50': p99 / 2., 'p99': p99}}
+
+class BenchmarksTest(unittest.TestCase):
+	def test_rate_limiter(self):
+		limiter = RateLimiter(1000.)
+		start_time = time.time()
+		for _ in xrange(3):
+			limiter.wait(100)
+		self.assertGreaterEqual(time.time() - start_time, 0.19)
+	def test_random_frames(self):
+		self.assertEqual(random_frames(4, [3, 2], 'f32').shape,  (4, 24))
+		self.assertEqual(random_frames(4, [3, 2], 'cf32').shape, (4, 48))
+		self.assertEqual(random_frames(4, [3, 2], 'ci4').shape,  (4, 6))
+	def test_match_benchmarks(self):
+		self.assertEqual(match_benchmarks([]), list(BENCHMARKS.keys()))
+		self.assertEqual(match_benchmarks(['fan_*']), ['fan_out', 'fan_in'])
+		with self.assertRaises(KeyError):
+			match_benchmarks(['nonexistent'])
+	def test_run_benchmarks(self):
+		results = run_benchmarks(**SMALL_PARAMS)
+		self.assertEqual(list(results.keys()), list(BENCHMARKS.keys()))
+		nframe = SMALL_PARAMS['nframe']
+		nelement = nframe * SMALL_PARAMS['nchan'] * SMALL_PARAMS['npol']
+		self.assertEqual(results['linear_chain']['nbyte'], nelement*4)
+		self.assertEqual(results['fan_out']['nbyte'], 2*nelement*4)
+		self.assertEqual(results['block.unpack']['nbyte'], nelement)
+		self.assertEqual(results['block.sigproc_read']['nbyte'], nelement)
+		for name, result in results.items():
+			self.assertGreater(result['gbps'], 0, name)
+			self.assertGreater(result['spans_per_sec'], 0, name)
+			self.assertGreater(result['latency']['count'], 0, name)
+	def test_lost_data(self):
+		# A sink that is not guaranteed its data falls behind the source
+		def lossy(p):
+			data = synthetic_source(p['nframe'], [p['nchan'], p['npol']],
+			                        'f32', p['gulp_nframe'])
+			return [synthetic_sink(data, rate=p['nframe'] / 0.2,
+			                       guarantee=False)]
+		BENCHMARKS['lossy'] = lossy
+		try:
+			with self.assertRaises(RuntimeError):
+				run_benchmark('lossy', **dict(SMALL_PARAMS, nframe=4096))
+		finally:
+			del BENCHMARKS['lossy']
+	def test_compare_results(self):
+		baseline = {'a': make_result(1.,  100., 1e-3),
+		            'b': make_result(1.,  100., 1e-3)}
+		results  = {'a': make_result(0.95, 80., 1e-3),
+		            'b': make_result(1.,  100., 2e-3),
+		            'c': make_result(0.1,  1.,  1.)}
+		regressions = compare_results(results, baseline, tolerance=0.1)
+		self.assertEqual(sorted([(name, metric)
+		                         for name, metric, _, _ in regressions]),
+		                 [('a', 'spans_per_sec'),
+		                  ('b', 'latency.p50'), ('b', 'latency.p99')])
+	def test_main(self):
+		tmpdir = tempfile.mkdtemp()
+		try:
+			output = os.path.join(tmpdir, 'results.json')
+			args = ['--nframe', '256', '--gulp-nframe', '64', '--nchan', '16',
+			        'block.copy']
+			self.assertEqual(main(args + ['-o', output, '--label', 'test']), 0)
+			with open(output, 'r') as f:
+				report = json.load(f)
+			self.assertEqual(report['label'], 'test')
+			self.assertIn('block.copy', report['benchmarks'])
+			# Comparing with a huge tolerance should find no regressions
+			self.assertEqual(main(args + ['-b', output, '-t', '100']), 0)
+		finally:
+			shutil.rmtree(tmpdir)
@@ -0,0 +1,101 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for bifrost.block_stats"""
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from bifrost.block_stats import BlockStats, PipelineStats, list_pipelines
+
+class DummyBlock(object):
+	def __init__(self, name):
+		self.name = name
+		self.type = 'DummyBlock'
+		self.perf_stats = BlockStats()
+
+class BlockStatsTest(unittest.TestCase):
+	def setUp(self):
+		self.stats_dir = tempfile.mkdtemp()
+	def tearDown(self):
+		shutil.rmtree(self.stats_dir)
+	def test_record(self):
+		stats = BlockStats()
+		stats.begin_sequence()
+		stats.record_gulp(10, 5, 40, 20, 0.25, 0.5, 1.)
+		stats.record_gulp(10, 5, 40, 20, 0.25, 0.5, 2.)
+		values = stats.read()
+		self.assertEqual(values['nsequence'],  1)
+		self.assertEqual(values['ngulp'],      2)
+		self.assertEqual(values['nframe_in'],  20)
+		self.assertEqual(values['nbyte_out'],  40)
+		self.assertEqual(values['process_time'], 3.)
+		self.assertEqual(values['last_process_time'], 2.)
+		self.assertEqual(values['update_count'] % 2, 0)
+		stats.begin_sequence()
+		values = stats.read()
+		self.assertEqual(values['sequence_ngulp'], 0)
+		self.assertEqual(values['ngulp'],          2)
+	def test_publish(self):
+		blocks = [DummyBlock('a'), DummyBlock('b')]
+		blocks[0].perf_stats.record_gulp(1, 1, 8, 8, 0., 0., 0.)
+		with PipelineStats('test', blocks, self.stats_dir) as pipeline_stats:
+			blocks[1].perf_stats.record_gulp(3, 2, 24, 16, 0., 0., 0.)
+			readers = list_pipelines(self.stats_dir)
+			self.assertEqual(len(readers), 1)
+			self.assertEqual(readers[0].pipeline, 'test')
+			self.assertEqual(readers[0].pid, os.getpid())
+			values = readers[0].read()
+			self.assertEqual([block['name'] for block, _ in values],
+			                 ['a', 'b'])
+			self.assertEqual(values[0][1]['nframe_in'], 1)
+			self.assertEqual(values[1][1]['nframe_out'], 2)
+			filename = pipeline_stats.filename
+		self.assertFalse(os.path.exists(filename))
+		self.assertEqual(list_pipelines(self.stats_dir), [])
+		# The statistics remain available after publishing stops
+		self.assertEqual(blocks[1].perf_stats.read()['nbyte_in'], 24)
+	def test_concurrent_read(self):
+		blocks = [DummyBlock('writer')]
+		ngulp = 20000
+		with PipelineStats('test', blocks, self.stats_dir):
+			def write():
+				for _ in xrange(ngulp):
+					blocks[0].perf_stats.record_gulp(2, 2, 8, 8, 0., 0., 0.)
+			thread = threading.Thread(target=write)
+			thread.start()
+			reader = list_pipelines(self.stats_dir)[0]
+			while thread.is_alive():
+				values = reader.read()[0][1]
+				# Each read must see a single, complete update
+				self.assertEqual(values['nframe_in'], 2*values['ngulp'])
+				self.assertEqual(values['nbyte_out'], 8*values['ngulp'])
+			thread.join()
+			self.assertEqual(reader.read()[0][1]['ngulp'], ngulp)
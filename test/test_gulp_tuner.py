@@ -0,0 +1,92 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for bifrost.gulp_tuner"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from bifrost.gulp_tuner import (GulpTuner, scale_slice,
+                                load_gulp_config, save_gulp_config)
+
+class GulpTunerTest(unittest.TestCase):
+	def test_scale_slice(self):
+		self.assertEqual(scale_slice(slice(0, 100, 100), 2), slice(0, 200, 200))
+		self.assertEqual(scale_slice(slice(0, 100, 100), 0.25), slice(0, 25, 25))
+		# The overlap between gulps is kept
+		self.assertEqual(scale_slice(slice(3, 110, 100), 0.5), slice(3, 60, 50))
+		self.assertIsNone(scale_slice(slice(0, 10, 10), 0.25))
+		self.assertIsNone(scale_slice(slice(0, 2, 2), 0.25))
+	def run_tuner(self, tuner, frames_per_sec):
+		scales = []
+		while not tuner.done:
+			scale = tuner.scale
+			scales.append(scale)
+			nframe = int(100*scale)
+			tuner.record_gulp(nframe, nframe / frames_per_sec(scale))
+		return scales
+	def test_chooses_fastest(self):
+		tuner = GulpTuner(scales=[0.5, 1, 2], ngulp=3)
+		tuner.set_candidates([2, 0.5, 1])
+		scales = self.run_tuner(tuner, lambda scale: {0.5: 10., 1: 30., 2: 20.}[scale])
+		# Each candidate gets a warm-up gulp plus ngulp measured gulps
+		self.assertEqual(scales, [0.5]*4 + [1]*4 + [2]*4)
+		self.assertEqual(tuner.best_scale, 1)
+		self.assertEqual(tuner.scale, 1)
+		self.assertAlmostEqual(tuner.throughputs[2], 20.)
+		self.assertFalse(tuner.record_gulp(100, 1.))
+	def test_warm_up_gulp_ignored(self):
+		tuner = GulpTuner(scales=[1, 2], ngulp=2)
+		tuner.set_candidates([1, 2])
+		tuner.record_gulp(100, 100.) # Slow warm-up
+		tuner.record_gulp(100, 1.)
+		self.assertTrue(tuner.record_gulp(100, 1.))
+		self.assertAlmostEqual(tuner.throughputs[1], 100.)
+		self.assertEqual(tuner.scale, 2)
+		self.assertEqual(tuner.max_scale, 2)
+	def test_finish_early(self):
+		tuner = GulpTuner(scales=[1, 2, 4], ngulp=1)
+		tuner.set_candidates([1, 2, 4])
+		tuner.record_gulp(100, 1.)
+		tuner.record_gulp(100, 1.)
+		tuner.finish()
+		self.assertEqual(tuner.best_scale, 1)
+		tuner = GulpTuner()
+		tuner.set_candidates([])
+		self.assertTrue(tuner.done)
+		self.assertEqual(tuner.scale, 1)
+	def test_config_file(self):
+		tmpdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tmpdir, 'gulps.json')
+			save_gulp_config(filename, {'CopyBlock_0': {'gulp_scale': 2,
+			                                            'gulp_nframe': 200}})
+			self.assertEqual(load_gulp_config(filename), {'CopyBlock_0': 2})
+		finally:
+			shutil.rmtree(tmpdir)
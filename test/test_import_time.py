@@ -0,0 +1,70 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Checks that importing bifrost stays fast, because many short-lived
+processes pay for it at startup
+
+The time budget (in ms) can be changed with BIFROST_IMPORT_BUDGET_MS.
+"""
+
+import unittest
+import os
+import sys
+import time
+import subprocess
+
+IMPORT_BUDGET_MS = float(os.getenv('BIFROST_IMPORT_BUDGET_MS', 300))
+NTRIAL = 5
+
+def run_python(code):
+	return subprocess.check_output([sys.executable, '-c', code])
+
+class ImportTimeTest(unittest.TestCase):
+	def test_import_time(self):
+		# Note: The first run also warms up the filesystem cache
+		run_python('import bifrost')
+		times = []
+		for _ in xrange(NTRIAL):
+			t0 = time.time()
+			run_python('import bifrost')
+			times.append(time.time() - t0)
+		import_ms = min(times) * 1e3
+		self.assertLess(import_ms, IMPORT_BUDGET_MS,
+		                "import bifrost took %.0f ms (budget is %.0f ms)" %
+		                (import_ms, IMPORT_BUDGET_MS))
+	def test_heavy_modules_not_imported(self):
+		loaded = run_python(
+			'import sys, bifrost\n'
+			'for name in ["matplotlib", "pint", "bifrost.block", '
+			'"bifrost.pipeline", "bifrost.sigproc"]:\n'
+			'    if name in sys.modules: print name\n')
+		self.assertEqual(loaded.split(), [])
+	def test_lazy_submodule(self):
+		out = run_python('import bifrost\n'
+		                 'print bifrost.units.convert_units(1, "ms", "s")')
+		self.assertAlmostEqual(float(out), 1e-3)
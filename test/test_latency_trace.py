@@ -0,0 +1,113 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for bifrost.latency_trace"""
+
+import unittest
+import json
+from bifrost.latency_trace import LatencyTrace, latency_stats
+
+class FakeRing(object):
+	def __init__(self, name):
+		self.name = name
+
+class FakeSpan(object):
+	def __init__(self, ring, frame_offset, nframe, frame_nbyte=4):
+		self.ring = ring
+		self.frame_nbyte   = frame_nbyte
+		self._offset_bytes = frame_offset * frame_nbyte
+		self._size_bytes   = nframe * frame_nbyte
+
+class FakeBlock(object):
+	def __init__(self, name, irings, orings):
+		self.name   = name
+		self.irings = irings
+		self.orings = orings
+
+class LatencyTraceTest(unittest.TestCase):
+	def setUp(self):
+		self.ring_a = FakeRing('a')
+		self.ring_b = FakeRing('b')
+		blocks = [FakeBlock('source', [], [self.ring_a]),
+		          FakeBlock('transform', [self.ring_a], [self.ring_b]),
+		          FakeBlock('sink', [self.ring_b], [])]
+		self.trace = LatencyTrace(blocks)
+	def record(self, name, t_end, ispans, ospans, onframes=None):
+		if onframes is None:
+			onframes = [span._size_bytes // span.frame_nbyte
+			            for span in ospans]
+		self.trace.record_gulp(name, t_end, 0.01, 0.01, 0.01,
+		                       ispans, [0]*len(ispans),
+		                       ospans, [0]*len(ospans), onframes)
+	def test_latencies(self):
+		a, b = self.ring_a, self.ring_b
+		# The source writes two gulps of 10 frames
+		self.record('source', 1.0, [], [FakeSpan(a, 0, 10)])
+		self.record('source', 2.0, [], [FakeSpan(a, 10, 10)])
+		# The transform reads both gulps at once
+		self.record('transform', 2.5, [FakeSpan(a, 0, 20)],
+		                              [FakeSpan(b, 0, 20)])
+		# The sink reads the output in two halves
+		self.record('sink', 3.0, [FakeSpan(b, 0, 10)],  [])
+		self.record('sink', 4.0, [FakeSpan(b, 10, 10)], [])
+		latencies = self.trace.latencies()
+		self.assertEqual(latencies['source']['hop'], [])
+		self.assertAlmostEqual(latencies['transform']['hop'][0], 0.5)
+		self.assertEqual([round(x, 6) for x in latencies['sink']['hop']],
+		                 [0.5, 1.5])
+		# Data become available once the newest input frame is committed
+		self.assertEqual([round(x, 6) for x in latencies['sink']['end_to_end']],
+		                 [1.0, 2.0])
+		summary = self.trace.summary()
+		self.assertEqual(summary['end_to_end']['count'], 2)
+		self.assertAlmostEqual(summary['end_to_end']['max'], 2.0)
+		self.assertEqual(sum(summary['end_to_end']['histogram'][0]), 2)
+	def test_unmatched_input(self):
+		# Data written before tracing began have no known origin
+		self.record('sink', 1.0, [FakeSpan(self.ring_b, 0, 10)], [])
+		latencies = self.trace.latencies()
+		self.assertEqual(latencies['sink']['hop'], [])
+		self.assertEqual(latencies['sink']['end_to_end'], [])
+		self.assertEqual(self.trace.summary()['end_to_end'], {'count': 0})
+	def test_chrome_trace(self):
+		a = self.ring_a
+		self.record('source', 1.0, [], [FakeSpan(a, 0, 10)])
+		self.record('transform', 1.5, [FakeSpan(a, 0, 10)],
+		                              [FakeSpan(self.ring_b, 0, 10)])
+		trace = json.loads(json.dumps(self.trace.chrome_trace()))
+		events = trace['traceEvents']
+		gulps = [e for e in events if e['ph'] == 'X']
+		self.assertEqual(len(gulps), 6)
+		self.assertTrue(all([e['ts'] >= 0 and e['dur'] >= 0 for e in gulps]))
+		flows = [e for e in events if e.get('cat') == 'flow']
+		self.assertEqual(sorted([e['ph'] for e in flows]), ['s', 't'])
+	def test_latency_stats(self):
+		stats = latency_stats([0.001]*99 + [0.1])
+		self.assertEqual(stats['count'], 100)
+		self.assertAlmostEqual(stats['p50'], 0.001)
+		self.assertAlmostEqual(stats['max'], 0.1)
@@ -0,0 +1,67 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+import ctypes
+from bifrost.libbifrost import _bf, _check, _get, _StaticLibrary
+from bifrost.libbifrost import _load_bifrost_lib
+
+try:
+	from bifrost import libbifrost_generated
+	HAVE_STATIC_BINDINGS = True
+except ImportError:
+	HAVE_STATIC_BINDINGS = False
+
+class LibBifrostTest(unittest.TestCase):
+	@unittest.skipUnless(HAVE_STATIC_BINDINGS,
+	                     "Bindings were not generated by the build")
+	def test_static_bindings(self):
+		# The build generates static bindings (generate_bindings.py)
+		self.assertIsInstance(_bf, _StaticLibrary)
+		self.assertEqual(_bf.RingSpanAcquireInfo.func.restype, ctypes.c_int)
+	def test_pyclibrary_bindings(self):
+		# Without static bindings, the headers are parsed at runtime instead
+		try:
+			import pyclibrary
+		except ImportError:
+			self.skipTest("pyclibrary is not installed")
+		lib = _load_bifrost_lib()
+		ring = _get(lib.RingCreate(space=lib.BF_SPACE_SYSTEM), retarg=0)
+		self.assertEqual(_get(lib.RingGetSpace(ring)), lib.BF_SPACE_SYSTEM)
+		_check(lib.RingDestroy(ring))
+		status_str, _ = lib.GetStatusString(lib.BF_STATUS_WOULD_BLOCK)
+		self.assertEqual(status_str, 'BF_STATUS_WOULD_BLOCK')
+	def test_output_args(self):
+		ring = _get(_bf.RingCreate(space=_bf.BF_SPACE_SYSTEM), retarg=0)
+		self.assertEqual(_get(_bf.RingGetSpace(ring)), _bf.BF_SPACE_SYSTEM)
+		stats = _get(_bf.RingGetStats(ring))
+		self.assertEqual(stats.capacity, 0)
+		_check(_bf.RingDestroy(ring))
+	def test_status_string(self):
+		status_str, _ = _bf.GetStatusString(_bf.BF_STATUS_WOULD_BLOCK)
+		self.assertEqual(status_str, 'BF_STATUS_WOULD_BLOCK')
@@ -45,6 +45,12 @@ class NDArrayTest(unittest.TestCase):
 		c = bf.ndarray(self.known_vals, dtype='f32')
 		c = c.copy(space='cuda').copy(space='cuda_host').copy(space='system')
 		np.testing.assert_equal(c, self.known_array)
+	def test_raw_malloc_placed(self):
+		ptr = bf.memory.raw_malloc(1 << 20, 'system',
+		                           hugepages='transparent', prefault=True)
+		bf.memory.raw_free(ptr, 'system')
+		self.assertRaises(ValueError, bf.memory.raw_malloc, 4096, 'system',
+		                  hugepages='huge')
 	def test_view(self):
 		d = bf.ndarray(self.known_vals, dtype='f32')
 		d = d.view(dtype='cf32')
@@ -27,10 +27,15 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import unittest
+import os
+import multiprocessing
+import shutil
+import tempfile
 import numpy as np
 import bifrost as bf
 
 import bifrost.pipeline as bfp
+from bifrost.ring2 import Ring
 from bifrost.sigproc_block   import read_sigproc
 from bifrost.copy_block      import copy, CopyBlock
 from bifrost.transpose_block import transpose
@@ -50,6 +55,27 @@ class CallbackBlock(CopyBlock):
 		self.data_callback(ispan, ospan)
 		return super(CallbackBlock, self).on_data(ispan, ospan)
 
+class OverlapCopyBlock(CopyBlock):
+	"""Reads gulps that overlap by one frame (as FdmtBlock does) and copies
+	all but the last frame of each"""
+	def on_sequence(self, iseq):
+		gulp_nframe = iseq.header['gulp_nframe']
+		ohdr = super(OverlapCopyBlock, self).on_sequence(iseq)
+		return ohdr, slice(0, gulp_nframe + 1, gulp_nframe)
+	def define_output_nframes(self, input_nframe):
+		return input_nframe - 1
+	def on_data(self, ispan, ospan):
+		ospan.data[...] = ispan.data[:ospan.nframe]
+
+class GatherBlock(bfp.SinkBlock):
+	def __init__(self, iring, *args, **kwargs):
+		super(GatherBlock, self).__init__(iring, *args, **kwargs)
+		self.gulps = []
+	def on_sequence(self, iseq):
+		pass
+	def on_data(self, ispan):
+		self.gulps.append(np.array(ispan.data, copy=True))
+
 class PipelineTest(unittest.TestCase):
 	def setUp(self):
 		self.fil_file = "./data/2chan4bitNoDM.fil"
@@ -76,6 +102,263 @@ class PipelineTest(unittest.TestCase):
 			data = read_sigproc([self.fil_file], gulp_nframe)
 			data = copy(data)
 			pipeline.run()
+	def test_stats(self):
+		gulp_nframe = 101
+		with bfp.Pipeline() as pipeline:
+			src  = read_sigproc([self.fil_file], gulp_nframe)
+			data = copy(src)
+			pipeline.run()
+		stats = pipeline.stats()
+		src_stats  = stats[src.name]
+		copy_stats = stats[data.name]
+		self.assertEqual(src_stats['nsequence'],  1)
+		self.assertEqual(copy_stats['nsequence'], 1)
+		self.assertGreater(copy_stats['ngulp'], 0)
+		self.assertEqual(copy_stats['nframe_in'], src_stats['nframe_out'])
+		self.assertEqual(copy_stats['nframe_in'], copy_stats['nframe_out'])
+		# Frames are 1 pol x 2 chans x 8 bits
+		self.assertEqual(copy_stats['nbyte_in'], copy_stats['nframe_in']*2)
+		self.assertEqual(copy_stats['sequence_nframe_in'],
+		                 copy_stats['nframe_in'])
+		self.assertGreater(copy_stats['process_time'], 0)
+	def test_latency_trace(self):
+		gulp_nframe = 101
+		with bfp.Pipeline() as pipeline:
+			src  = read_sigproc([self.fil_file], gulp_nframe)
+			data = copy(src)
+			data = copy(data)
+			pipeline.run(trace=True)
+		summary = pipeline.latency_trace.summary()
+		ngulp = pipeline.stats()[data.name]['ngulp']
+		self.assertEqual(summary['blocks'][data.name]['hop']['count'], ngulp)
+		end_to_end = summary['end_to_end']
+		self.assertEqual(end_to_end['count'], ngulp)
+		self.assertLessEqual(end_to_end['p50'], end_to_end['p99'])
+		self.assertLessEqual(end_to_end['p99'], end_to_end['max'])
+		events = pipeline.latency_trace.chrome_trace()['traceEvents']
+		self.assertIn('process', [event['name'] for event in events])
+	def run_fusable_chain(self, fuse):
+		gulp_nframe = 101
+		with bfp.Pipeline() as pipeline:
+			data = read_sigproc([self.fil_file], gulp_nframe)
+			with bfp.block_scope(fuse=True):
+				data = copy(data)
+				intermediate = data.orings[0]
+				data = copy(data)
+				data = GatherBlock(data)
+			pipeline.run(fuse=fuse)
+		return pipeline, intermediate, data
+	def test_fused_chain(self):
+		pipeline, intermediate, gather = self.run_fusable_chain(fuse=True)
+		_, _, expected = self.run_fusable_chain(fuse=False)
+		self.assertGreater(len(gather.gulps), 0)
+		self.assertEqual(len(gather.gulps), len(expected.gulps))
+		for gulp, expected_gulp in zip(gather.gulps, expected.gulps):
+			np.testing.assert_equal(gulp, expected_gulp)
+		# The data should have bypassed the intermediate ring
+		self.assertEqual(intermediate.stats['nbyte_committed'], 0)
+		stats = pipeline.stats()
+		self.assertEqual(stats[gather.name]['nframe_in'],
+		                 sum([len(gulp) for gulp in gather.gulps]))
+	def run_chain_with_input_slice(self, fuse):
+		with bfp.Pipeline() as pipeline:
+			data = read_sigproc([self.fil_file], 101)
+			with bfp.block_scope(fuse=True):
+				data = copy(data)
+				data = OverlapCopyBlock(data)
+				data = copy(data)
+				data = GatherBlock(data)
+			pipeline.run(fuse=fuse)
+		return data
+	def test_fused_chain_input_slice(self):
+		# The chain is cut short before the block that specifies an input
+		#   slice, which is then run separately
+		gather   = self.run_chain_with_input_slice(fuse=True)
+		expected = self.run_chain_with_input_slice(fuse=False)
+		self.assertGreater(len(gather.gulps), 0)
+		self.assertEqual(len(gather.gulps), len(expected.gulps))
+		for gulp, expected_gulp in zip(gather.gulps, expected.gulps):
+			np.testing.assert_equal(gulp, expected_gulp)
+	def test_plan_fused_buffers(self):
+		with bfp.Pipeline() as pipeline:
+			src = read_sigproc([self.fil_file], 101)
+			with bfp.block_scope(fuse=True):
+				data = copy(src)
+				data = copy(data)
+				data = copy(data)
+			plan = pipeline.plan_buffers()
+		# The rings between the fused blocks are not allocated
+		self.assertEqual([entry['ring'] for entry in plan],
+		                 [src.orings[0].name, data.orings[0].name])
+	def test_no_data_lost(self):
+		# The downstream blocks may open their input rings only after the
+		#   source has begun writing, which must not cost them any data
+		for i in xrange(10):
+			with bfp.Pipeline() as pipeline:
+				src  = read_sigproc([self.fil_file], 101)
+				data = copy(src)
+				data = copy(data)
+				gather = GatherBlock(data)
+				pipeline.run()
+			nbyte_out = pipeline.stats()[src.name]['nbyte_out']
+			self.assertGreater(nbyte_out, 0)
+			self.assertEqual(sum([gulp.nbytes for gulp in gather.gulps]),
+			                 nbyte_out)
+	def test_missing_core(self):
+		# A block given a core that this machine does not have fails only
+		#   when it runs, without holding up the rest of the pipeline
+		with bfp.Pipeline() as pipeline:
+			src  = read_sigproc([self.fil_file], 101)
+			data = copy(src, core=multiprocessing.cpu_count())
+			pipeline.run()
+		stats = pipeline.stats()
+		self.assertGreater(stats[src.name]['nframe_out'], 0)
+		self.assertEqual(stats[data.name]['ngulp'], 0)
+	def test_process_mode(self):
+		gulp_nframe = 101
+		with bfp.Pipeline() as pipeline:
+			# Note: Only system-space rings may connect processes, so the
+			#         source (whose ring may be in cuda_host space) shares
+			#         a process with the first copy
+			src  = read_sigproc([self.fil_file], gulp_nframe, core=0)
+			data = copy(src, space='system', core=0)
+			data = copy(data)
+			pipeline.run(mode='process', trace=True)
+		# The stats are published via shared memory by the child processes
+		stats = pipeline.stats()
+		self.assertGreater(stats[src.name]['nframe_out'], 0)
+		self.assertEqual(stats[data.name]['nframe_in'],
+		                 stats[src.name]['nframe_out'])
+		summary = pipeline.latency_trace.summary()
+		self.assertEqual(summary['end_to_end']['count'],
+		                 stats[data.name]['ngulp'])
+	def test_process_mode_ring_options(self):
+		with bfp.Pipeline() as pipeline:
+			src  = read_sigproc([self.fil_file], 101, core=0)
+			data = copy(src, space='system', core=0)
+			ring = Ring(owner=data, prefault=True, numa_node=0)
+			data.orings = [ring]
+			gather = GatherBlock(data)
+			shared_rings = pipeline._share_rings(pipeline._process_groups())
+		# The ring between the processes is replaced with a shared ring with
+		#   the same options
+		shared_ring = gather.irings[0]
+		self.assertEqual(shared_rings, [(ring, shared_ring)])
+		self.assertIs(data.orings[0], shared_ring)
+		self.assertTrue(shared_ring.shared)
+		self.assertEqual(shared_ring.alloc_options, {'hugepages': None,
+		                                             'prefault':  True,
+		                                             'mlock':     False,
+		                                             'numa_node': 0})
+		pipeline._unshare_rings(shared_rings)
+		self.assertIs(data.orings[0], ring)
+		self.assertIs(gather.irings[0], ring)
+	def test_process_mode_shared_memory(self):
+		shm_dir = '/dev/shm'
+		if not os.path.isdir(shm_dir):
+			self.skipTest("No %s" % shm_dir)
+		def ring_segments():
+			return set([filename for filename in os.listdir(shm_dir)
+			            if filename.startswith('bifrost_ring_')])
+		segments = ring_segments()
+		with bfp.Pipeline() as pipeline:
+			data = read_sigproc([self.fil_file], 101, core=0)
+			data = copy(data, space='system', core=0)
+			data = copy(data)
+			pipeline.run(mode='process')
+		# The shared rings (and their memory) are destroyed after the run
+		self.assertEqual(ring_segments() - segments, set())
+	def run_gathered_copy(self, **kwargs):
+		with bfp.Pipeline() as pipeline:
+			data = read_sigproc([self.fil_file], 100)
+			data = copy(data)
+			data = GatherBlock(data)
+			pipeline.run(**kwargs)
+		return pipeline, data
+	def test_autotune(self):
+		from bifrost.gulp_tuner import DEFAULT_SCALES
+		tmpdir = tempfile.mkdtemp()
+		try:
+			config_file = os.path.join(tmpdir, 'gulps.json')
+			pipeline, gather = self.run_gathered_copy(autotune=True,
+			                                          gulp_config=config_file)
+			_, expected = self.run_gathered_copy()
+			np.testing.assert_equal(np.concatenate(gather.gulps),
+			                        np.concatenate(expected.gulps))
+			copy_name = pipeline.blocks[1].name
+			scale = pipeline.tuned_gulps[copy_name]['gulp_scale']
+			self.assertIn(scale, DEFAULT_SCALES)
+			# The tuned gulps should be reused by later runs
+			pipeline, gather = self.run_gathered_copy(gulp_config=config_file)
+			self.assertEqual(pipeline.gulp_scales[copy_name], scale)
+			np.testing.assert_equal(np.concatenate(gather.gulps),
+			                        np.concatenate(expected.gulps))
+		finally:
+			shutil.rmtree(tmpdir)
+	def test_process_mode_error(self):
+		def fail(ispan, ospan):
+			raise ValueError("Deliberate failure")
+		with bfp.Pipeline() as pipeline:
+			data = read_sigproc([self.fil_file], 101, core=0)
+			data = copy(data, space='system', core=0)
+			data = CallbackBlock(data, lambda seq: None, fail)
+			with self.assertRaises(RuntimeError):
+				pipeline.run(mode='process')
+	def test_plan_placement(self):
+		from bifrost.placement import CpuTopology
+		ncpu = multiprocessing.cpu_count()
+		if ncpu < 3:
+			self.skipTest("Needs at least 3 cores")
+		# 1 socket x ncpu cores, without hyperthreads
+		topology = CpuTopology([(cpu, 0, cpu, None) for cpu in xrange(ncpu)])
+		core = ncpu - 1
+		with bfp.Pipeline() as pipeline:
+			src  = read_sigproc([self.fil_file], 101)
+			data = copy(src, core=core)
+			data = copy(data)
+			plan = pipeline.plan_placement(topology, verbose=False)
+			self.assertEqual(plan[data.name]['fixed'], False)
+			self.assertEqual(pipeline.blocks[1].core, core)
+			cores = [block.core for block in pipeline.blocks]
+			self.assertEqual(len(set(cores)), 3)
+	def test_plan_buffers(self):
+		gulp_nframe = 101
+		names = []
+		with bfp.Pipeline() as pipeline:
+			data = read_sigproc([self.fil_file], gulp_nframe)
+			data = copy(data, buffer_factor=4)
+			data = CallbackBlock(data, lambda seq: names.append(seq.name),
+			                     lambda ispan, ospan: None)
+			rings = [block.orings[0] for block in pipeline.blocks]
+			plan = pipeline.plan_buffers()
+			# The stand-in sequences have the name of the real ones
+			self.assertEqual(names, [self.fil_file])
+			self.assertEqual([entry['ring'] for entry in plan],
+			                 [ring.name for ring in rings])
+			# Frames are 1 pol x 2 chans x 8 bits; each ring holds the
+			#   larger of its writer's gulp and its reader's buffer
+			self.assertEqual([entry['contiguous_bytes'] for entry in plan],
+			                 [gulp_nframe*2]*3)
+			self.assertEqual([entry['total_bytes'] for entry in plan],
+			                 [4*gulp_nframe*2, 3*gulp_nframe*2, gulp_nframe*2])
+			capacities = [ring.stats['capacity'] for ring in rings]
+			pipeline.run(plan_buffers=True)
+			# The rings should not have been reallocated at runtime
+			self.assertEqual([ring.stats['capacity'] for ring in rings],
+			                 capacities)
+	def test_run_without_planning(self):
+		sourcenames = []
+		with bfp.Pipeline() as pipeline:
+			src = read_sigproc([self.fil_file], 101)
+			create_reader = src.create_reader
+			def counting_create_reader(sourcename):
+				sourcenames.append(sourcename)
+				return create_reader(sourcename)
+			src.create_reader = counting_create_reader
+			copy(src)
+			pipeline.run()
+		# Buffers are only planned on request, as planning opens the source
+		self.assertEqual(sourcenames, [self.fil_file])
 	def test_cuda_copy(self):
 		gulp_nframe = 101
 		with bfp.Pipeline() as pipeline:
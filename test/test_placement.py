@@ -0,0 +1,127 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for bifrost.placement"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from bifrost.placement import (parse_cpu_list, read_cpu_topology,
+                               plan_placement, CpuTopology)
+
+def make_sysfs(root, nsocket, ncore, nthread):
+	"""Creates a fake sysfs with CPUs numbered like Linux does (all first
+	hyperthreads, then all second hyperthreads, etc.)"""
+	cpu_dir = os.path.join(root, 'devices/system/cpu')
+	ncpu = nsocket * ncore * nthread
+	os.makedirs(cpu_dir)
+	with open(os.path.join(cpu_dir, 'online'), 'w') as f:
+		f.write('0-%i\n' % (ncpu - 1))
+	node_cpus = [[] for _ in xrange(nsocket)]
+	for cpu in xrange(ncpu):
+		socket  = (cpu // ncore) % nsocket
+		core_id = cpu % ncore
+		node_cpus[socket].append(cpu)
+		topo_dir = os.path.join(cpu_dir, 'cpu%i' % cpu, 'topology')
+		os.makedirs(topo_dir)
+		with open(os.path.join(topo_dir, 'physical_package_id'), 'w') as f:
+			f.write('%i\n' % socket)
+		with open(os.path.join(topo_dir, 'core_id'), 'w') as f:
+			f.write('%i\n' % core_id)
+	for node, cpus in enumerate(node_cpus):
+		node_dir = os.path.join(root, 'devices/system/node/node%i' % node)
+		os.makedirs(node_dir)
+		with open(os.path.join(node_dir, 'cpulist'), 'w') as f:
+			f.write(','.join([str(cpu) for cpu in cpus]) + '\n')
+
+class PlacementTest(unittest.TestCase):
+	def setUp(self):
+		self.sysfs = tempfile.mkdtemp()
+		# 2 sockets x 4 cores x 2 hyperthreads
+		make_sysfs(self.sysfs, 2, 4, 2)
+		self.topology = read_cpu_topology(self.sysfs, allowed_cpus=range(16))
+	def tearDown(self):
+		shutil.rmtree(self.sysfs)
+	def test_parse_cpu_list(self):
+		self.assertEqual(parse_cpu_list('0-3,8,10-11\n'), [0,1,2,3,8,10,11])
+	def test_read_topology(self):
+		topology = self.topology
+		self.assertEqual(topology.sockets(), [0, 1])
+		self.assertEqual(topology.cores(0), [[0, 8], [1, 9], [2, 10], [3, 11]])
+		self.assertEqual(topology.siblings(12), [4, 12])
+		self.assertEqual(topology.numa_node(13), 1)
+		self.assertEqual(topology.nnuma_node, 2)
+		topology = read_cpu_topology(self.sysfs, allowed_cpus=[4, 5, 12])
+		self.assertEqual(topology.sockets(), [1])
+		self.assertEqual(topology.cores(1), [[4, 12], [5]])
+	def test_connected_blocks_share_socket(self):
+		names = ['a0', 'a1', 'a2', 'b0', 'b1', 'b2']
+		edges = [('a0', 'a1'), ('a1', 'a2'), ('b0', 'b1'), ('b1', 'b2')]
+		plan = plan_placement(names, edges, self.topology)
+		self.assertEqual(len(set([plan[n]['socket'] for n in names[:3]])), 1)
+		self.assertEqual(len(set([plan[n]['socket'] for n in names[3:]])), 1)
+		self.assertNotEqual(plan['a0']['socket'], plan['b0']['socket'])
+		# Hot blocks get whole physical cores
+		physical_cores = [tuple(self.topology.siblings(plan[n]['core']))
+		                  for n in names]
+		self.assertEqual(len(set(physical_cores)), len(names))
+	def test_cold_blocks_share_physical_cores(self):
+		names = ['src', 'hot', 'cold0', 'cold1']
+		edges = [('src', 'hot'), ('hot', 'cold0'), ('cold0', 'cold1')]
+		plan = plan_placement(names, edges, self.topology,
+		                      hot=['src', 'hot'])
+		self.assertEqual(sorted([plan['cold0']['core'], plan['cold1']['core']]),
+		                 sorted(self.topology.siblings(plan['cold0']['core'])))
+		for name in ['src', 'hot']:
+			siblings = self.topology.siblings(plan[name]['core'])
+			others = [plan[n]['core'] for n in names if n != name]
+			self.assertFalse(any([cpu in others for cpu in siblings]))
+	def test_fixed_and_openmp(self):
+		names = ['src', 'omp']
+		plan = plan_placement(names, [('src', 'omp')], self.topology,
+		                      fixed={'src': 5}, openmp=['omp'])
+		self.assertEqual(plan['src']['core'], 5)
+		self.assertTrue(plan['src']['fixed'])
+		# The OpenMP block joins the fixed block's socket and gets its
+		#   remaining physical cores
+		self.assertEqual(plan['omp']['socket'], 1)
+		openmp_cores = plan['omp']['openmp_cores']
+		self.assertEqual(openmp_cores[0], plan['omp']['core'])
+		self.assertEqual(len(openmp_cores), 3)
+		self.assertTrue(all([self.topology.socket(cpu) == 1
+		                     for cpu in openmp_cores]))
+		self.assertNotIn(5, openmp_cores)
+	def test_oversubscribed(self):
+		topology = CpuTopology([(0, 0, 0, None), (1, 0, 1, None)])
+		names = ['b%i' % i for i in xrange(5)]
+		edges = zip(names[:-1], names[1:])
+		plan = plan_placement(names, edges, topology)
+		cores = [plan[name]['core'] for name in names]
+		self.assertEqual(sorted(set(cores)), [0, 1])
+		self.assertLessEqual(abs(cores.count(0) - cores.count(1)), 1)
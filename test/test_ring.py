@@ -0,0 +1,417 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+
+import unittest
+import numpy as np
+import os
+import json
+import tempfile
+import threading
+import subprocess
+import sys
+import bifrost as bf
+from bifrost.ring2 import Ring, WouldBlock
+
+def make_header(name, nframe_per_gulp, time_tag=0):
+	return {'name':        name,
+	        'time_tag':    time_tag,
+	        'gulp_nframe': nframe_per_gulp,
+	        '_tensor':     {'dtype': 'u8',
+	                        'shape': [-1, 4]}}
+
+def ramp(nframe):
+	return (np.arange(nframe*4) % 256).astype(np.uint8).reshape(nframe, 4)
+
+def write_ramp(ring, name, nframe, gulp_nframe, buf_nframe=None,
+               wait_event=None):
+	if buf_nframe is None:
+		buf_nframe = nframe
+	with ring.begin_writing() as oring:
+		header = make_header(name, gulp_nframe)
+		with oring.begin_sequence(header, buf_nframe) as oseq:
+			if wait_event is not None:
+				wait_event.wait()
+			for frame0 in xrange(0, nframe, gulp_nframe):
+				with oseq.reserve(gulp_nframe) as ospan:
+					ospan.data[...] = ramp(frame0+gulp_nframe)[frame0:]
+
+def read_all(ring, gulp_nframe):
+	frames = []
+	for iseq in ring.read(guarantee=True):
+		for ispan in iseq.read(gulp_nframe):
+			if ispan.nframe == 0:
+				break
+			frames.append(np.array(ispan.data))
+	return np.concatenate(frames)
+
+class RingTest(unittest.TestCase):
+	def run_wrapping(self, ring, nframe=4200, gulp_nframe=300,
+	                 buf_nframe=600, read_nframe=250):
+		"""Streams data through a small ring so that spans frequently
+		cross the end of the buffer"""
+		opened = threading.Event()
+		writer = threading.Thread(target=write_ramp,
+		                          args=(ring, 'seq0', nframe, gulp_nframe,
+		                                buf_nframe, opened))
+		writer.start()
+		frames = []
+		with ring.open_earliest_sequence(guarantee=True) as iseq:
+			opened.set()
+			for ispan in iseq.read(read_nframe):
+				frames.append(np.array(ispan.data))
+				if ispan.nframe < read_nframe:
+					break
+		writer.join()
+		np.testing.assert_equal(np.concatenate(frames), ramp(nframe))
+	def test_wrapping_mirrored(self):
+		ring = Ring()
+		self.run_wrapping(ring)
+		self.assertTrue(ring.mirrored)
+	def test_wrapping_ghosted(self):
+		ring = Ring(mirrored=False)
+		self.run_wrapping(ring)
+		self.assertFalse(ring.mirrored)
+	def test_wrapping_spin(self):
+		ring = Ring(wait_policy='spin', spin_count=1000)
+		self.assertEqual(ring.wait_policy, ('spin', 1000))
+		self.run_wrapping(ring)
+	def test_wrapping_poll(self):
+		ring = Ring(wait_policy='poll')
+		self.assertEqual(ring.wait_policy[0], 'poll')
+		self.run_wrapping(ring)
+	def test_poll_timeout(self):
+		ring = Ring(wait_policy='poll')
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 16), 64) as oseq:
+				with ring.open_earliest_sequence(guarantee=True) as iseq:
+					self.assertRaises(WouldBlock, iseq.acquire, 0, 16, 0.01)
+	def test_wrapping_spsc(self):
+		ring = Ring(spsc=True)
+		self.assertTrue(ring.spsc)
+		self.run_wrapping(ring)
+		self.assertEqual(ring.stats['nbyte_committed'], 4200*4)
+	def test_wrapping_spsc_ghosted(self):
+		# Non-mirrored rings always take the locked path
+		ring = Ring(spsc=True, mirrored=False)
+		self.run_wrapping(ring)
+	def test_spsc_single_reader(self):
+		ring = Ring(spsc=True)
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 16), 64) as oseq:
+				with ring.open_earliest_sequence(guarantee=True) as iseq:
+					self.assertRaises(RuntimeError,
+					                  ring.open_earliest_sequence)
+	def test_wrapping_placed(self):
+		ring = Ring(hugepages='transparent', prefault=True)
+		self.run_wrapping(ring)
+	def test_wrapping_placed_ghosted(self):
+		ring = Ring(mirrored=False, hugepages='transparent', prefault=True,
+		            numa_node=bf.affinity.get_numa_node(0))
+		self.run_wrapping(ring)
+	def test_alloc_options(self):
+		ring = Ring(hugepages='transparent', prefault=True, numa_node=0)
+		self.assertEqual(ring.alloc_options, {'hugepages': 'transparent',
+		                                      'prefault':  True,
+		                                      'mlock':     False,
+		                                      'numa_node': 0})
+		self.assertEqual(Ring().alloc_options, {'hugepages': None,
+		                                        'prefault':  False,
+		                                        'mlock':     False,
+		                                        'numa_node': None})
+	def test_stats(self):
+		ring = Ring()
+		self.run_wrapping(ring)
+		stats = ring.stats
+		self.assertEqual(stats['nbyte_committed'], 4200*4)
+		self.assertEqual(stats['head'], 4200*4)
+		self.assertEqual(stats['nbyte_overwritten'], 0)
+		self.assertEqual(stats['nguarantee'], 0)
+		self.assertEqual(stats['nbyte_copied_to_ghost'], 0)
+		for name in ['read', 'write', 'write_close', 'realloc']:
+			self.assertGreaterEqual(stats['waits'][name]['count'], 0)
+			self.assertGreaterEqual(stats['waits'][name]['time'], 0)
+	def test_snapshot(self):
+		ring = Ring()
+		write_ramp(ring, 'seq0', 64, 16)
+		filename = os.path.join(tempfile.mkdtemp(), 'snapshot.dat')
+		snapshot = ring.snapshot(filename, 10, 40, time_tags_per_frame=1)
+		snapshot.wait()
+		self.assertEqual(snapshot.info['nframe'], 30)
+		self.assertTrue(snapshot.info['finished'])
+		snapshot.close()
+		with open(filename, 'rb') as f:
+			data = np.fromstring(f.read(), dtype=np.uint8).reshape(-1, 4)
+		np.testing.assert_equal(data, ramp(64)[10:40])
+		with open(filename + '.json') as f:
+			self.assertEqual(json.load(f)['time_tag'], 10)
+		os.remove(filename)
+		os.remove(filename + '.json')
+	def test_open_sequence_at_time(self):
+		ring = Ring()
+		with ring.begin_writing() as oring:
+			for i in xrange(3):
+				header = make_header('seq%i' % i, 16, time_tag=i)
+				header['_tensor']['scales'] = [[10.*i, 0.1], None]
+				header['_tensor']['units']  = ['s', None]
+				with oring.begin_sequence(header, 64) as oseq:
+					with oseq.reserve(16) as ospan:
+						ospan.data[...] = ramp(16)
+		with ring.open_sequence_at_time(10.35) as iseq:
+			self.assertEqual(iseq.name, 'seq1')
+			self.assertEqual(iseq.frame_offset_at_time(10.35), 3)
+			ispans = iseq.read(4)
+			ispan = next(ispans)
+			np.testing.assert_equal(np.array(ispan.data), ramp(16)[3:7])
+			ispans.close()
+		self.assertRaises(RuntimeError, ring.open_sequence_at_time, -1.)
+	def test_stats_guarantee_lag(self):
+		ring = Ring()
+		write_ramp(ring, 'seq0', 64, 16)
+		with ring.open_earliest_sequence(guarantee=True) as iseq:
+			with iseq.acquire(0, 16) as ispan:
+				pass
+			stats = ring.stats
+			self.assertEqual(stats['nguarantee'], 1)
+			self.assertEqual(stats['guarantee_lags'], [(64-16)*4])
+	def test_acquire_timeout(self):
+		ring = Ring()
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 16), 64) as oseq:
+				with ring.open_earliest_sequence(guarantee=True) as iseq:
+					# Nothing has been written yet
+					self.assertRaises(WouldBlock, iseq.acquire, 0, 16, 0)
+					self.assertRaises(WouldBlock, iseq.acquire, 0, 16, 0.01)
+					with oseq.reserve(16) as ospan:
+						ospan.data[...] = ramp(16)
+					with iseq.acquire(0, 16, timeout=0) as ispan:
+						np.testing.assert_equal(np.array(ispan.data), ramp(16))
+	def test_reserve_timeout(self):
+		ring = Ring()
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 1024), 1024) as oseq:
+				with ring.open_earliest_sequence(guarantee=True) as iseq:
+					with oseq.reserve(1024, timeout=0):
+						pass
+					# The guaranteed reader has not read anything yet, so
+					#   the ring is full.
+					self.assertRaises(WouldBlock, oseq.reserve, 1024, 0)
+					self.assertRaises(WouldBlock, oseq.reserve, 1024, 0.01)
+					with iseq.acquire(0, 1024):
+						pass
+					with oseq.reserve(1024, timeout=0):
+						pass
+	def test_expect_readers(self):
+		ring = Ring()
+		ring.expect_readers(1)
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 1024), 1024) as oseq:
+				with oseq.reserve(1024, timeout=0) as ospan:
+					ospan.data[...] = 1
+				# The expected reader has not opened the sequence yet, so
+				#   the ring is full.
+				self.assertRaises(WouldBlock, oseq.reserve, 1024, 0)
+				self.assertEqual(ring.stats['nguarantee'], 1)
+				with ring.open_earliest_sequence(guarantee=True) as iseq:
+					# The reader's own guarantee replaces the one held for it
+					self.assertEqual(ring.stats['nguarantee'], 1)
+					with iseq.acquire(0, 1024) as ispan:
+						np.testing.assert_equal(np.array(ispan.data), 1)
+					with oseq.reserve(1024, timeout=0):
+						pass
+				self.assertEqual(ring.stats['nguarantee'], 0)
+		self.assertRaises(RuntimeError, ring.expect_readers, 1)
+	def test_cancel_expected_reader(self):
+		ring = Ring()
+		ring.expect_readers(2)
+		ring.cancel_expected_reader()
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 1024), 1024) as oseq:
+				self.assertEqual(ring.stats['nguarantee'], 1)
+				ring.cancel_expected_reader()
+				# Neither reader is waited for now
+				self.assertEqual(ring.stats['nguarantee'], 0)
+				for i in xrange(2):
+					with oseq.reserve(1024, timeout=0):
+						pass
+	def test_header_formats(self):
+		for header_format in ['binary', 'json']:
+			ring = Ring()
+			header = make_header('seq0', 16)
+			with ring.begin_writing() as oring:
+				with oring.begin_sequence(header, 64, header_format) as oseq:
+					with oseq.reserve(16) as ospan:
+						ospan.data[...] = ramp(16)
+			with ring.open_earliest_sequence(guarantee=True) as iseq:
+				self.assertEqual(iseq.tensor['frame_shape'], [4])
+				self.assertEqual(iseq.header, header)
+	def test_span_views_reused(self):
+		ring = Ring()
+		views = {}
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 16), 32) as oseq:
+				for i in xrange(256):
+					with oseq.reserve(16) as ospan:
+						self.assertEqual(ospan.frame_offset, i*16)
+						self.assertEqual(ospan.shape, [16, 4])
+						self.assertIs(ospan.data, ospan.data)
+						ospan.data[...] = ramp(16)
+						views.setdefault(ospan._data_ptr, set()).add(id(ospan.data))
+		self.assertLess(len(views), 256)
+		for ids in views.values():
+			self.assertEqual(len(ids), 1)
+	def test_write_parallel(self):
+		from multiprocessing.pool import ThreadPool
+		pool = ThreadPool(4)
+		def fill(ospan):
+			frame0 = ospan.frame_offset
+			ospan.data[...] = ramp(frame0+ospan.nframe)[frame0:]
+			# Commit the 6th span short, which cancels the two after it
+			return ospan.nframe if frame0 != 80 else 8
+		ring = Ring()
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 16), 128) as oseq:
+				self.assertEqual(oseq.write_parallel(16, 4, fill, pool), 64)
+				self.assertEqual(oseq.write_parallel(16, 4, fill, pool), 24)
+		pool.close()
+		np.testing.assert_equal(read_all(ring, 8), ramp(88))
+	def test_write_parallel_invalid_fill(self):
+		from multiprocessing.pool import ThreadPool
+		pool = ThreadPool(4)
+		ring = Ring()
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 16), 128) as oseq:
+				for i, bad_nframe in enumerate([None, 17, -1, 1.5, True]):
+					# Only the first span of each call is filled validly
+					def fill(ospan):
+						ospan.data[...] = 1
+						if ospan.frame_offset == i*16:
+							return ospan.nframe
+						return bad_nframe
+					self.assertRaises(ValueError,
+					                  oseq.write_parallel, 16, 4, fill, pool)
+				def fill(ospan):
+					ospan.data[...] = 2
+					return ospan.nframe
+				self.assertEqual(oseq.write_parallel(16, 2, fill, pool), 32)
+		pool.close()
+		data = read_all(ring, 16)
+		self.assertEqual(len(data), 5*16+32)
+		np.testing.assert_equal(data[:5*16], 1)
+		np.testing.assert_equal(data[5*16:], 2)
+	def test_write_parallel_short_span_process(self):
+		# A span committed short in front of open spans aborts the process,
+		#   so this runs in a child to keep the test process alive
+		script = """
+from multiprocessing.pool import ThreadPool
+from bifrost.ring2 import Ring
+pool = ThreadPool(4)
+def fill(ospan):
+	return ospan.nframe if ospan.frame_offset != 16 else 1
+ring = Ring()
+with ring.begin_writing() as oring:
+	header = {'name': 'seq0', 'time_tag': 0, 'gulp_nframe': 16,
+	          '_tensor': {'dtype': 'u8', 'shape': [-1, 4]}}
+	with oring.begin_sequence(header, 64) as oseq:
+		assert oseq.write_parallel(16, 4, fill, pool) == 17
+pool.close()
+"""
+		proc = subprocess.Popen([sys.executable, '-c', script],
+		                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		out, err = proc.communicate()
+		self.assertEqual(proc.returncode, 0, err)
+	def test_overrun_drop(self):
+		ring = Ring()
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 1024), 1024) as oseq:
+				reader = ring.read(overrun='drop')
+				iseq = next(reader)
+				# The reader never holds up the writer
+				for i in xrange(3):
+					with oseq.reserve(1024, timeout=0) as ospan:
+						ospan.data[...] = i
+				ispans = iseq.read(1024)
+				ispan = next(ispans)
+				self.assertEqual(ispan.frame_offset, 2*1024)
+				np.testing.assert_equal(np.array(ispan.data), 2)
+				self.assertEqual(iseq.nbyte_skipped, 2*1024*4)
+				ispans.close()
+				reader.close()
+	def test_overrun_lag(self):
+		ring = Ring()
+		with ring.begin_writing() as oring:
+			with oring.begin_sequence(make_header('seq0', 256), 1024) as oseq:
+				reader = ring.read(overrun='lag', max_lag_nframe=512)
+				iseq = next(reader)
+				for i in xrange(8):
+					with oseq.reserve(256, timeout=0) as ospan:
+						ospan.data[...] = i
+				# The reader was kept within 512 frames of the writer
+				ispans = iseq.read(256)
+				ispan = next(ispans)
+				self.assertEqual(ispan.frame_offset, 6*256)
+				np.testing.assert_equal(np.array(ispan.data), 6)
+				self.assertEqual(iseq.nbyte_skipped, 6*256*4)
+				ispan = next(ispans)
+				self.assertEqual(ispan.frame_offset, 7*256)
+				ispans.close()
+				reader.close()
+	def test_full_ring_span(self):
+		# Mirrored rings allow spans of the whole ring size
+		ring = Ring()
+		self.run_wrapping(ring, nframe=4096, gulp_nframe=1024,
+		                  buf_nframe=1024, read_nframe=1024)
+
+class SharedRingTest(unittest.TestCase):
+	def test_attach(self):
+		ring = Ring(shared=True)
+		write_ramp(ring, 'seq0', 64, 16)
+		attached = Ring.attach(ring.name)
+		self.assertEqual(attached.space, 'system')
+		data = read_all(attached, 16)
+		self.assertEqual(data.shape, (64,4))
+		np.testing.assert_equal(data, ramp(64))
+	def test_fork(self):
+		ring = Ring(shared=True)
+		rfd, wfd = os.pipe()
+		pid = os.fork()
+		if pid == 0:
+			# Child process writes
+			os.close(rfd)
+			status = 1
+			try:
+				child_ring = Ring.attach(ring.name)
+				os.write(wfd, 'x')
+				write_ramp(child_ring, 'seq0', 64, 8)
+				status = 0
+			finally:
+				os._exit(status)
+		os.close(wfd)
+		os.read(rfd, 1)
+		data = read_all(ring, 8)
+		_, status = os.waitpid(pid, 0)
+		self.assertEqual(status, 0)
+		np.testing.assert_equal(data, ramp(64))
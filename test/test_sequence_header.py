@@ -0,0 +1,61 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+import ctypes
+from bifrost.sequence_header import encode_header, decode_header, decode_tensor
+
+def make_header():
+	return {'name':        'seq0',
+	        'time_tag':    123,
+	        'gulp_nframe': 16,
+	        '_tensor':     {'dtype':  'ci8',
+	                        'shape':  [2, -1, 4],
+	                        'labels': ['pol', 'time', 'freq'],
+	                        'scales': [None, [0.5, 1e-3], None],
+	                        'units':  [None, 's', None]}}
+
+def as_buffer(string):
+	# Mimics a header read in place from a ring
+	return (ctypes.c_byte*len(string)).from_buffer_copy(string)
+
+class SequenceHeaderTest(unittest.TestCase):
+	def test_binary(self):
+		hdr_buffer = as_buffer(encode_header(make_header()))
+		self.assertEqual(decode_tensor(hdr_buffer), ('ci8', [2, -1, 4]))
+		self.assertEqual(decode_header(hdr_buffer), make_header())
+	def test_json(self):
+		hdr_buffer = as_buffer(encode_header(make_header(), 'json'))
+		self.assertEqual(decode_tensor(hdr_buffer), None)
+		self.assertEqual(decode_header(hdr_buffer), make_header())
+	def test_no_tensor(self):
+		header = {'name': 'seq0', 'nbit': 8}
+		self.assertEqual(decode_tensor(encode_header(header)), None)
+		self.assertEqual(decode_header(encode_header(header)), header)
+	def test_invalid_format(self):
+		self.assertRaises(KeyError, encode_header, make_header(), 'xml')
@@ -0,0 +1,58 @@
+
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for bifrost.units"""
+
+import unittest
+import numpy as np
+from bifrost import units
+from bifrost.units import convert_units, convert_scale
+
+class UnitsTest(unittest.TestCase):
+	def test_direct_conversion(self):
+		self.assertAlmostEqual(convert_units(250., 'ms', 's'), 0.25)
+		self.assertAlmostEqual(convert_units(1.4, 'GHz', 'MHz'), 1400.)
+		self.assertEqual(convert_units(3., 'pc cm^-3', 'pc/cm^3'), 3.)
+	def test_factors_cached(self):
+		convert_units(1., 'us', 'ns')
+		self.assertIn(('us', 'ns'), units._conversion_factors)
+	def test_dimension_mismatch(self):
+		with self.assertRaises(ValueError):
+			convert_units(1., 's', 'MHz')
+	def test_array(self):
+		result = convert_units([1., 2., 3.], 'kHz', 'Hz')
+		np.testing.assert_allclose(result, [1e3, 2e3, 3e3])
+		result = convert_units(np.arange(4), 'ms', 'us')
+		np.testing.assert_allclose(result, [0., 1e3, 2e3, 3e3])
+	def test_scale(self):
+		f0, df = convert_scale([1400., -0.5], 'MHz', 'GHz')
+		self.assertAlmostEqual(f0, 1.4)
+		self.assertAlmostEqual(df, -0.0005)
+	def test_pint_fallback(self):
+		self.assertAlmostEqual(convert_units(2., 'minute', 's'), 120.)
+		self.assertAlmostEqual(convert_units(0., 'degC', 'kelvin'), 273.15)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Bifrost Authors. All rights reserved.
+# Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of The Bifrost Authors nor the names of its
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY
+# OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Shows live performance statistics for running Bifrost pipelines
+
+Usage: like_top.py [-d DELAY] [-n ITERATIONS] [-b]
+
+For each block of each pipeline on this machine, shows the rates at which
+it is consuming and producing data and the percentage of its time that is
+spent waiting for input (acquire), waiting for output space (reserve) and
+processing. A block that is mostly acquiring is starved by its upstream
+block; one that is mostly reserving is blocked by a downstream block.
+"""
+
+import sys
+import time
+import argparse
+from bifrost.block_stats import list_pipelines, STATS_DIR
+
+COLUMNS = [('BLOCK',     '%-24s'),
+           ('TYPE',      '%-20s'),
+           ('SEQ',       '%5s'),
+           ('GULPS',     '%9s'),
+           ('GULP/S',    '%8s'),
+           ('MB/S IN',   '%9s'),
+           ('MB/S OUT',  '%9s'),
+           ('%ACQ',      '%6s'),
+           ('%RES',      '%6s'),
+           ('%PROC',     '%6s'),
+           ('GULP MS',   '%9s')]
+
+def take_sample(stats_dir):
+	"""Returns {(pid, pipeline): [(block, stats), ...]}"""
+	sample = {}
+	for reader in list_pipelines(stats_dir):
+		try:
+			sample[(reader.pid, reader.pipeline)] = reader.read()
+		except (IOError, OSError, RuntimeError):
+			pass # Pipeline ended while reading
+	return sample
+
+def format_row(values):
+	return ' '.join([fmt % value for value, (_, fmt) in zip(values, COLUMNS)])
+
+def block_row(block, stats, prev_stats, dt):
+	def rate(name, scale=1.):
+		if prev_stats is None or dt <= 0:
+			return '-'
+		return '%.1f' % ((stats[name] - prev_stats[name]) / dt * scale)
+	def percent(name):
+		if prev_stats is None or dt <= 0:
+			return '-'
+		return '%.0f' % (min((stats[name] - prev_stats[name]) / dt, 1.) * 100)
+	gulp_time = (stats['last_acquire_time'] + stats['last_reserve_time'] +
+	             stats['last_process_time'])
+	return format_row([block['name'][:24], block['type'][:20],
+	                   stats['nsequence'], stats['ngulp'],
+	                   rate('ngulp'),
+	                   rate('nbyte_in',  1e-6),
+	                   rate('nbyte_out', 1e-6),
+	                   percent('acquire_time'),
+	                   percent('reserve_time'),
+	                   percent('process_time'),
+	                   '%.2f' % (gulp_time * 1e3)])
+
+def render(sample, prev_sample, dt):
+	lines = [time.strftime('%H:%M:%S') +
+	         ' - %i pipeline(s)' % len(sample), '']
+	for (pid, name), blocks in sorted(sample.items()):
+		prev_blocks = dict((block['name'], stats)
+		                   for block, stats in prev_sample.get((pid, name), []))
+		lines.append('Pipeline %s (pid %i)' % (name, pid))
+		lines.append(format_row([column for column, _ in COLUMNS]))
+		for block, stats in blocks:
+			lines.append(block_row(block, stats,
+			                       prev_blocks.get(block['name']), dt))
+		lines.append('')
+	return lines
+
+def run_batch(args):
+	prev_sample = take_sample(args.stats_dir)
+	prev_time   = time.time()
+	iteration = 0
+	while args.iterations is None or iteration < args.iterations:
+		time.sleep(args.delay)
+		sample   = take_sample(args.stats_dir)
+		cur_time = time.time()
+		print '\n'.join(render(sample, prev_sample, cur_time - prev_time))
+		sys.stdout.flush()
+		prev_sample, prev_time = sample, cur_time
+		iteration += 1
+
+def run_curses(screen, args):
+	import curses
+	curses.curs_set(0)
+	screen.timeout(int(args.delay * 1000))
+	prev_sample = take_sample(args.stats_dir)
+	prev_time   = time.time()
+	iteration = 0
+	while args.iterations is None or iteration < args.iterations:
+		key = screen.getch() # Also waits for the refresh delay
+		if key in (ord('q'), ord('Q')):
+			break
+		sample   = take_sample(args.stats_dir)
+		cur_time = time.time()
+		lines = render(sample, prev_sample, cur_time - prev_time)
+		lines.append("Press 'q' to quit")
+		screen.erase()
+		height, width = screen.getmaxyx()
+		for i, line in enumerate(lines[:height-1]):
+			screen.addstr(i, 0, line[:width-1])
+		screen.refresh()
+		prev_sample, prev_time = sample, cur_time
+		iteration += 1
+
+def main(argv):
+	parser = argparse.ArgumentParser(
+		description="Shows live performance statistics for running Bifrost pipelines")
+	parser.add_argument('-d', '--delay', type=float, default=1.,
+	                    help="Seconds between updates (default: 1)")
+	parser.add_argument('-n', '--iterations', type=int, default=None,
+	                    help="Exit after this many updates")
+	parser.add_argument('-b', '--batch', action='store_true',
+	                    help="Print updates instead of using the full screen")
+	parser.add_argument('--stats-dir', default=STATS_DIR,
+	                    help="Directory that pipelines publish stats to "
+	                         "(default: %s)" % STATS_DIR)
+	args = parser.parse_args(argv)
+	if args.batch or not sys.stdout.isatty():
+		run_batch(args)
+	else:
+		import curses
+		curses.wrapper(run_curses, args)
+
+if __name__ == '__main__':
+	try:
+		sys.exit(main(sys.argv[1:]))
+	except KeyboardInterrupt:
+		pass